@@ -0,0 +1,170 @@
+"""Admission control in front of Gemini: token buckets per user & global, plus a concurrency gate.
+
+Request yang kena limit nggak langsung ditolak: dia ngantri (FIFO) dan user
+dikasih tau nomor antriannya. Baru ditolak kalo antriannya udah kepanjangan
+atau user-nya spam sampe harus nunggu lebih dari ``max_wait`` detik.
+
+State limiter-nya per proses. Di mode scale-out (``BOT_WORKERS`` > 1) limit
+global, jumlah roast barengan & panjang antrian dibagi rata ke tiap worker,
+jadi totalnya tetep sesuai konfigurasi. Limit per user nggak dibagi: di
+private chat semua update user selalu ke worker yang sama, tapi di grup
+(routing per chat) satu user bisa kena limit terpisah di tiap worker.
+"""
+import asyncio
+import contextlib
+import os
+import time
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+USER_RATE_PER_MINUTE = float(os.getenv("RATE_LIMIT_USER_PER_MINUTE", "6"))  # Roast per menit per user (rata-rata)
+USER_BURST = int(os.getenv("RATE_LIMIT_USER_BURST", "3"))  # Roast beruntun yang boleh langsung lewat per user
+GLOBAL_RATE_PER_SECOND = float(os.getenv("RATE_LIMIT_GLOBAL_PER_SECOND", "10"))  # Roast per detik buat semua user
+GLOBAL_BURST = int(os.getenv("RATE_LIMIT_GLOBAL_BURST", "20"))  # Burst global
+MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", os.getenv("GEMINI_MAX_CONCURRENCY", "16")))  # Roast yang boleh jalan barengan
+MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "200"))  # Maksimal request yang boleh ngantri (nggak makan slot CONCURRENT_UPDATES)
+MAX_WAIT = float(os.getenv("ADMISSION_MAX_WAIT", "60"))  # Lebih lama dari ini nunggu token = ditolak (detik)
+WORKER_COUNT = max(1, int(os.getenv("BOT_WORKERS", "1")))  # Limit global dibagi ke sekian worker process
+PRUNE_THRESHOLD = 10_000  # Bucket user yang udah penuh lagi dibuang kalo jumlahnya lewat segini
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request can't be admitted (queue full or user way over their rate)."""
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations: taking a token may push it negative.
+
+    ``reserve`` always takes a token and returns how long the caller must wait
+    for it, so queued callers get served in arrival order without a timer.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now=None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, now=None):
+        """Takes one token and returns the wait (seconds) until it is actually available."""
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self):
+        """Gives back a token from a reservation that won't be used."""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def is_full(self, now=None):
+        """True when the bucket has refilled completely (safe to forget)."""
+        now = time.monotonic() if now is None else now
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class AdmissionController:
+    """Rate limits per user and globally, and caps how many requests run at once.
+
+    Use ``async with controller.admit(user_id, ...)`` around the Gemini work.
+    The global limits are split evenly across ``workers`` processes.
+    """
+
+    def __init__(self, user_rate_per_minute=USER_RATE_PER_MINUTE, user_burst=USER_BURST,
+                 global_rate_per_second=GLOBAL_RATE_PER_SECOND, global_burst=GLOBAL_BURST,
+                 max_inflight=MAX_INFLIGHT, max_queue=MAX_QUEUE, max_wait=MAX_WAIT, workers=WORKER_COUNT):
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = user_burst
+        self.max_inflight = max(1, max_inflight // workers)
+        self.max_queue = max(1, max_queue // workers)
+        self.max_wait = max_wait
+        self._global = TokenBucket(global_rate_per_second / workers, max(1, global_burst // workers))
+        self._users = {}  # user_id -> TokenBucket
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self.waiting = 0  # Request yang lagi ngantri (nunggu token atau slot)
+        self.inflight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    def stats(self):
+        """Returns limiter counters as a dictionary."""
+        return {
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "waiting": self.waiting,
+            "inflight": self.inflight,
+            "tracked_users": len(self._users),
+        }
+
+    def _user_bucket(self, user_id, now):
+        bucket = self._users.get(user_id)
+        if bucket is None:
+            if len(self._users) >= PRUNE_THRESHOLD:
+                self._prune(now)
+            bucket = self._users[user_id] = TokenBucket(self.user_rate, self.user_burst, now)
+        return bucket
+
+    def _prune(self, now):
+        for user_id in [u for u, b in self._users.items() if b.is_full(now)]:
+            del self._users[user_id]  # Bucket penuh = sama aja kayak user baru, nggak perlu disimpen
+
+    @contextlib.asynccontextmanager
+    async def admit(self, user_id, on_queued=None, on_admitted=None, waiting=None):
+        """Waits for the user's and the global token plus a free slot, then runs the block.
+
+        Only when the request has to queue: ``on_queued(position)`` is awaited
+        first with its 1-based position among waiting requests, the wait runs
+        inside ``waiting()`` (an async context manager factory, e.g.
+        ``update_processor.slot_released``), and ``on_admitted()`` is awaited
+        once it is the request's turn. Raises ``AdmissionRejected`` (before
+        waiting) when the queue is full or the user would have to wait longer
+        than ``max_wait``.
+        """
+        now = time.monotonic()
+        user_bucket = self._user_bucket(user_id, now)
+        user_wait = user_bucket.reserve(now)
+        if user_wait > self.max_wait or (self.waiting >= self.max_queue and (user_wait or self._slots.locked())):
+            user_bucket.refund()
+            self.rejected += 1
+            raise AdmissionRejected("Kebanyakan request, coba lagi nanti")
+        wait = max(user_wait, self._global.reserve(now))
+
+        if wait > 0 or self._slots.locked():
+            self.queued += 1
+            self.waiting += 1
+            acquired = False
+            try:
+                if on_queued:
+                    await on_queued(self.waiting)
+                async with (waiting() if waiting else contextlib.nullcontext()):
+                    await asyncio.sleep(wait - (time.monotonic() - now))
+                    await self._slots.acquire()
+                    acquired = True
+            except BaseException:
+                if acquired:
+                    self._slots.release()  # Dapet slot tapi di-cancel pas balik ke update processor
+                raise
+            finally:
+                self.waiting -= 1
+            if on_admitted:
+                try:
+                    await on_admitted()
+                except BaseException:
+                    self._slots.release()
+                    raise
+        else:
+            await self._slots.acquire()
+
+        self.admitted += 1
+        self.inflight += 1
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._slots.release()
@@ -0,0 +1,109 @@
+"""Groups album photos (and optionally rapid-fire texts) of one chat into a single roast.
+
+Telegram ngirim album sebagai update terpisah per foto dengan ``media_group_id``
+yang sama. Update pertama jadi "leader": nunggu sebentar (window di-reset tiap
+ada bagian baru) sambil ngumpulin update berikutnya, terus handler-nya jalan
+sekali buat semua bagian. Update lain ("follower") nggak jalanin handler, cuma
+nunggu leader-nya selesai biar job durable-nya ditandain selesai bareng.
+"""
+import asyncio
+import contextvars
+import os
+
+import metrics
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW", "1.0"))  # Jeda maksimal antar foto satu album (detik)
+TEXT_BURST_WINDOW = float(os.getenv("TEXT_BURST_WINDOW", "0"))  # Gabungin teks beruntun dalam jeda ini (detik), 0 = mati
+MAX_BATCH_PARTS = int(os.getenv("MAX_BATCH_PARTS", "10"))  # Album Telegram maksimal 10 item
+
+BATCHED_UPDATES = metrics.counter("batched_updates_total", "Update yang digabung ke roast update lain.", ("kind",))
+
+_current_parts = contextvars.ContextVar("current_parts", default=None)
+
+
+def current_parts(update):
+    """Returns every update the running handler should roast together (just ``update`` when not batched)."""
+    return _current_parts.get() or [update]
+
+
+class _Batch:
+    __slots__ = ("key", "window", "updates", "last_part_at", "closed", "completed", "done")
+
+    def __init__(self, key, window, update):
+        self.key = key
+        self.window = window
+        self.updates = [update]
+        self.last_part_at = asyncio.get_running_loop().time()
+        self.closed = False
+        self.completed = False  # Handler leader-nya selesai normal (bukan dibatalin pas shutdown)
+        self.done = asyncio.Event()
+
+
+class UpdateBatcher:
+    """Decides which updates belong together and collects them within a short window."""
+
+    def __init__(self, album_window=ALBUM_WINDOW, text_window=TEXT_BURST_WINDOW, max_parts=MAX_BATCH_PARTS):
+        self.album_window = album_window
+        self.text_window = text_window
+        self.max_parts = max_parts
+        self._open = {}  # key -> _Batch yang masih nerima bagian baru
+
+    def batch_key(self, update):
+        """Returns ``(kind, id)`` for batchable updates, ``None`` for everything else."""
+        message = getattr(update, "message", None)
+        if message is None:
+            return None
+        if message.photo and message.media_group_id and self.album_window > 0:
+            return ("album", message.media_group_id)
+        if self.text_window > 0 and message.text and not message.text.startswith("/"):
+            return ("text", message.chat_id)
+        return None
+
+    def join(self, update):
+        """Adds ``update`` to an open batch and returns that batch, or opens a new one.
+
+        Returns ``(batch, is_leader)``; ``batch`` is ``None`` when the update isn't batchable.
+        """
+        key = self.batch_key(update)
+        if key is None:
+            return None, False
+        batch = self._open.get(key)
+        if batch is not None and not batch.closed and len(batch.updates) < self.max_parts:
+            batch.updates.append(update)
+            batch.last_part_at = asyncio.get_running_loop().time()
+            BATCHED_UPDATES.inc(kind=key[0])
+            return batch, False
+        window = self.album_window if key[0] == "album" else self.text_window
+        batch = self._open[key] = _Batch(key, window, update)
+        return batch, True
+
+    async def collect(self, batch):
+        """Waits until no new part arrived for ``window`` seconds (or the batch is full), then closes it."""
+        loop = asyncio.get_running_loop()
+        while len(batch.updates) < self.max_parts:
+            remaining = batch.last_part_at + batch.window - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        self._close(batch)
+        return batch.updates
+
+    def _close(self, batch):
+        batch.closed = True
+        if self._open.get(batch.key) is batch:
+            del self._open[batch.key]
+
+    def finish(self, batch):
+        """Marks the batch handled so its followers can complete."""
+        self._close(batch)
+        batch.done.set()
+
+    @staticmethod
+    def running(updates):
+        """Context token for ``current_parts`` while the leader's handler runs (reset with ``reset``)."""
+        return _current_parts.set(updates)
+
+    @staticmethod
+    def reset(token):
+        _current_parts.reset(token)
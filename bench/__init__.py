@@ -0,0 +1,14 @@
+"""Offline load-test harness: fake Telegram Bot API, fake Gemini backend and a load generator.
+
+Jalanin dari root repo, nggak butuh internet, nggak makan kuota Gemini:
+
+    python -m bench.loadgen --rate 50 --duration 30 --photo-ratio 0.2
+
+``loadgen`` nyalain server Telegram palsu, nyalain bot-nya (``bench.run_bot``)
+di proses terpisah dengan Gemini palsu, nembak webhook-nya dengan update
+sintetis, terus ngasih laporan throughput, latency end-to-end, lag event loop
+dan kontensi SQLite. Lihat ``python -m bench.loadgen --help`` buat semua opsi.
+
+``python -m bench.ingress`` bandingin requests/sec tiap ingress webhook
+(aiohttp, ASGI, server bawaan PTB) dengan bot-nya di-stub.
+"""
@@ -0,0 +1,117 @@
+"""Fake Gemini backend: a drop-in ``GenerativeModel`` with configurable latency, errors and 429 bursts.
+
+Semua setting dibaca dari environment variable ``BENCH_GEMINI_*`` biar worker
+process di mode scale-out dapet setting yang sama. Burst 429 dihitung dari
+``BENCH_GEMINI_EPOCH`` (jam dinding), jadi semua proses kena burst barengan
+kayak quota Gemini beneran.
+"""
+import asyncio
+import os
+import random
+import time
+
+from google.api_core import exceptions as google_exceptions
+
+ROAST_MARKER = "[bench]"  # Penanda roast dari Gemini palsu (dipake loadgen buat ngebedain dari roast cadangan)
+
+
+class Settings:
+    """Fake backend behaviour; defaults come from ``BENCH_GEMINI_*`` environment variables."""
+
+    def __init__(self, latency=None, jitter=None, image_factor=None, error_rate=None,
+                 burst_every=None, burst_length=None, epoch=None, chunks=None):
+        env = os.environ
+        self.latency = float(env.get("BENCH_GEMINI_LATENCY", "0.8")) if latency is None else latency  # Rata-rata latency (detik)
+        self.jitter = float(env.get("BENCH_GEMINI_JITTER", "0.3")) if jitter is None else jitter  # +- sekian (proporsi latency)
+        self.image_factor = float(env.get("BENCH_GEMINI_IMAGE_FACTOR", "2")) if image_factor is None else image_factor  # Vision call lebih lama
+        self.error_rate = float(env.get("BENCH_GEMINI_ERROR_RATE", "0")) if error_rate is None else error_rate  # Peluang error 500
+        self.burst_every = float(env.get("BENCH_GEMINI_BURST_EVERY", "0")) if burst_every is None else burst_every  # 0 = nggak ada burst 429
+        self.burst_length = float(env.get("BENCH_GEMINI_BURST_LENGTH", "0")) if burst_length is None else burst_length
+        self.epoch = float(env.get("BENCH_GEMINI_EPOCH", "0")) if epoch is None else epoch
+        self.chunks = int(env.get("BENCH_GEMINI_CHUNKS", "5")) if chunks is None else chunks  # Jumlah chunk pas streaming
+
+    def in_burst(self, now=None):
+        """True while the simulated quota is exhausted (every call gets a 429)."""
+        if self.burst_every <= 0 or self.burst_length <= 0:
+            return False
+        now = time.time() if now is None else now
+        return (now - self.epoch) % self.burst_every < self.burst_length
+
+
+class _Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class _TokenCount:
+    def __init__(self, total_tokens):
+        self.total_tokens = total_tokens
+
+
+class _Stream:
+    def __init__(self, parts, delay):
+        self._parts = parts
+        self._delay = delay
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for part in self._parts:
+            await asyncio.sleep(self._delay)
+            yield _Response(part)
+
+
+class FakeGenerativeModel:
+    """Stands in for ``genai.GenerativeModel``; every instance shares the process-wide ``SETTINGS``."""
+
+    calls = 0
+
+    def __init__(self, model_name="gemini-2.0-flash", settings=None, **kwargs):
+        self.model_name = model_name
+        self.settings = settings or SETTINGS
+
+    def _plan(self, contents):
+        """Returns the latency for this call, or raises the simulated error."""
+        FakeGenerativeModel.calls += 1
+        settings = self.settings
+        if settings.in_burst():
+            raise google_exceptions.TooManyRequests("429 Resource has been exhausted (bench burst)")
+        if settings.error_rate and random.random() < settings.error_rate:
+            raise google_exceptions.InternalServerError("500 bench error")
+        is_image = isinstance(contents, list) and any(isinstance(part, dict) for part in contents)
+        latency = settings.latency * (settings.image_factor if is_image else 1)
+        return max(0.0, latency * (1 + random.uniform(-settings.jitter, settings.jitter)))
+
+    def _text(self):
+        return f"{ROAST_MARKER} Copywriting lo kayak brosur kredit motor: rame, tapi nggak ada yang baca. " * 4
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        latency = self._plan(contents)
+        if stream:
+            chunks = max(1, self.settings.chunks)
+            text = self._text()
+            size = -(-len(text) // chunks)
+            return _Stream([text[i:i + size] for i in range(0, len(text), size)], latency / chunks)
+        await asyncio.sleep(latency)
+        return _Response(self._text())
+
+    def generate_content(self, contents, **kwargs):
+        time.sleep(self._plan(contents))
+        return _Response(self._text())
+
+    async def count_tokens_async(self, contents, **kwargs):
+        return _TokenCount(len(str(contents)) // 4)
+
+    def count_tokens(self, contents, **kwargs):
+        return _TokenCount(len(str(contents)) // 4)
+
+
+SETTINGS = Settings()
+
+
+def install():
+    """Replaces ``genai.GenerativeModel`` so every model the bot creates is fake (call before importing ``main``)."""
+    import google.generativeai as genai
+
+    genai.GenerativeModel = FakeGenerativeModel
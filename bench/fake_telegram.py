@@ -0,0 +1,126 @@
+"""Local stand-in for the Telegram Bot API that records every call.
+
+Cukup buat alur roast: ``sendMessage``/``editMessageText`` bales objek
+``Message`` yang valid, ``getFile`` + download file ngasih JPEG sintetis, sisanya
+(``sendChatAction``, ``deleteMessage``, ``setWebhook``, dst.) cuma bales ``true``.
+"""
+import asyncio
+import io
+import itertools
+import json
+import time
+
+from aiohttp import web
+from PIL import Image, ImageDraw
+
+
+def _synthetic_photo(width=1280, height=960):
+    img = Image.new("RGB", (width, height), (240, 200, 40))
+    draw = ImageDraw.Draw(img)
+    for y in range(0, height, 40):
+        draw.rectangle((40, y + 5, width - 40, y + 25), fill=(30, 30, 30) if y % 80 else (200, 30, 30))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+class FakeTelegramServer:
+    """aiohttp server answering ``/bot<token>/<method>`` and ``/file/bot<token>/<path>``.
+
+    Every call is appended to ``calls`` as ``(time, method, params)``;
+    ``on_call(method, params)`` (if set) is invoked for each one.
+    ``latency`` adds a fixed delay per call to mimic the round trip.
+    """
+
+    def __init__(self, latency=0.0, on_call=None):
+        self.latency = latency
+        self.on_call = on_call
+        self.calls = []
+        self.photo = _synthetic_photo()
+        self._message_ids = itertools.count(1000)
+        self._runner = None
+        self.port = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @property
+    def file_url(self):
+        return f"http://127.0.0.1:{self.port}/file/bot"
+
+    async def start(self, port=0):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/bot{token}/{method}", self._handle_method)
+        app.router.add_get("/file/bot{token}/{path:.*}", self._handle_file)
+        self._runner = web.AppRunner(app, handle_signals=False, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def count(self, method=None):
+        return sum(1 for _, m, _ in self.calls if method is None or m == method)
+
+    async def _handle_method(self, request):
+        method = request.match_info["method"]
+        params = dict(await request.post()) if request.body_exists else {}
+        self.calls.append((time.monotonic(), method, params))
+        if self.on_call:
+            self.on_call(method, params)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method in ("sendMessage", "editMessageText"):
+            message_id = next(self._message_ids) if method == "sendMessage" else int(params.get("message_id", 0))
+            chat_id = int(params.get("chat_id", 0))
+            return {"message_id": message_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"},
+                    "text": params.get("text", "")}
+        if method == "getFile":
+            file_id = params.get("file_id", "")
+            return {"file_id": file_id, "file_unique_id": file_id, "file_size": len(self.photo),
+                    "file_path": f"photos/{file_id}.jpg"}
+        return True
+
+    async def _handle_file(self, request):
+        self.calls.append((time.monotonic(), "downloadFile", {"path": request.match_info["path"]}))
+        return web.Response(body=self.photo, content_type="image/jpeg")
+
+
+def text_update(update_id, chat_id, text):
+    """Builds a private-chat text update payload."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "text": text,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench", "username": f"bench{chat_id}"},
+        },
+    }
+
+
+def photo_update(update_id, chat_id, file_id):
+    """Builds a private-chat photo update payload (four sizes, like Telegram sends)."""
+    sizes = [(90, 68), (320, 240), (800, 600), (1280, 960)]
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()),
+            "photo": [{"file_id": f"{file_id}-{w}", "file_unique_id": f"{file_id}-{w}", "width": w, "height": h,
+                       "file_size": w * h // 8} for w, h in sizes],
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench", "username": f"bench{chat_id}"},
+        },
+    }
+
+
+def dumps(payload):
+    return json.dumps(payload, separators=(",", ":"))
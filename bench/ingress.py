@@ -0,0 +1,200 @@
+"""Ingress micro-benchmark: requests/sec of each webhook ingress with the bot itself stubbed out.
+
+Yang diukur cuma jalur webhook (terima request, cek secret, decode JSON,
+dedupe, masuk antrian), bukan roast-nya. Antriannya ``asyncio.Queue`` biasa
+yang langsung dikosongin, jadi SQLite & handler nggak ikut keitung:
+
+    python -m bench.ingress --requests 5000 --concurrency 64
+
+Client & server jalan di satu event loop (saingan CPU yang sama buat semua
+ingress), jadi angkanya buat dibandingin satu sama lain, bukan kapasitas
+absolut. ``asgi`` butuh ``uvicorn``, ``ptb`` butuh ``python-telegram-bot[webhooks]``;
+yang nggak ke-install dilewatin.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import time
+
+import aiohttp
+from aiohttp import web
+
+import ingress
+from bench.fake_telegram import FakeTelegramServer, dumps, text_update
+from bench.loadgen import BOT_TOKEN, percentile
+
+KINDS = ("aiohttp", "asgi", "ptb")
+SECRET = "bench-secret"
+
+
+class StubApplication:
+    """Just enough of ``telegram.ext.Application`` for ``ingress``: a queue that is drained right away."""
+
+    def __init__(self):
+        self.bot = None
+        self.bot_data = {}
+        self.update_queue = asyncio.Queue()
+        self.running = False
+        self.post_init = self.post_stop = self.post_shutdown = None
+        self.received = 0
+        self._consumer = None
+
+    async def initialize(self):
+        pass
+
+    async def start(self):
+        self.running = True
+        self._consumer = asyncio.create_task(self._consume())
+
+    async def _consume(self):
+        while True:
+            await self.update_queue.get()
+            self.received += 1
+
+    async def stop(self):
+        self.running = False
+        self._consumer.cancel()
+
+    async def shutdown(self):
+        pass
+
+
+@contextlib.asynccontextmanager
+async def _serve_aiohttp(application, port):
+    await application.start()
+    webhook = ingress.UpdateIngress(
+        ingress.application_deliver(application), ingress.application_health(application), name="aiohttp", secret_token=SECRET
+    )
+    app = web.Application(client_max_size=webhook.max_body)
+    ingress.add_aiohttp_routes(app, webhook, f"/{BOT_TOKEN}")
+    runner = web.AppRunner(app, handle_signals=False, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    try:
+        yield
+    finally:
+        await runner.cleanup()
+        await application.stop()
+
+
+@contextlib.asynccontextmanager
+async def _serve_asgi(application, port):
+    import uvicorn
+
+    app = ingress.ASGIApp(lambda: application, f"/{BOT_TOKEN}", secret_token=SECRET)
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="on", log_level="warning",
+                                           access_log=False))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    try:
+        yield
+    finally:
+        server.should_exit = True
+        await task
+
+
+@contextlib.asynccontextmanager
+async def _serve_ptb(application, port):
+    import telegram
+    from telegram.ext import Updater
+
+    telegram_server = FakeTelegramServer()  # Buat getMe & setWebhook dari PTB
+    await telegram_server.start()
+    bot = telegram.Bot(BOT_TOKEN, base_url=telegram_server.base_url)
+    updater = Updater(bot, application.update_queue)
+    await application.start()
+    async with updater:
+        await updater.start_webhook(
+            listen="127.0.0.1", port=port, url_path=BOT_TOKEN, secret_token=SECRET,
+            webhook_url=f"http://127.0.0.1:{port}/{BOT_TOKEN}",
+        )
+        try:
+            yield
+        finally:
+            await updater.stop()
+            await application.stop()
+            await telegram_server.stop()
+
+
+SERVERS = {"aiohttp": _serve_aiohttp, "asgi": _serve_asgi, "ptb": _serve_ptb}
+
+
+async def run_ingress_benchmark(kind, requests, concurrency, port, batch=1):
+    """Fires ``requests`` webhook POSTs (``batch`` updates each) from ``concurrency`` clients; returns stats."""
+    application = StubApplication()
+    url = f"http://127.0.0.1:{port}/{BOT_TOKEN}"
+    headers = {"Content-Type": "application/json", ingress.SECRET_HEADER: SECRET}
+    bodies = []
+    for index in range(requests):
+        updates = [text_update(index * batch + i, 10_000 + index % 1000, "Beli sekarang!") for i in range(batch)]
+        bodies.append(dumps(updates[0]) if batch == 1 else json.dumps(updates))
+    latencies, statuses = [], {}
+    cursor = iter(bodies)
+
+    async def client(session):
+        for body in cursor:
+            start = time.perf_counter()
+            async with session.post(url, data=body, headers=headers) as response:
+                await response.read()
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+    async with SERVERS[kind](application, port):
+        async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency)) as session:
+            start = time.perf_counter()
+            await asyncio.gather(*(client(session) for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+        for _ in range(100):  # Biar consumer sempet ngosongin antrian
+            if application.received >= requests * batch:
+                break
+            await asyncio.sleep(0.01)
+    return {
+        "ingress": kind,
+        "requests": requests,
+        "rps": requests / elapsed,
+        "updates_per_s": requests * batch / elapsed,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+        "statuses": statuses,
+        "queued": application.received,
+    }
+
+
+def format_result(result):
+    return (f"  {result['ingress']:<8} {result['rps']:>8.0f} req/s  {result['updates_per_s']:>8.0f} update/s  "
+            f"p50={result['p50'] * 1000:.2f}ms  p99={result['p99'] * 1000:.2f}ms  status={result['statuses']}  "
+            f"masuk antrian={result['queued']}")
+
+
+async def run_all(args):
+    print(f"{args.requests} request x {args.batch} update, {args.concurrency} client barengan:")
+    for index, kind in enumerate(args.ingress):
+        try:
+            result = await run_ingress_benchmark(kind, args.requests, args.concurrency, args.port + index, args.batch)
+        except ImportError as e:
+            print(f"  {kind:<8} dilewati ({e.name} belum ke-install)")
+            continue
+        except RuntimeError as e:  # PTB tanpa extra [webhooks]
+            print(f"  {kind:<8} dilewati ({e})")
+            continue
+        print(format_result(result))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bandingin requests/sec tiap ingress webhook (bot-nya di-stub).")
+    parser.add_argument("--requests", type=int, default=5000, help="Jumlah request per ingress")
+    parser.add_argument("--concurrency", type=int, default=64, help="Client yang ngirim barengan")
+    parser.add_argument("--batch", type=int, default=1, help="Update per request (>1 = body array)")
+    parser.add_argument("--port", type=int, default=18600, help="Port pertama (tiap ingress pake port berikutnya)")
+    parser.add_argument("--ingress", nargs="+", choices=KINDS, default=list(KINDS))
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    asyncio.run(run_all(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,404 @@
+"""Load generator: drives the bot with synthetic updates and reports throughput and latency.
+
+Update dikirim open-loop (jadwalnya tetep, nggak nunggu balesan sebelumnya)
+biar antrian di bot beneran keukur. Satu update dianggap selesai pas server
+Telegram palsu nerima pesan "final" buat chat-nya (roast, roast cadangan, atau
+pesan ditolak), bukan placeholder/info antrian/info retry.
+"""
+import argparse
+import asyncio
+import collections
+import contextlib
+import json
+import math
+import os
+import random
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+from bench import fake_gemini
+from bench.fake_telegram import FakeTelegramServer, dumps, photo_update, text_update
+
+BOT_TOKEN = "123456:bench"
+INTERIM_PREFIXES = (  # Pesan sementara dari main.py (placeholder, info antrian, info retry)
+    "Copywriting lo udah gue terima",
+    "Gambar copywriting lo udah gue terima",
+    "Lagi rame nih!",
+)
+INTERIM_MARKER = "ngambek dikit"  # Info retry ("... kayaknya lagi ngambek dikit...")
+REJECTED_PREFIX = "Santai dulu bro"
+SAMPLE_COPY = (
+    "Diskon gede-gedean! Beli 1 gratis 1, cuma hari ini, buruan sebelum kehabisan!!!",
+    "Kopi susu gula aren yang bikin hari senin lo jadi kayak hari jumat.",
+    "Solusi keuangan keluarga Indonesia, cicilan ringan tanpa ribet, proses 5 menit.",
+    "Sepatu lari paling empuk se-Jabodetabek. Lari pagi jadi kayak jalan di awan.",
+)
+
+_SAMPLE_RE = re.compile(r'^([a-zA-Z_:][\w:]*)(?:\{(.*)\})? (\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+# --- Statistik ---
+
+def percentile(values, q):
+    """Nearest-rank percentile of raw samples (``q`` in 0..100); None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def parse_exposition(text):
+    """Parses Prometheus text into ``[(name, labels dict, value)]``."""
+    samples = []
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            samples.append((name, dict(_LABEL_RE.findall(labels or "")), float(value)))
+    return samples
+
+
+def histogram_summary(samples, name, group_by=()):
+    """Aggregates a histogram over processes: ``{group: {"count", "mean", "p50", "p95", "p99"}}``.
+
+    Quantiles are interpolated linearly inside the bucket, like
+    Prometheus' ``histogram_quantile``.
+    """
+    buckets = collections.defaultdict(lambda: collections.defaultdict(float))
+    sums = collections.defaultdict(float)
+    counts = collections.defaultdict(float)
+    for sample_name, labels, value in samples:
+        group = tuple(labels.get(label, "") for label in group_by)
+        if sample_name == f"{name}_bucket":
+            buckets[group][float(labels["le"].replace("+Inf", "inf"))] += value
+        elif sample_name == f"{name}_sum":
+            sums[group] += value
+        elif sample_name == f"{name}_count":
+            counts[group] += value
+
+    summary = {}
+    for group, by_bound in buckets.items():
+        count = counts[group]
+        if not count:
+            continue
+        bounds = sorted(by_bound)
+        entry = {"count": int(count), "mean": sums[group] / count}
+        for q in (50, 95, 99):
+            rank = q / 100 * count
+            lower, previous = 0.0, 0.0
+            for bound in bounds:
+                cumulative = by_bound[bound]
+                if cumulative >= rank:
+                    if bound == float("inf"):
+                        entry[f"p{q}"] = lower  # Di atas bucket terakhir: cuma tau batas bawahnya
+                    else:
+                        entry[f"p{q}"] = lower + (bound - lower) * (rank - previous) / max(cumulative - previous, 1e-12)
+                    break
+                lower, previous = bound, cumulative
+        summary[group] = entry
+    return summary
+
+
+def counter_totals(samples, name, group_by=()):
+    totals = collections.defaultdict(float)
+    for sample_name, labels, value in samples:
+        if sample_name == name:
+            totals[tuple(labels.get(label, "") for label in group_by)] += value
+    return dict(totals)
+
+
+# --- Load Generator ---
+
+class LoadGenerator:
+    """Sends updates at a fixed rate and matches them with the bot's final replies."""
+
+    def __init__(self, webhook_url, rate, duration, photo_ratio=0.0, users=0, duplicate_ratio=0.0, seed=1):
+        self.webhook_url = webhook_url
+        self.rate = rate
+        self.duration = duration
+        self.photo_ratio = photo_ratio
+        self.users = users
+        self.duplicate_ratio = duplicate_ratio
+        self.random = random.Random(seed)
+        self.pending = collections.defaultdict(collections.deque)  # chat_id -> deque[(update_id, jenis, waktu kirim)]
+        self.results = []  # (jenis, hasil, latency end-to-end)
+        self.ack_latencies = []
+        self.http_errors = collections.Counter()
+        self.sent = 0
+        self.loop_lag = []
+        self._all_done = asyncio.Event()
+
+    # Dipanggil server Telegram palsu buat tiap panggilan Bot API
+    def on_call(self, method, params):
+        if method not in ("sendMessage", "editMessageText"):
+            return
+        text = params.get("text", "")
+        if text.startswith(INTERIM_PREFIXES) or INTERIM_MARKER in text:
+            return
+        queue = self.pending.get(int(params.get("chat_id", 0)))
+        if not queue:
+            return  # Lanjutan pesan panjang atau balesan yang telat, udah kehitung
+        update_id, kind, sent_at = queue.popleft()
+        if fake_gemini.ROAST_MARKER in text:
+            outcome = "ok"
+        elif text.startswith(REJECTED_PREFIX):
+            outcome = "rejected"
+        else:
+            outcome = "fallback"
+        self.results.append((kind, outcome, time.monotonic() - sent_at))
+        if self.sent_all and not any(self.pending.values()):
+            self._all_done.set()
+
+    @property
+    def sent_all(self):
+        return self.sent >= self.total
+
+    @property
+    def total(self):
+        return int(self.rate * self.duration)
+
+    def _make_update(self, index):
+        update_id = 1_000_000 + index
+        chat_id = 10_000 + (self.random.randrange(self.users) if self.users else index)
+        duplicate = self.random.random() < self.duplicate_ratio
+        if self.random.random() < self.photo_ratio:
+            return "photo", chat_id, photo_update(update_id, chat_id, "bench-dup" if duplicate else f"bench-{index}")
+        text = self.random.choice(SAMPLE_COPY)
+        return "text", chat_id, text_update(update_id, chat_id, text if duplicate else f"{text} (#{index})")
+
+    async def _post(self, session, kind, chat_id, payload):
+        entry = (payload["update_id"], kind, time.monotonic())
+        self.pending[chat_id].append(entry)
+        start = time.monotonic()
+        error = None
+        try:
+            async with session.post(self.webhook_url, data=dumps(payload), headers={"Content-Type": "application/json"}) as response:
+                await response.read()
+                if response.status != 200:
+                    error = response.status
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = type(e).__name__
+        self.ack_latencies.append(time.monotonic() - start)
+        if error is not None:
+            self.http_errors[error] += 1
+            with contextlib.suppress(ValueError):
+                self.pending[chat_id].remove(entry)  # Nggak diterima bot (Telegram bakal kirim ulang), jangan ditungguin
+
+    async def _monitor_loop(self, interval=0.1):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(max(0.0, loop.time() - start - interval))
+
+    async def run(self, drain_timeout):
+        monitor = asyncio.create_task(self._monitor_loop())
+        connector = aiohttp.TCPConnector(limit=512)
+        async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30)) as session:
+            posts = []
+            start = time.monotonic()
+            for index in range(self.total):
+                delay = start + index / self.rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                kind, chat_id, payload = self._make_update(index)
+                posts.append(asyncio.create_task(self._post(session, kind, chat_id, payload)))
+                self.sent += 1
+            await asyncio.gather(*posts)
+            send_elapsed = time.monotonic() - start
+            if any(self.pending.values()):
+                try:
+                    await asyncio.wait_for(self._all_done.wait(), drain_timeout)
+                except asyncio.TimeoutError:
+                    pass
+            elapsed = time.monotonic() - start
+        monitor.cancel()
+        return send_elapsed, elapsed
+
+
+# --- Bot Process ---
+
+def _bot_environment(args, telegram, port, workdir):
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_BOT_TOKEN": BOT_TOKEN,
+        "GEMINI_API_KEY": "bench",
+        "PORT": str(port),
+        "BOT_WORKERS": str(args.workers),
+        "TELEGRAM_API_BASE_URL": telegram.base_url,
+        "TELEGRAM_API_FILE_URL": telegram.file_url,
+        "DATABASE_FILE": os.path.join(workdir, "users.db"),
+        "JOB_QUEUE_DB": os.path.join(workdir, "jobs.db"),
+        "BENCH_GEMINI_LATENCY": str(args.gemini_latency),
+        "BENCH_GEMINI_JITTER": str(args.gemini_jitter),
+        "BENCH_GEMINI_ERROR_RATE": str(args.gemini_error_rate),
+        "BENCH_GEMINI_BURST_EVERY": str(args.burst_every),
+        "BENCH_GEMINI_BURST_LENGTH": str(args.burst_length),
+        "BENCH_GEMINI_EPOCH": str(time.time()),
+    })
+    env.setdefault("LOG_LEVEL", "WARNING")
+    if args.workers > 1:
+        env["ROAST_CACHE_DB"] = os.path.join(workdir, "roast_cache.db")
+    return env
+
+
+async def _wait_until_ready(url, process, workers, timeout=60.0):
+    """Waits until ``/metrics`` shows every worker's update queue (i.e. post_init has run everywhere)."""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Bot mati pas start (exit code {process.returncode})")
+            try:
+                async with session.get(url) as response:
+                    samples = parse_exposition(await response.text())
+                ready = sum(1 for name, _, _ in samples if name == "update_queue_depth")
+                if ready >= workers:
+                    return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("Bot nggak siap-siap juga")
+
+
+async def _scrape(url):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            return await response.text()
+
+
+# --- Laporan ---
+
+def build_report(args, generator, telegram, samples, send_elapsed, elapsed):
+    by_outcome = collections.Counter(outcome for _, outcome, _ in generator.results)
+    e2e = [latency for _, _, latency in generator.results]
+    completed = len(generator.results)
+
+    def quantiles(values):
+        return {f"p{q}": percentile(values, q) for q in (50, 95, 99)} | {"max": max(values) if values else None}
+
+    return {
+        "config": {k: v for k, v in vars(args).items() if k != "json"},
+        "sent": generator.sent,
+        "completed": completed,
+        "unfinished": generator.sent - completed - sum(generator.http_errors.values()),
+        "outcomes": dict(by_outcome),
+        "http_errors": dict(generator.http_errors),
+        "offered_rate": generator.sent / send_elapsed if send_elapsed else None,
+        "throughput": completed / elapsed if elapsed else None,
+        "e2e_latency": quantiles(e2e),
+        "e2e_latency_by_kind": {kind: quantiles([l for k, _, l in generator.results if k == kind])
+                                for kind in sorted({k for k, _, _ in generator.results})},
+        "webhook_ack_latency": quantiles(generator.ack_latencies),
+        "bot_event_loop_lag": histogram_summary(samples, "event_loop_lag_seconds").get((), {}),
+        "loadgen_event_loop_lag": quantiles(generator.loop_lag),
+        "sqlite": {f"{db}.{op}": stats for (db, op), stats in
+                   sorted(histogram_summary(samples, "sqlite_op_seconds", ("db", "op")).items())},
+        "gemini": {f"{path}.{mode}": stats for (path, mode), stats in
+                   sorted(histogram_summary(samples, "gemini_request_seconds", ("path", "mode")).items())},
+        "gemini_retries": sum(counter_totals(samples, "gemini_retries_total").values()),
+        "telegram_calls": dict(collections.Counter(method for _, method, _ in telegram.calls)),
+        "telegram_calls_per_update": len(telegram.calls) / completed if completed else None,
+    }
+
+
+def format_report(report):
+    def ms(value):
+        return "-" if value is None else f"{value * 1000:.1f}ms"
+
+    def line(title, stats):
+        keys = [k for k in ("count", "mean", "p50", "p95", "p99", "max") if k in stats]
+        return f"  {title:<28}" + "  ".join(f"{k}={stats[k] if k == 'count' else ms(stats[k])}" for k in keys)
+
+    lines = [
+        f"Update dikirim: {report['sent']}  selesai: {report['completed']}  belum selesai: {report['unfinished']}",
+        f"Hasil: {report['outcomes']}  HTTP error: {report['http_errors'] or '-'}",
+        f"Rate dikirim: {report['offered_rate']:.1f}/s  throughput: {report['throughput']:.1f}/s",
+        "Latency:",
+        line("end-to-end", report["e2e_latency"]),
+        *(line(f"end-to-end ({kind})", stats) for kind, stats in report["e2e_latency_by_kind"].items()),
+        line("webhook ack", report["webhook_ack_latency"]),
+        "Event loop lag:",
+        line("bot", report["bot_event_loop_lag"]),
+        line("loadgen", report["loadgen_event_loop_lag"]),
+        "SQLite (antri executor + query):",
+        *(line(name, stats) for name, stats in report["sqlite"].items()),
+        "Gemini palsu:",
+        *(line(name, stats) for name, stats in report["gemini"].items()),
+        f"  retry: {report['gemini_retries']:.0f}",
+        f"Panggilan Bot API: {report['telegram_calls']}",
+    ]
+    if report["telegram_calls_per_update"] is not None:
+        lines.append(f"  per update: {report['telegram_calls_per_update']:.2f}")
+    return "\n".join(lines)
+
+
+async def run_benchmark(args):
+    telegram = FakeTelegramServer(latency=args.telegram_latency)
+    await telegram.start()
+    port = args.port
+    webhook_url = f"http://127.0.0.1:{port}/{BOT_TOKEN}"
+    metrics_url = f"http://127.0.0.1:{port}/metrics"
+
+    with tempfile.TemporaryDirectory(prefix="roast-bench-") as workdir:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "bench.run_bot"],
+            env=_bot_environment(args, telegram, port, workdir),
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+        try:
+            await _wait_until_ready(metrics_url, process, args.workers)
+            generator = LoadGenerator(webhook_url, args.rate, args.duration, args.photo_ratio, args.users,
+                                      args.duplicate_ratio, args.seed)
+            telegram.on_call = generator.on_call
+            send_elapsed, elapsed = await generator.run(args.drain_timeout)
+            samples = parse_exposition(await _scrape(metrics_url))
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.to_thread(process.wait, 30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            await telegram.stop()
+    return build_report(args, generator, telegram, samples, send_elapsed, elapsed)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline load test buat bot roast (Telegram & Gemini palsu).")
+    parser.add_argument("--rate", type=float, default=20, help="Update per detik yang dikirim")
+    parser.add_argument("--duration", type=float, default=15, help="Lama ngirim update (detik)")
+    parser.add_argument("--photo-ratio", type=float, default=0.2, help="Proporsi update foto (0-1)")
+    parser.add_argument("--users", type=int, default=0, help="Jumlah chat/user berbeda (0 = tiap update chat baru)")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0, help="Proporsi copywriting/foto yang diulang (buat cache)")
+    parser.add_argument("--workers", type=int, default=1, help="BOT_WORKERS buat bot-nya")
+    parser.add_argument("--port", type=int, default=18443, help="Port webhook bot")
+    parser.add_argument("--gemini-latency", type=float, default=0.8, help="Rata-rata latency Gemini palsu (detik)")
+    parser.add_argument("--gemini-jitter", type=float, default=0.3, help="Variasi latency (proporsi)")
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0, help="Peluang error 500 per panggilan")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="Tiap N detik Gemini palsu ngasih 429 (0 = mati)")
+    parser.add_argument("--burst-length", type=float, default=0.0, help="Lama burst 429 (detik)")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="Delay tiap panggilan Bot API palsu (detik)")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="Nunggu sisa update selesai maksimal segini (detik)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Simpen laporan lengkap ke file JSON ini")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Runs the real bot (``main.py``) against the fake Gemini backend; started by ``bench.loadgen``.
+
+Telegram-nya diarahin ke server palsu lewat ``TELEGRAM_API_BASE_URL`` /
+``TELEGRAM_API_FILE_URL``, jadi yang diganti cuma Gemini.
+"""
+import os
+
+from bench import fake_gemini
+
+fake_gemini.install()  # Harus sebelum import main: model Gemini dibikin pas import
+
+import main  # noqa: E402
+import scaling  # noqa: E402
+
+
+def build_application():
+    """Module-level (picklable) builder so scale-out workers also get the fake Gemini installed."""
+    return main.build_application()
+
+
+def run():
+    port = int(os.environ["PORT"])
+    url_path = main.TELEGRAM_BOT_TOKEN
+    webhook_url = f"http://127.0.0.1:{port}/{url_path}"
+    num_workers = int(os.getenv("BOT_WORKERS", "1"))
+    if num_workers > 1:
+        scaling.run_scaled(build_application, num_workers, "127.0.0.1", port, url_path, webhook_url)
+    else:
+        scaling.run_single(build_application, "127.0.0.1", port, url_path, webhook_url)
+
+
+if __name__ == "__main__":
+    run()
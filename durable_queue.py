@@ -0,0 +1,174 @@
+"""Durable update queue: every webhook update is written to SQLite before it is acknowledged.
+
+Webhook cuma bales 200 ke Telegram setelah update-nya aman di SQLite (lokal,
+nggak butuh service luar). Update yang sama (redelivery dari Telegram) cuma
+diproses sekali, dan update yang belum selesai pas proses mati diproses
+ulang otomatis pas start lagi.
+"""
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import time
+
+import telegram
+
+import metrics
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", "data/jobs.db")  # Lokasi file antrian (per worker di mode scale-out)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))  # Update yang bikin proses mati N kali dibuang
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(24 * 3600)))  # Update_id yang udah selesai diinget segini lama (detik) buat dedupe
+PRUNE_EVERY = 1000  # Bersihin job lama tiap N job selesai
+
+logger = logging.getLogger(__name__)
+
+
+def default_db_file():
+    """Job queue file for this process: one file per worker in scale-out mode."""
+    index = os.getenv("BOT_WORKER_INDEX")
+    if index is None:
+        return JOB_QUEUE_DB
+    root, ext = os.path.splitext(JOB_QUEUE_DB)
+    return f"{root}-{index}{ext}"
+
+
+class DurableUpdateQueue(asyncio.Queue):
+    """``asyncio.Queue`` for ``Application.update_queue`` whose ``put`` persists updates first.
+
+    ``put`` returns (so the webhook answers 200) only after the update is in
+    SQLite, and silently drops ``update_id``s it has seen before. The update
+    processor calls ``mark_done`` once an update has been handled; ``start``
+    re-queues updates that were never marked done.
+    """
+
+    def __init__(self, db_file=None, max_attempts=JOB_MAX_ATTEMPTS, retention=JOB_RETENTION):
+        super().__init__()
+        self.db_file = db_file or default_db_file()
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.duplicates = 0
+        self.resumed = 0
+        self._conn = None
+        self._done_since_prune = 0
+        # Satu thread aja: semua akses ke koneksi otomatis berurutan (urutan put juga kejaga)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-queue")
+
+    # --- Lifecycle ---
+
+    async def start(self, bot):
+        """Opens the queue file and re-queues updates left over from the previous run."""
+        rows = await self._run(self._open)
+        for payload in rows:
+            super().put_nowait(telegram.Update.de_json(json.loads(payload), bot))
+        self.resumed = len(rows)
+        if rows:
+            logger.info("%d update yang belum selesai dari proses sebelumnya diproses ulang.", len(rows))
+
+    async def close(self):
+        """Closes the queue file (unfinished updates stay pending for the next start)."""
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        with metrics.SQLITE_LATENCY.time(db="jobs", op=func.__name__.strip("_")):
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    def _open(self):
+        if os.path.dirname(self.db_file):
+            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        self._conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    update_id INTEGER PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    received_at REAL NOT NULL,
+                    done_at REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_done_at ON jobs (done_at)")
+            # Tiap restart dihitung satu percobaan: update yang terus-terusan bikin crash akhirnya dibuang
+            self._conn.execute("UPDATE jobs SET attempts = attempts + 1 WHERE done_at IS NULL")
+            dropped = self._conn.execute(
+                "UPDATE jobs SET done_at = ? WHERE done_at IS NULL AND attempts >= ?", (time.time(), self.max_attempts)
+            ).rowcount
+            self._prune()
+            rows = self._conn.execute("SELECT payload FROM jobs WHERE done_at IS NULL ORDER BY update_id").fetchall()
+        if dropped:
+            logger.warning("%d update dibuang karena udah gagal diproses %d kali.", dropped, self.max_attempts)
+        return [payload for (payload,) in rows]
+
+    def _close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _prune(self):
+        self._conn.execute("DELETE FROM jobs WHERE done_at < ?", (time.time() - self.retention,))
+        self._done_since_prune = 0
+
+    # --- Queue ---
+
+    async def put(self, item):
+        if not isinstance(item, telegram.Update):
+            return await super().put(item)  # Sinyal internal Application (misal stop), nggak perlu disimpen
+        if not await self._run(self._insert, item.update_id, item.to_json()):
+            self.duplicates += 1
+            logger.info("Update %s udah pernah diterima, di-skip.", item.update_id)
+            return
+        await super().put(item)
+
+    async def put_many(self, updates):
+        """Persists several updates in one transaction, then queues the ones not seen before (in order)."""
+        updates = list(updates)
+        inserted = await self._run(self._insert_many, [(update.update_id, update.to_json()) for update in updates])
+        for update, new in zip(updates, inserted):
+            if not new:
+                self.duplicates += 1
+                logger.info("Update %s udah pernah diterima, di-skip.", update.update_id)
+                continue
+            await super().put(update)
+
+    def _insert_many(self, rows):
+        now = time.time()
+        with self._conn:
+            return [
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO jobs (update_id, payload, received_at) VALUES (?, ?, ?)", (update_id, payload, now)
+                ).rowcount == 1
+                for update_id, payload in rows
+            ]
+
+    def _insert(self, update_id, payload):
+        with self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (update_id, payload, received_at) VALUES (?, ?, ?)",
+                (update_id, payload, time.time()),
+            )
+        return cursor.rowcount == 1
+
+    async def mark_done(self, update):
+        """Marks an update as handled so it is never re-queued."""
+        if isinstance(update, telegram.Update):
+            await self._run(self._mark_done, update.update_id)
+
+    def _mark_done(self, update_id):
+        with self._conn:
+            self._conn.execute("UPDATE jobs SET done_at = ? WHERE update_id = ?", (time.time(), update_id))
+            self._done_since_prune += 1
+            if self._done_since_prune >= PRUNE_EVERY:
+                self._prune()
+
+    async def pending_count(self):
+        """Number of persisted updates not yet marked done."""
+        return await self._run(self._pending_count)
+
+    def _pending_count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE done_at IS NULL").fetchone()[0]
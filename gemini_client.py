@@ -0,0 +1,172 @@
+"""Async inference layer for Gemini calls.
+
+Semua panggilan Gemini dari handler lewat sini supaya event loop
+python-telegram-bot nggak pernah ke-block sama request yang lambat.
+"""
+import asyncio
+import concurrent.futures
+import os
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+DEFAULT_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))  # Timeout per request (detik)
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "16"))  # Maksimal panggilan Gemini yang jalan barengan
+USE_THREAD_POOL = os.getenv("GEMINI_USE_THREAD_POOL", "0") == "1"  # Paksa pake thread pool (misal transport "rest")
+
+
+class GeminiTimeoutError(Exception):
+    """Raised when a Gemini call does not finish within its timeout."""
+
+
+class GeminiCancelledError(Exception):
+    """Raised to a stream consumer when its Gemini call was cancelled (e.g. ``cancel_all``)."""
+
+
+_END_OF_STREAM = object()
+
+
+class GeminiClient:
+    """Runs Gemini generation calls concurrently without blocking the event loop.
+
+    Uses the model's native async API (``generate_content_async``) by default.
+    When that is unavailable, or ``use_thread_pool`` is set, the blocking
+    ``generate_content`` call runs in a bounded thread pool instead.
+    """
+
+    def __init__(self, model, max_concurrency=MAX_CONCURRENCY, timeout=DEFAULT_TIMEOUT, use_thread_pool=USE_THREAD_POOL):
+        self.model = model
+        self.timeout = timeout
+        self.use_thread_pool = use_thread_pool
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="gemini"
+        )
+        self._inflight = set()
+
+    @property
+    def inflight_count(self):
+        """Number of Gemini calls currently running."""
+        return len(self._inflight)
+
+    async def generate(self, contents, model=None, timeout=None, **kwargs):
+        """Generates content and returns the Gemini response.
+
+        ``model`` overrides the default model for this call, ``timeout``
+        overrides the default per-request timeout (``None`` = default).
+        Raises ``GeminiTimeoutError`` when the call takes too long; the
+        underlying request is cancelled. Cancelling the awaiting task also
+        cancels the Gemini call.
+        """
+        model = model or self.model
+        timeout = self.timeout if timeout is None else timeout
+
+        async with self._semaphore:
+            task = asyncio.ensure_future(self._call(model, contents, **kwargs))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+            try:
+                return await asyncio.wait_for(task, timeout)
+            except asyncio.TimeoutError as e:
+                raise GeminiTimeoutError(f"Gemini nggak jawab dalam {timeout:.1f} detik") from e
+
+    async def count_tokens(self, contents, model=None, timeout=None):
+        """Returns how many input tokens ``contents`` is for the model.
+
+        Doesn't take a generation slot (it's a cheap metadata call). Raises
+        ``GeminiTimeoutError`` when it takes longer than ``timeout``.
+        """
+        model = model or self.model
+        timeout = self.timeout if timeout is None else timeout
+        if not self.use_thread_pool and hasattr(model, "count_tokens_async"):
+            call = model.count_tokens_async(contents)
+        else:
+            call = asyncio.get_running_loop().run_in_executor(self._executor, model.count_tokens, contents)
+        try:
+            response = await asyncio.wait_for(call, timeout)
+        except asyncio.TimeoutError as e:
+            raise GeminiTimeoutError(f"Gemini nggak ngitung token dalam {timeout:.1f} detik") from e
+        return response.total_tokens
+
+    async def _call(self, model, contents, **kwargs):
+        if not self.use_thread_pool and hasattr(model, "generate_content_async"):
+            return await model.generate_content_async(contents, **kwargs)
+
+        # Fallback: jalanin panggilan sync di thread pool (thread-nya nggak bisa
+        # di-cancel, tapi event loop udah bebas dan coroutine-nya langsung lepas)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, lambda: model.generate_content(contents, **kwargs)
+        )
+
+    async def stream(self, contents, model=None, timeout=None, total_timeout=None, **kwargs):
+        """Streams generated text chunks as they arrive.
+
+        ``timeout`` applies to the wait for each chunk, ``total_timeout`` (if
+        given) caps the whole stream. The Gemini call runs in its own task that
+        buffers chunks, so a slow consumer never holds a concurrency slot and
+        ``cancel_all`` cancels only the Gemini call (the consumer then gets
+        ``GeminiCancelledError``). In thread-pool mode the full answer is
+        generated first and yielded as a single chunk.
+        """
+        model = model or self.model
+        timeout = self.timeout if timeout is None else timeout
+
+        if self.use_thread_pool or not hasattr(model, "generate_content_async"):
+            if total_timeout is not None:
+                timeout = min(timeout, total_timeout)
+            response = await self.generate(contents, model=model, timeout=timeout, **kwargs)
+            yield response.text
+            return
+
+        queue = asyncio.Queue()
+        producer = asyncio.ensure_future(self._produce(model, contents, queue, timeout, total_timeout, **kwargs))
+        self._inflight.add(producer)
+        producer.add_done_callback(self._inflight.discard)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END_OF_STREAM:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            producer.cancel()  # Consumer berhenti duluan (error/selesai): stop panggilan Gemini-nya juga
+
+    async def _produce(self, model, contents, queue, timeout, total_timeout, **kwargs):
+        loop = asyncio.get_running_loop()
+        deadline = None if total_timeout is None else loop.time() + total_timeout
+
+        def wait_time():
+            if deadline is None:
+                return timeout
+            return max(0.0, min(timeout, deadline - loop.time()))
+
+        try:
+            async with self._semaphore:
+                response = await asyncio.wait_for(model.generate_content_async(contents, stream=True, **kwargs), wait_time())
+                chunks = response.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), wait_time())
+                    except StopAsyncIteration:
+                        break
+                    if chunk.text:
+                        queue.put_nowait(chunk.text)
+            queue.put_nowait(_END_OF_STREAM)
+        except asyncio.TimeoutError:
+            queue.put_nowait(GeminiTimeoutError("Gemini nggak ngirim lanjutan tepat waktu"))
+        except asyncio.CancelledError:
+            queue.put_nowait(GeminiCancelledError("Panggilan Gemini dibatalin"))
+            raise
+        except Exception as e:
+            queue.put_nowait(e)
+
+    def cancel_all(self):
+        """Cancels every in-flight Gemini call."""
+        for task in list(self._inflight):
+            task.cancel()
+
+    def close(self):
+        """Cancels in-flight calls and shuts the thread pool down."""
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
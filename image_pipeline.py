@@ -0,0 +1,149 @@
+"""In-memory photo pipeline for image roasts.
+
+Foto di-download langsung ke memory, di-decode sekali, dikecilin ke resolusi
+yang emang dipake Gemini, terus di-encode ulang jadi JPEG. Hasilnya dipake
+ulang di setiap retry, nggak ada yang nyentuh filesystem.
+
+Sebelum ke Gemini, foto disaring dulu secara lokal: yang di-download cuma
+ukuran ``PhotoSize`` terkecil yang masih cukup tajem, gambar polos (blank
+screenshot) ditolak, dan perceptual hash-nya dipake buat nangkep foto yang
+hampir sama dengan yang baru aja dikirim (di-resize/kompres ulang/di-screenshot).
+"""
+import asyncio
+import collections
+import io
+import os
+import time
+
+import metrics
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", "1024"))  # Sisi terpanjang gambar yang dikirim ke Gemini (pixel)
+IMAGE_MIN_SIDE = int(os.getenv("IMAGE_MIN_SIDE", "800"))  # Ukuran foto terkecil yang masih kebaca teksnya (sisi terpanjang, pixel)
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "85"))  # Kualitas JPEG hasil encode ulang
+IMAGE_BLANK_STDDEV = float(os.getenv("IMAGE_BLANK_STDDEV", "3"))  # Gambar dengan variasi kecerahan di bawah ini dianggap polos
+DUPLICATE_MAX_DISTANCE = int(os.getenv("IMAGE_DUPLICATE_DISTANCE", "6"))  # Beda bit perceptual hash yang masih dianggap gambar sama (0-64)
+DUPLICATE_WINDOW = float(os.getenv("IMAGE_DUPLICATE_WINDOW", "600"))  # Gambar mirip dalam jeda ini (detik) dianggap duplikat
+DUPLICATE_PER_USER = 20  # Hash terakhir yang diinget per user
+DUPLICATE_MAX_USERS = 10_000  # User yang hash-nya diinget (yang paling lama nggak ngirim gambar dibuang duluan)
+
+HASH_SIZE = 8  # dHash 8x8 = 64 bit
+
+IMAGE_PRESCREEN = metrics.counter("image_prescreen_total", "Hasil penyaringan lokal foto sebelum ke Gemini.", ("outcome",))
+IMAGE_DOWNLOAD_BYTES = metrics.counter("image_download_bytes_total", "Byte foto yang di-download dari Telegram.")
+
+
+class PreparedImage:
+    """A decoded photo: its Gemini payload plus what the pre-screening learned about it."""
+
+    __slots__ = ("payload", "phash", "blank")
+
+    def __init__(self, payload, phash, blank):
+        self.payload = payload  # {"mime_type": ..., "data": ...}, langsung bisa masuk generate_content
+        self.phash = phash  # dHash 64 bit (int)
+        self.blank = blank
+
+
+def select_photo(sizes, min_side=IMAGE_MIN_SIDE):
+    """Returns the smallest ``PhotoSize`` whose longest side is at least ``min_side`` (the largest if none is)."""
+    sizes = sorted(sizes, key=lambda size: size.width * size.height)
+    for size in sizes:
+        if max(size.width, size.height) >= min_side:
+            return size
+    return sizes[-1]
+
+
+def dhash(gray, hash_size=HASH_SIZE):
+    """Difference hash of a grayscale image: one bit per horizontally adjacent pixel pair."""
+    from PIL import Image
+
+    small = gray.resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hash_distance(a, b):
+    """Number of differing bits between two perceptual hashes."""
+    return bin(a ^ b).count("1")
+
+
+def screen_image(data, max_side=IMAGE_MAX_SIDE, quality=IMAGE_JPEG_QUALITY, blank_stddev=IMAGE_BLANK_STDDEV):
+    """Decodes image bytes once: normalizes them into a Gemini JPEG blob, hashes them and checks for blankness."""
+    from PIL import Image, ImageOps, ImageStat  # Import pas foto pertama, bukan pas start (cold start lebih cepet)
+
+    with Image.open(io.BytesIO(data)) as img:
+        source_format = img.format
+        img.draft("RGB", (max_side, max_side))  # JPEG gede di-decode langsung di skala kecil (jauh lebih murah)
+        img = ImageOps.exif_transpose(img)  # Foto miring dari kamera diluruskan dulu
+        img = img.convert("RGB")  # Buang alpha/palette biar bisa jadi JPEG
+        resized = max(img.size) > max_side
+        img.thumbnail((max_side, max_side), Image.LANCZOS)  # Cuma ngecilin, nggak pernah ngegedein
+
+        gray = img.convert("L")
+        blank = ImageStat.Stat(gray).stddev[0] < blank_stddev
+        phash = dhash(gray)
+
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    encoded = buffer.getvalue()
+    if source_format == "JPEG" and not resized and len(data) <= len(encoded):
+        encoded = bytes(data)  # JPEG asli udah kecil: nggak usah encode ulang (kualitas tetep utuh)
+    return PreparedImage({"mime_type": "image/jpeg", "data": encoded}, phash, blank)
+
+
+def prepare_image(data, max_side=IMAGE_MAX_SIDE, quality=IMAGE_JPEG_QUALITY):
+    """Decodes image bytes, downscales and re-encodes them as a Gemini inline blob.
+
+    Returns a ``{"mime_type": ..., "data": ...}`` dict that can be passed to
+    ``generate_content`` as-is.
+    """
+    return screen_image(data, max_side, quality).payload
+
+
+class DuplicateIndex:
+    """Remembers each user's recent image hashes so near-duplicates map onto the first one seen."""
+
+    def __init__(self, max_distance=DUPLICATE_MAX_DISTANCE, window=DUPLICATE_WINDOW,
+                 per_user=DUPLICATE_PER_USER, max_users=DUPLICATE_MAX_USERS):
+        self.max_distance = max_distance
+        self.window = window
+        self.per_user = per_user
+        self.max_users = max_users
+        self._recent = collections.OrderedDict()  # user_id -> deque[(phash, kapan terakhir dikirim)], urutan LRU
+
+    def canonical(self, user_id, phash):
+        """Returns the earlier hash ``phash`` is a near-duplicate of (or ``phash`` itself) and remembers it."""
+        now = time.monotonic()
+        recent = self._recent.get(user_id)
+        if recent is None:
+            recent = self._recent[user_id] = collections.deque(maxlen=self.per_user)
+            if len(self._recent) > self.max_users:
+                self._recent.popitem(last=False)
+        else:
+            self._recent.move_to_end(user_id)
+        while recent and now - recent[0][1] > self.window:
+            recent.popleft()
+        for index, (seen, _) in enumerate(recent):
+            if hash_distance(seen, phash) <= self.max_distance:
+                del recent[index]
+                recent.append((seen, now))  # Masih dikirim-kirim terus: perpanjang umurnya
+                IMAGE_PRESCREEN.inc(outcome="duplicate")
+                return seen
+        recent.append((phash, now))
+        return phash
+
+
+async def load_photo(bot, photo):
+    """Downloads a Telegram ``PhotoSize`` into memory and returns it screened (a ``PreparedImage``)."""
+    file = await bot.get_file(photo.file_id)
+    data = await file.download_as_bytearray()
+    IMAGE_DOWNLOAD_BYTES.inc(len(data))
+    # Decode/resize itu kerjaan CPU, jalanin di thread biar event loop nggak ke-block
+    prepared = await asyncio.to_thread(screen_image, bytes(data))
+    IMAGE_PRESCREEN.inc(outcome="blank" if prepared.blank else "ok")
+    return prepared
@@ -0,0 +1,328 @@
+"""Webhook ingress: how updates from Telegram get into the bot.
+
+Ada tiga pilihan (``WEBHOOK_INGRESS``):
+
+- ``aiohttp`` (default): server aiohttp ramping di ``scaling``, bareng
+  ``/metrics`` & ``/healthz``. Dipake juga sama proses front & worker di
+  mode scale-out.
+- ``asgi``: ``ASGIApp`` buat serverless / server ASGI (``uvicorn main:app``).
+  Application-nya dinyalain pas lifespan startup, atau pas request pertama
+  kalo platformnya nggak ngirim lifespan.
+- ``ptb``: server webhook bawaan PTB (``Application.run_webhook``, butuh
+  ``python-telegram-bot[webhooks]``). Cuma dapet cek secret token bawaan PTB
+  dan dedupe dari antrian durable; nggak ada ``/healthz``, batas body, atau
+  drain pas shutdown. Buat pembanding aja.
+
+Logika webhook-nya sendiri ada di ``UpdateIngress`` (nggak tergantung
+framework): cek header ``X-Telegram-Bot-Api-Secret-Token``, batas ukuran
+body, decode JSON sekali (boleh satu update atau array update), tolak
+``update_id`` yang baru aja diterima, terus masukin semuanya ke antrian
+sekaligus.
+"""
+import asyncio
+import collections
+import hmac
+import json
+import logging
+import os
+
+import telegram
+from aiohttp import web
+
+import lifecycle
+import metrics
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+INGRESS = os.getenv("WEBHOOK_INGRESS", "aiohttp")  # aiohttp, asgi, atau ptb
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET_TOKEN", "")  # Secret yang didaftarin pas setWebhook, kosong = nggak dicek
+MAX_BODY_BYTES = int(os.getenv("WEBHOOK_MAX_BODY", str(1024 * 1024)))  # Batas ukuran body webhook (byte)
+RECENT_UPDATE_IDS = int(os.getenv("WEBHOOK_RECENT_IDS", "10000"))  # update_id terakhir yang diinget buat nolak kiriman ulang
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+HEALTH_PATH = "/healthz"
+METRICS_PATH = "/metrics"
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_REQUESTS = metrics.counter("webhook_requests_total", "Request webhook per ingress & status HTTP.", ("ingress", "status"))
+WEBHOOK_DUPLICATES = metrics.counter("webhook_duplicate_updates_total", "update_id yang ditolak karena baru aja diterima.")
+
+
+class RecentIds:
+    """Bounded set of the most recently accepted ``update_id``s."""
+
+    def __init__(self, size=RECENT_UPDATE_IDS):
+        self.size = size
+        self._ids = collections.OrderedDict()
+
+    def __contains__(self, update_id):
+        return update_id in self._ids
+
+    def add(self, update_id):
+        self._ids[update_id] = None
+        self._ids.move_to_end(update_id)
+        if len(self._ids) > self.size:
+            self._ids.popitem(last=False)
+
+
+def decode_updates(body):
+    """Decodes a webhook body (one update object or an array of them) into update dicts.
+
+    Raises ``ValueError`` when the body isn't JSON or an item has no integer ``update_id``.
+    """
+    data = json.loads(body)
+    items = data if isinstance(data, list) else [data]
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get("update_id"), int):
+            raise ValueError("Update tanpa update_id")
+    return items
+
+
+def application_deliver(application):
+    """Returns a ``deliver`` callback that hands decoded updates to ``application.update_queue``."""
+
+    async def deliver(items):
+        updates = [telegram.Update.de_json(item, application.bot) for item in items]
+        queue = application.update_queue
+        if hasattr(queue, "put_many"):
+            await queue.put_many(updates)  # Antrian durable: satu transaksi SQLite buat semua update
+        else:
+            for update in updates:
+                await queue.put(update)
+        return 200
+
+    return deliver
+
+
+def application_health(application):
+    """Returns a ``health`` callback reporting whether ``application`` can take updates right now."""
+
+    def health():
+        shutdown = application.bot_data.get("lifecycle")
+        draining = bool(shutdown and shutdown.draining)
+        return application.running and not draining, {"queued": application.update_queue.qsize(), "draining": draining}
+
+    return health
+
+
+class UpdateIngress:
+    """Framework-independent webhook endpoint; adapters map their requests onto ``receive`` and ``health``.
+
+    ``deliver(items)`` gets the decoded, not-yet-seen update dicts of one
+    request and returns the HTTP status to answer (200 once they are safely
+    queued). ``health()`` returns ``(ok, details)``.
+    """
+
+    def __init__(self, deliver, health=None, name=INGRESS, secret_token=WEBHOOK_SECRET,
+                 max_body=MAX_BODY_BYTES, recent_ids=RECENT_UPDATE_IDS):
+        self.deliver = deliver
+        self._health = health
+        self.name = name
+        self.secret_token = secret_token
+        self.max_body = max_body
+        self._recent = RecentIds(recent_ids)
+
+    def check(self, secret, content_length=None):
+        """Status to reject a request with before reading its body (``None`` = go ahead)."""
+        if self.secret_token and not hmac.compare_digest((secret or "").encode(), self.secret_token.encode()):
+            return 403
+        if content_length is not None and content_length > self.max_body:
+            return 413
+        return None
+
+    async def receive(self, body, secret=None):
+        """Handles one webhook request body and returns the HTTP status to answer."""
+        status = self.check(secret, len(body))
+        if status is None:
+            status = await self._receive(body)
+        self.count(status)
+        return status
+
+    def count(self, status):
+        WEBHOOK_REQUESTS.inc(ingress=self.name, status=str(status))
+
+    async def _receive(self, body):
+        try:
+            items = decode_updates(body)
+        except ValueError as e:
+            logger.warning("Update nggak valid dari webhook: %s", e)
+            return 400
+        fresh, seen = [], set()
+        for item in items:
+            update_id = item["update_id"]
+            if update_id in self._recent or update_id in seen:
+                WEBHOOK_DUPLICATES.inc()
+                continue
+            seen.add(update_id)
+            fresh.append(item)
+        if not fresh:
+            return 200  # Kiriman ulang: udah diterima sebelumnya, Telegram cukup dibales 200
+        try:
+            status = await self.deliver(fresh)
+        except (ValueError, TypeError, KeyError) as e:
+            logger.warning("Update nggak valid dari webhook: %s", e)
+            return 400
+        if status == 200:
+            for item in fresh:
+                self._recent.add(item["update_id"])  # Baru diinget setelah aman di antrian
+        return status
+
+    def health(self):
+        """Returns ``(status, details)`` for the health endpoint."""
+        ok, details = self._health() if self._health else (True, {})
+        return (200 if ok else 503), {"status": "ok" if ok else "unavailable", "ingress": self.name, **details}
+
+
+# --- aiohttp ---
+
+def add_aiohttp_routes(app, ingress, update_path):
+    """Registers the webhook (POST ``update_path``) and health endpoints of ``ingress`` on an aiohttp app."""
+
+    async def receive_update(request):
+        status = ingress.check(request.headers.get(SECRET_HEADER), request.content_length)
+        if status is not None:  # Ditolak sebelum body-nya dibaca
+            ingress.count(status)
+            return web.Response(status=status)
+        try:
+            body = await request.read()
+        except web.HTTPRequestEntityTooLarge:  # Body chunked yang ngelewatin client_max_size
+            ingress.count(413)
+            return web.Response(status=413)
+        return web.Response(status=await ingress.receive(body, request.headers.get(SECRET_HEADER)))
+
+    async def serve_health(request):
+        status, details = ingress.health()
+        return web.json_response(details, status=status)
+
+    app.router.add_post(update_path, receive_update)
+    app.router.add_get(HEALTH_PATH, serve_health)
+
+
+# --- ASGI ---
+
+class ASGIApp:
+    """ASGI application serving the webhook, ``/healthz`` and ``/metrics`` of one bot process.
+
+    ``build_application`` is called on lifespan startup (or on the first
+    request when the server sends no lifespan events, as on most serverless
+    platforms); lifespan shutdown drains and stops it. With ``webhook_url``,
+    the webhook is registered in the background after startup.
+    """
+
+    def __init__(self, build_application, update_path, webhook_url=None, allowed_updates=None,
+                 secret_token=WEBHOOK_SECRET, max_body=MAX_BODY_BYTES):
+        self.build_application = build_application
+        self.update_path = update_path
+        self.webhook_url = webhook_url
+        self.allowed_updates = allowed_updates
+        self.secret_token = secret_token
+        self.max_body = max_body
+        self.application = None
+        self.ingress = None
+        self._starting = None
+        self._webhook_task = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def start(self):
+        """Builds and starts the application once (concurrent callers wait for the same start)."""
+        if self._starting is None:
+            self._starting = asyncio.ensure_future(self._start())
+        try:
+            await asyncio.shield(self._starting)
+        except Exception:
+            self._starting = None  # Request berikutnya nyoba lagi
+            raise
+
+    async def _start(self):
+        import scaling  # Baru di-import pas start: scaling juga nge-import modul ini
+
+        application = self.build_application()
+        await lifecycle.start_application(application)
+        self.application = application
+        self.ingress = UpdateIngress(
+            application_deliver(application), application_health(application), name="asgi",
+            secret_token=self.secret_token, max_body=self.max_body,
+        )
+        if self.webhook_url:
+            self._webhook_task = asyncio.create_task(
+                scaling.ensure_webhook(self.webhook_url, self.allowed_updates, secret_token=self.secret_token)
+            )
+
+    async def stop(self):
+        if self._webhook_task:
+            self._webhook_task.cancel()
+        if self.application is not None:
+            application, self.application = self.application, None
+            self._starting = None
+            await lifecycle.stop_application(application)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.start()
+                except Exception as e:
+                    logger.exception("Gagal nyalain bot dari lifespan ASGI")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.stop()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        method, path = scope["method"], scope["path"]
+        if path == self.update_path and method == "POST":
+            await self.start()
+            headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+            secret = headers.get(SECRET_HEADER.lower())
+            length = headers.get("content-length")
+            status = self.ingress.check(secret, int(length) if length and length.isdigit() else None)
+            if status is None:
+                body = await self._read_body(receive)
+                status = 413 if body is None else await self.ingress.receive(body, secret)
+            else:
+                self.ingress.count(status)
+            await _send_response(send, status)
+        elif path == HEALTH_PATH and method == "GET":
+            if self.ingress is None:
+                await _send_response(send, 503, json.dumps({"status": "starting", "ingress": "asgi"}), "application/json")
+            else:
+                status, details = self.ingress.health()
+                await _send_response(send, status, json.dumps(details), "application/json")
+        elif path == METRICS_PATH and method == "GET":
+            await _send_response(send, 200, metrics.render(), METRICS_CONTENT_TYPE)
+        else:
+            await _send_response(send, 404)
+
+    async def _read_body(self, receive):
+        """Reads the request body, or returns ``None`` as soon as it grows past ``max_body``."""
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return b""
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > self.max_body:
+                return None
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+
+async def _send_response(send, status, body="", content_type="text/plain"):
+    data = body.encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(data)).encode())],
+    })
+    await send({"type": "http.response.body", "body": data})
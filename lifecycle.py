@@ -0,0 +1,115 @@
+"""Graceful shutdown: drain in-flight roasts on SIGTERM, cancel what's left cleanly.
+
+Urutannya pas SIGTERM (dipanggil dari ``scaling`` setelah server webhook
+berhenti nerima update): update yang belum mulai nggak dijalanin (tetep
+pending di antrian durable, diproses ulang setelah restart), roast yang lagi
+jalan dikasih waktu ``DRAIN_TIMEOUT`` buat selesai. Sisanya dibatalin, dan
+pesan placeholder-nya diganti info retry biar user nggak nungguin pesan
+"lagi digoreng" yang nggak bakal selesai. Flush counter & tutup koneksi
+tetep di ``post_shutdown``.
+"""
+import asyncio
+import logging
+import os
+
+import metrics
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "20"))  # Waktu maksimal nunggu roast yang lagi jalan (detik)
+NOTICE_TIMEOUT = 5.0  # Waktu maksimal buat ngedit placeholder yang ketinggalan (detik)
+RETRY_NOTICE = "Bot-nya lagi restart bentar nih 🙏 Copywriting lo bakal gue roast ulang otomatis. Kalo 1-2 menit belum muncul, kirim ulang aja ya!"
+
+logger = logging.getLogger(__name__)
+
+SHUTDOWN_CANCELLED = metrics.counter("shutdown_cancelled_updates_total", "Update yang dibatalin karena lewat deadline drain.")
+
+
+async def start_application(application):
+    """Initializes and starts ``application`` like ``run_webhook`` does, minus PTB's own web server."""
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+
+
+async def stop_application(application):
+    """Drains running updates (with the ``Lifecycle`` in ``bot_data``), then stops and shuts ``application`` down."""
+    lifecycle = application.bot_data.get("lifecycle")
+    if lifecycle is not None:
+        await lifecycle.drain(application)  # Tunggu roast yang lagi jalan, sisanya dibatalin rapi
+    await application.stop()
+    if application.post_stop:
+        await application.post_stop(application)
+    await application.shutdown()
+    if application.post_shutdown:
+        await application.post_shutdown(application)  # Flush counter & tutup database
+
+
+class Lifecycle:
+    """Knows which placeholder belongs to which running update so shutdown can fix it up.
+
+    ``on_deadline`` callbacks (e.g. ``GeminiClient.cancel_all``) run when the
+    drain deadline passes, right before the leftover update tasks are cancelled.
+    """
+
+    def __init__(self, drain_timeout=DRAIN_TIMEOUT, on_deadline=(), retry_notice=RETRY_NOTICE):
+        self.drain_timeout = drain_timeout
+        self.on_deadline = list(on_deadline)
+        self.retry_notice = retry_notice
+        self.draining = False
+        self._placeholders = {}  # task update -> (bot, chat_id, message_id)
+
+    def track_placeholder(self, bot, chat_id, message_id):
+        """Registers the placeholder of the update running in the current task (forgotten when the task ends)."""
+        task = asyncio.current_task()
+        if task is None:
+            return
+        if task not in self._placeholders:
+            task.add_done_callback(self._forget)
+        self._placeholders[task] = (bot, chat_id, message_id)
+
+    def forget_placeholder(self):
+        """Marks the current update's placeholder as final (the roast is delivered), so shutdown leaves it alone."""
+        self._placeholders.pop(asyncio.current_task(), None)
+
+    def _forget(self, task):
+        if not task.cancelled():  # Yang dibatalin masih dibutuhin drain() buat ngedit placeholder-nya
+            self._placeholders.pop(task, None)
+
+    async def drain(self, application, timeout=None):
+        """Stops starting updates, waits for running ones, then cancels the rest and rewrites their placeholders."""
+        timeout = self.drain_timeout if timeout is None else timeout
+        self.draining = True
+        processor = application.update_processor
+        if hasattr(processor, "stop_accepting"):
+            processor.stop_accepting()
+        running = set(getattr(processor, "active_tasks", ()))
+        if not running:
+            return
+        logger.info("Nunggu %d update yang lagi jalan selesai (maksimal %.0f detik)...", len(running), timeout)
+        _, leftover = await asyncio.wait(running, timeout=timeout)
+        if not leftover:
+            logger.info("Semua update yang lagi jalan udah selesai.")
+            return
+
+        logger.warning("%d update belum selesai pas deadline, dibatalin.", len(leftover))
+        SHUTDOWN_CANCELLED.inc(len(leftover))
+        for callback in self.on_deadline:
+            callback()
+        for task in leftover:
+            task.cancel()
+        await asyncio.wait(leftover, timeout=NOTICE_TIMEOUT)  # Biar finally/cleanup handler-nya jalan dulu
+        placeholders = [self._placeholders.pop(task) for task in leftover if task in self._placeholders]
+        if placeholders:
+            try:
+                await asyncio.wait_for(
+                    asyncio.gather(*(self._send_notice(*placeholder) for placeholder in placeholders)), NOTICE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                logger.warning("Sebagian placeholder nggak sempet diganti info retry.")
+
+    async def _send_notice(self, bot, chat_id, message_id):
+        try:
+            await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=self.retry_notice)
+        except Exception as e:  # Pesannya udah dihapus/diedit, atau Telegram-nya lagi error: udah nggak bisa ngapa-ngapain
+            logger.warning("Gagal ganti placeholder chat %s jadi info retry: %s", chat_id, e)
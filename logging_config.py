@@ -0,0 +1,49 @@
+"""Logging setup for the bot: level-filtered, optionally structured (one JSON object per line).
+
+Semua modul pake ``logging.getLogger(__name__)`` dengan format gaya ``%s``,
+jadi argumen log cuma diformat kalo level-nya emang lolos filter.
+"""
+import json
+import logging
+import os
+import sys
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # DEBUG, INFO, WARNING, ERROR
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" buat dibaca manusia, "json" buat log collector
+LIBRARY_LOG_LEVEL = os.getenv("LIBRARY_LOG_LEVEL", "WARNING").upper()  # httpx, telegram, aiohttp dst. (cerewet di INFO)
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats a record as one JSON object; ``extra={...}`` fields become top-level keys."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "process": record.process,
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=LOG_LEVEL, fmt=LOG_FORMAT, library_level=LIBRARY_LOG_LEVEL):
+    """Installs one stderr handler on the root logger (safe to call more than once)."""
+    handler = logging.StreamHandler(sys.stderr)
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+    for name in ("httpx", "httpcore", "telegram", "aiohttp.access", "google"):
+        logging.getLogger(name).setLevel(library_level)
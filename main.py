@@ -1,187 +1,163 @@
+import startup # Paling awal: ngukur durasi import modul-modul di bawah (lihat startup.py)
 import telegram
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes # Sudah disesuaikan filters
-import google.generativeai as genai
-import sqlite3
 import time
 import re
 import os
-from PIL import Image
-from aiohttp import web
+import sys
 import asyncio
+import contextlib
+import logging
+from logging_config import configure_logging
+import metrics
+import batching
+import prompts
+from gemini_client import GeminiClient
+from retry_policy import RetryPolicy
+from model_router import ModelRouter
+from storage import Storage
+import roast_cache
+import image_pipeline
+import streaming
+import outbound
+import scaling
+import ingress
+from update_processor import ChatOrderedUpdateProcessor, slot_released
+from admission import AdmissionController, AdmissionRejected
+from durable_queue import DurableUpdateQueue
+from lifecycle import Lifecycle
+startup.mark("import")
 
 # --- 1. Setup and API Keys ---
 
+configure_logging() # Level & format lewat LOG_LEVEL / LOG_FORMAT (lihat logging_config.py)
+logger = logging.getLogger(__name__)
+
 # Securely load your API keys from environment variables (recommended)
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 if not TELEGRAM_BOT_TOKEN or not GEMINI_API_KEY:
-    print("Error: TELEGRAM_BOT_TOKEN atau GEMINI_API_KEY belum diatur di environment variables!")
+    logger.critical("Error: TELEGRAM_BOT_TOKEN atau GEMINI_API_KEY belum diatur di environment variables!")
     exit()
 
-# Configure Gemini API
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash') # Using Gemini 2.0
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "https://kopiwraiting-bot-webhook.vercel.app").rstrip("/") # URL publik bot
+WEBHOOK_PATH = TELEGRAM_BOT_TOKEN # Path webhook pake token bot
+FULL_WEBHOOK_URL = f"{WEBHOOK_URL}/{WEBHOOK_PATH}" # URL lengkap yang didaftarin ke Telegram
 
-# --- 2. Variabel Mode Bot ---
-BOT_MODE = "pedas" # Mode default bot: "pedas" (roast polos)
-
-# --- 4. Fungsi Database Setup & Create Table --- # <----- FUNGSI DATABASE SETUP BARU!
-DATABASE_FILE = 'data/users.db'  # Lokasi file database
+# Configure Gemini API
+def load_gemini():
+    """Imports and configures the Gemini SDK (~1s, the slowest import) and returns the model class.
 
-def create_database_and_table():
-    """Creates the database and the users table if they don't exist."""
-    conn = None  # Inisialisasi conn di luar blok try
+    Runs in a thread from ``post_init`` so it overlaps startup instead of blocking it.
+    """
+    started = time.perf_counter()
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_API_KEY)
+    startup.record("gemini_import", time.perf_counter() - started) # Di luar critical path, dicatet terpisah
+    return genai.GenerativeModel
+
+model_router = ModelRouter() # Model murah buat teks pendek, model cadangan pas 429/timeout (lihat model_router.py)
+prompt_registry = prompts.PromptRegistry(model_names=model_router.model_names, loader=load_gemini) # Semua model dibikin sekali (pas load), instruksi tiap mode jadi system_instruction
+gemini_client = GeminiClient(None) # Layer async buat semua panggilan Gemini (non-blocking + timeout); model-nya selalu dari prompt_registry
+gemini_retry_policy = RetryPolicy() # Retry bareng buat roast teks & gambar; circuit breaker-nya per model di model_router
+chat_actions = outbound.ChatActionKeeper() # Satu task "typing" per chat, bukan send_chat_action tiap langkah
+duplicate_images = image_pipeline.DuplicateIndex() # Perceptual hash gambar terakhir tiap user, buat nangkep kiriman ulang yang hampir sama
+admission = AdmissionController() # Rate limit per user & global + batas roast yang jalan barengan (lihat admission.py)
+lifecycle = Lifecycle(on_deadline=[gemini_client.cancel_all]) # Drain roast yang lagi jalan pas SIGTERM (lihat lifecycle.py)
 
+# --- 2. Variabel Mode Bot ---
+DEFAULT_MODE = "pedas" # Mode default bot: "pedas" (roast polos). Mode aktif disimpen per chat, bukan global
+LEADERBOARD_SIZE = 10 # Jumlah user yang ditampilin di /peringkat
+
+# --- 4. Database (koneksi persisten + counter batch, lihat storage.py) ---
+storage = Storage()
+response_cache = roast_cache.RoastCache() # Cache hasil roast teks & gambar (opsional backup ke SQLite lewat ROAST_CACHE_DB)
+
+async def post_init(application: Application) -> None:
+    """Opens the database connection once the Application starts."""
+    await storage.start()
+    await asyncio.to_thread(response_cache.start) # Muat cache roast dari disk (kalo diaktifin)
+    await application.update_queue.start(application.bot) # Buka antrian update, proses ulang yang belum selesai
+    # Gauge dibaca pas /metrics di-scrape, jadi nggak ada biaya di hot path
+    metrics.gauge("update_queue_depth", "Update yang udah diterima tapi belum mulai diproses.", func=application.update_queue.qsize)
+    metrics.gauge("admission_waiting", "Roast yang lagi ngantri di admission control.", func=lambda: admission.waiting)
+    metrics.gauge("admission_inflight", "Roast yang lagi jalan.", func=lambda: admission.inflight)
+    metrics.gauge("gemini_inflight", "Panggilan Gemini yang lagi jalan.", func=lambda: gemini_client.inflight_count)
+    metrics.gauge("roast_cache_hit_ratio", "Rasio hit cache roast sejak start.", func=lambda: response_cache.hit_ratio)
+    application.bot_data["loop_monitor"] = asyncio.create_task(metrics.monitor_event_loop()) # Ukur lag event loop buat /metrics
+    application.bot_data["gemini_loader"] = asyncio.create_task(warm_up_gemini()) # Import SDK Gemini di background, bot udah bisa nerima update
+    application.bot_data["lifecycle"] = lifecycle # Dipake scaling.py buat drain pas SIGTERM
+
+async def warm_up_gemini() -> None:
+    """Loads the Gemini SDK and models in the background (handlers await the same load if it isn't done yet)."""
     try:
-        conn = sqlite3.connect(DATABASE_FILE) # Koneksi ke database (atau buat file kalo belum ada)
-        cursor = conn.cursor()
-
-        # Buat tabel users kalo belum ada
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                join_time TEXT,
-                usage_count INTEGER DEFAULT 0,
-                image_usage_count INTEGER DEFAULT 0
-            )
-        """)
-        conn.commit() # Simpan perubahan database
-
-        # Tambah kolom image_usage_count jika belum ada (untuk update database yang sudah ada)
+        await prompt_registry.load()
+        if prompts.CONTEXT_CACHE_ENABLED:
+            await prompt_registry.enable_context_cache() # Opsional: instruksi prompt disimpen di context cache Gemini
+    except Exception as e: # Handler bakal nyoba load ulang sendiri
+        logger.error("Gagal nyiapin Gemini pas start: %s", e)
+
+async def post_shutdown(application: Application) -> None:
+    """Cancels leftover Gemini calls, flushes buffered usage counters and closes the database on shutdown."""
+    application.bot_data["loop_monitor"].cancel()
+    application.bot_data["gemini_loader"].cancel()
+    gemini_client.close() # Batalin panggilan Gemini yang masih jalan & matiin thread pool-nya
+    await prompt_registry.close() # Hapus context cache (kalo dipake)
+    await storage.close()
+    response_cache.close()
+    await application.update_queue.close()
+    logger.info("Statistik cache roast: %s", response_cache.stats())
+    logger.info("Statistik admission control: %s", admission.stats())
+    logger.info("Statistik model Gemini: %s", model_router.stats())
+
+# --- Mode Bot Per Chat ---
+# Mode di-key per chat (private chat = per user). Semua update satu chat selalu diproses
+# di proses yang sama (scaling.py nge-route per chat_id), dan cuma handler chat itu yang
+# bisa ganti mode-nya, jadi cache di context.chat_data selalu akurat tanpa TTL/invalidation.
+# Konsekuensinya: di grup, mode berlaku buat semua anggota grup (mode grupnya, bukan mode
+# pribadi tiap orang), dan kalo jumlah worker diubah, cache lama cuma dipake sampe worker restart.
+
+async def get_chat_mode(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """Returns the chat's bot mode from context.chat_data, loading it from the database on a miss."""
+    mode = context.chat_data.get("mode")
+    if mode is not None:
+        return mode # Hot path: nggak ada I/O sama sekali
+
+    mode = await storage.get_chat_mode(update.effective_chat.id) or DEFAULT_MODE
+    context.chat_data["mode"] = mode
+    return mode
+
+async def set_chat_mode(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE, mode: str) -> None:
+    """Saves the chat's bot mode to the database and the in-memory cache."""
+    await storage.set_chat_mode(update.effective_chat.id, mode)
+    context.chat_data["mode"] = mode
+
+# --- Antrian Roast (admission control) ---
+
+BLANK_IMAGE_TEXT = "Lah, gambarnya kosong melompong gitu 😅 Nggak ada copywriting yang bisa gue roast. Kirim screenshot yang ada teksnya dong!" # Pesan kalo gambarnya polos
+REJECTED_TEXT = "Santai dulu bro, lo ngirimnya kebanyakan/antrian lagi penuh banget nih! 😮‍💨 Coba kirim lagi bentar lagi ya." # Pesan kalo request ditolak limiter
+
+def queue_hooks(context: ContextTypes.DEFAULT_TYPE, message: telegram.Message, resume_text: str, parse_mode=None) -> dict:
+    """Returns ``admission.admit`` callbacks for a queued roast.
+
+    The placeholder ``message`` shows the queue position while waiting and
+    goes back to ``resume_text`` once the roast gets its turn; the update's
+    processor slot is freed for other chats during the wait.
+    """
+    async def edit_placeholder(text, parse_mode=None):
         try:
-            cursor.execute("ALTER TABLE users ADD COLUMN image_usage_count INTEGER DEFAULT 0")
-            conn.commit()
-            print("Kolom 'image_usage_count' berhasil ditambahkan ke tabel 'users'.")
-        except sqlite3.OperationalError:
-            print("Kolom 'image_usage_count' sudah ada di tabel 'users'.")
-
-        print("Database dan tabel 'users' berhasil dibuat/terhubung.") # Log success
-
-    except sqlite3.Error as e:
-        print(f"Error membuat database atau tabel: {e}") # Log error
-
-    finally:
-        if conn:
-            conn.close()
+            await context.bot.edit_message_text(chat_id=message.chat_id, message_id=message.message_id, text=text, parse_mode=parse_mode)
+        except telegram.error.TelegramError as e:
+            logger.warning("Gagal update info antrian: %s", e)
 
-def add_user_to_database(user):
-    """Adds a new user to the database if they don't already exist."""
-    conn = None
-    try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-
-        # Cek apakah user_id udah ada di database
-        cursor.execute("SELECT user_id FROM users WHERE user_id = ?", (user.id,))
-        existing_user = cursor.fetchone()
-
-        if existing_user:
-            print(f"User ID {user.id} sudah terdaftar di database.") # Log kalo user udah ada
-            return False # Balikin False, menandakan user sudah ada
-
-        else: # Kalo user_id belum ada, tambahin user baru
-            join_time = time.strftime('%Y-%m-%dT%H:%M:%S') # Format waktu join: YYYY-MM-DDTHH:MM:SS (ISO 8601)
-            cursor.execute("""
-                INSERT INTO users (user_id, username, join_time)
-                VALUES (?, ?, ?)
-            """, (user.id, user.username, join_time)) # Tambah user baru
-            conn.commit()
-            print(f"User baru {user.username} (ID: {user.id}) berhasil ditambahkan ke database.") # Log user baru
-            return True # Balikin True, menandakan user berhasil ditambahkan
-
-    except sqlite3.Error as e:
-        print(f"Error menambahkan user ke database: {e}")
-        return False # Balikin False kalo error
-
-    finally:
-        if conn:
-            conn.close()
-
-def increment_usage_count(user_id):
-    """Increments the usage_count for a given user_id in the database."""
-    conn = None
-    try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-
-        # Increment usage_count user
-        cursor.execute("""
-            UPDATE users
-            SET usage_count = usage_count + 1
-            WHERE user_id = ?
-        """, (user_id,)) # Update usage_count berdasarkan user_id
-        conn.commit()
-        print(f"Usage count for User ID {user_id} berhasil diincrement.") # Log success increment
-        return True # Balikin True kalo sukses increment
-
-    except sqlite3.Error as e:
-        print(f"Error increment usage count for User ID {user_id}: {e}") # Log error increment
-        return False # Balikin False kalo error
-
-    finally:
-        if conn:
-            conn.close()
-
-def increment_image_usage_count(user_id):
-    """Increments the image_usage_count for a given user_id in the database."""
-    conn = None
-    try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-
-        # Increment image_usage_count user
-        cursor.execute("""
-            UPDATE users
-            SET image_usage_count = image_usage_count + 1
-            WHERE user_id = ?
-        """, (user_id,)) # Update image_usage_count berdasarkan user_id
-        conn.commit()
-        print(f"Image usage count for User ID {user_id} berhasil diincrement.") # Log success increment
-        return True # Balikin True kalo sukses increment
-
-    except sqlite3.Error as e:
-        print(f"Error increment image usage count for User ID {user_id}: {e}") # Log error increment
-        return False # Balikin False kalo error
-
-    finally:
-        if conn:
-            conn.close()
-
-def get_user_account_data(user_id):
-    """Retrieves user account data (username, usage_count, image_usage_count) from the database."""
-    conn = None
-    try:
-        conn = sqlite3.connect(DATABASE_FILE)
-        cursor = conn.cursor()
-
-        # Ambil data user berdasarkan user_id
-        cursor.execute("""
-            SELECT username, usage_count, image_usage_count
-            FROM users
-            WHERE user_id = ?
-        """, (user_id,)) # Ambil username, usage_count, image_usage_count
-
-        user_data = cursor.fetchone() # Ambil satu baris hasil query
-
-        if user_data:
-            username, usage_count, image_usage_count = user_data # Unpack data user
-            return { # Balikin data user dalam bentuk dictionary
-                "username": username,
-                "usage_count": usage_count,
-                "image_usage_count": image_usage_count
-            }
-        else:
-            return None # User tidak ditemukan
+    async def on_queued(position: int) -> None:
+        await edit_placeholder(f"Lagi rame nih! Lo antrian nomor {position}, tungguin bentar ya... ⏳")
 
-    except sqlite3.Error as e:
-        print(f"Error mengambil data user dari database: {e}")
-        return None # Error ambil data
+    async def on_admitted() -> None:
+        await edit_placeholder(resume_text, parse_mode) # Giliran lo: balikin pesan "lagi digoreng"
 
-    finally:
-        if conn:
-            conn.close()
+    return {"on_queued": on_queued, "on_admitted": on_admitted, "waiting": slot_released}
 
 # --- 5. Command Handlers ---
 
@@ -189,7 +165,7 @@ async def start(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) ->
     """Sends a welcome message when the /start command is issued."""
     user = update.effective_user
 
-    user_added = add_user_to_database(user) # <----- PANGGIL add_user_to_database()
+    user_added = await storage.add_user_to_database(user) # <----- PANGGIL add_user_to_database()
 
     # Bahasa Jaksel version of the start message - DENGAN DESKRIPSI MODE!
     await update.message.reply_markdown_v2(
@@ -212,7 +188,7 @@ async def myaccount(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE)
     user = update.effective_user
     user_id = user.id
 
-    account_data = get_user_account_data(user_id) # Ambil data akun user dari database
+    account_data = await storage.get_user_account_data(user_id) # Ambil data akun user dari database
 
     if account_data:
         username = account_data["username"]
@@ -232,16 +208,39 @@ async def myaccount(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE)
     else:
         await update.message.reply_text("Waduh, data akun kamu nggak ketemu di database! 😫 Coba /start dulu ya, atau mungkin ada error di database.") # Error kalo data user ga ketemu
 
+async def leaderboard(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Sends the top roasted users and today's/this week's usage stats (/peringkat)."""
+    top_users = await storage.get_leaderboard(LEADERBOARD_SIZE) # Pake index + cache, tetep cepet walau user-nya jutaan
+    summary = await storage.get_usage_summary(7) # Cuma baca rollup harian, bukan scan tabel users
+
+    lines = ["🏆 Peringkat Korban Roasting 🏆", ""]
+    medals = ["🥇", "🥈", "🥉"]
+    for rank, (user_id, username, usage_count) in enumerate(top_users, start=1):
+        name = f"@{username}" if username else f"User {user_id}"
+        lines.append(f"{medals[rank - 1] if rank <= len(medals) else f'{rank}.'} {name} - {usage_count} roast")
+    if not top_users:
+        lines.append("Belum ada yang di-roast. Jadilah yang pertama! 🔥")
+
+    if summary:
+        today = summary["days"][0] if summary["days"] and summary["days"][0]["day"] == time.strftime("%Y-%m-%d") else None
+        week_roasts = sum(day["roasts"] for day in summary["days"])
+        lines += [
+            "",
+            "📊 Statistik Bot 📊",
+            f"- Total user: {summary['total_users']}",
+            f"- Roast hari ini: {today['roasts'] if today else 0} (user aktif: {today['active_users'] if today else 0})",
+            f"- Roast 7 hari terakhir: {week_roasts}",
+        ]
+    await update.message.reply_text("\n".join(lines)) # Plaintext: username bisa ngandung karakter markdown
+
 async def mode_pedas(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Sets the bot mode to 'pedas' (pure roast)."""
-    global BOT_MODE # Gunakan variabel global BOT_MODE
-    BOT_MODE = "pedas"
+    await set_chat_mode(update, context, "pedas")
     await update.message.reply_text("Oke! Mode bot sekarang di <strong>Roast Pedas</strong> 🔥 siap nyinyir abis-abisan! Kirimin copywriting lo, siap-siap di-roast tanpa ampun! 😂", parse_mode=telegram.constants.ParseMode.HTML)
 
 async def mode_solusi(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Sets the bot mode to 'solusi' (roast with solutions)."""
-    global BOT_MODE # Gunakan variabel global BOT_MODE
-    BOT_MODE = "solusi"
+    await set_chat_mode(update, context, "solusi")
     await update.message.reply_text("Sip! Mode bot ganti ke <strong>Roast Berfaedah</strong> 👍. Gue bakal tetep roast copywriting lo, tapi gue kasih juga masukan yang <strong>berfaedah</strong> dikit. Kirim copywriting lo, mari kita bedah! 😎", parse_mode=telegram.constants.ParseMode.HTML)
 
 async def about(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) -> None: # <----- FUNGSI COMMAND HANDLER /ABOUT BARU!
@@ -265,227 +264,242 @@ Makasih banyak ya buat supportnya! 🙏 Semoga skill copywriting lo makin mantep
 
 # --- 4. Message Handler (Core Logic) ---
 
-async def roast_copywriting(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Roasts the user-submitted copywriting using Gemini, based on BOT_MODE."""
-    # --- Chat Action "Typing" ---
-    await context.bot.send_chat_action(chat_id=update.message.chat_id, action=telegram.constants.ChatAction.TYPING) # Kirim chat action "typing"
+async def stream_roast(context: ContextTypes.DEFAULT_TYPE, chat_id, message_id, contents, timeout, model=None) -> str:
+    """Streams a Gemini roast into the placeholder message and returns the full text.
 
-    user_copywriting = update.message.text
+    ``timeout`` is the time left before the retry deadline and caps the whole
+    stream, including the Telegram edits.
+    """
+    reply = streaming.StreamingReply(context.bot, chat_id, message_id)
+    try:
+        async with asyncio.timeout(timeout): # Total deadline, bukan per chunk
+            async with contextlib.aclosing(gemini_client.stream(contents, model=model, total_timeout=timeout)) as chunks:
+                async for chunk in chunks:
+                    await reply.append(chunk) # Edit pesan awal (di-throttle), lanjut ke pesan baru kalo kepanjangan
+            await reply.finish()
+    except Exception:
+        await reply.discard() # Gagal di tengah jalan: buang pesan lanjutan biar retry mulai bersih
+        raise
+    return reply.text
+
+async def roast_copywriting(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Roasts the user-submitted copywriting using Gemini, based on the user's bot mode."""
+    user_copywriting = "\n\n".join(part.message.text for part in batching.current_parts(update)) # Teks beruntun digabung jadi satu (kalo TEXT_BURST_WINDOW aktif)
 
     if not user_copywriting:
         await update.message.reply_text("Eh, kirimin dulu dong teks copywriting yang mau di-roast!") # Bahasa Jaksel
         return
 
-    # --- Kirim Pesan Awal "Diterima" ---
-    initial_message = await update.message.reply_text("Copywriting lo udah gue terima nih! jangan kabur lo!") # Kirim pesan awal dan simpan object Message
-
-    if BOT_MODE == "pedas":
-        prompt = f"""
-        Lo adalah seorang stand up komedi dengan pengalaman lebih dari 10 tahun. Spesialis lo adalah di roasting. Lo paling bisa kalo soal roasting. Ga cuma itu, lo juga ahli dalam copywriting sembari lo jadi stand up komedian. Nah sekarang lo ditugasin buat roasting-in hasil copywriting orang. 
-        
-        Lo ga perlu mikirin solusi, lo cukup kasih roasting-an sebagai hiburan. Anggep aja lo sekarang lagi di tongkrongan terus ada temen lo nunjukkin copywriting-nya!
-
-        Lo ga usah intro, langsung kasih roasting pake bahasa sehari-hari yang gaul & friendly kayak lo gue gitu, ga usah formal.
+    mode = await get_chat_mode(update, context) # Mode per chat, diambil sekali di awal biar konsisten selama roast ini
 
-        Nih teks copywriting-nya:
-        \"{user_copywriting}\"
-
-        lo ga perlu pake format markdown, kasih aja output lo dalam plaintext.
-        """
-    elif BOT_MODE == "solusi":
-        prompt = f"""
-        Lo adalah seorang stand up komedi dengan pengalaman lebih dari 10 tahun. Spesialis lo adalah di roasting. Lo paling bisa kalo soal roasting. Ga cuma itu, lo juga ahli dalam copywriting sembari lo jadi stand up komedian. Nah sekarang lo ditugasin buat roasting-in hasil copywriting orang. 
-
-        Karena situasinya lo lagi ditongkrongan sama temen lu yang minta roasting-in copywriting-nya, selain ngasih roasting, lo kasih saran dan solusi juga sekalian ngebuktiin (pamer) skill lo dibidang copywriting yang udah 10 tahun itu.
-
-        Lo ga usah intro, kasih roasting & saran pake bahasa sehari-hari yang gaul & friendly kayak lo gue gitu, ga usah formal.
+    # --- Cek Cache Dulu (copywriting yang sama nggak perlu ke Gemini lagi) ---
+    cache_key = roast_cache.text_key(mode, user_copywriting)
+    cached_roast = await response_cache.lookup(cache_key)
+    if cached_roast:
+        storage.increment_usage_count(update.effective_user.id)
+        metrics.ROASTS.inc(path="text", outcome="cached")
+        await update.message.reply_text(cached_roast)
+        return
 
-        Nih teks Copywriting-nya:
-        \"{user_copywriting}\"
+    await prompt_registry.load() # Biasanya udah selesai di background sejak start
+    prompt = prompt_registry.get(mode) # Instruksi mode udah jadi system_instruction di model-nya (lihat prompts.py)
+    contents = prompt.render(await prompt_registry.fit(user_copywriting, gemini_client)) # Copywriting kepanjangan dipotong ke budget token
+
+    # --- RETRY MECHANISM (async backoff, lihat retry_policy.py; failover antar model, lihat model_router.py) ---
+    async def call_model(model_name, timeout):
+        if streaming.STREAMING_ENABLED: # Mode streaming: roast langsung nongol sedikit-sedikit di pesan awal
+            return await stream_roast(context, update.message.chat_id, initial_message.message_id, contents, timeout, model=prompt.model(model_name))
+        response = await gemini_client.generate(contents, model=prompt.model(model_name), timeout=min(gemini_client.timeout, timeout)) # Non-blocking, event loop tetep jalan buat user lain
+        return response.text
+
+    async def generate_roast(timeout):
+        with metrics.GEMINI_LATENCY.time(path="text", mode=mode), metrics.span("gemini"): # Latency per mode, lihat /metrics
+            return await model_router.run(call_model, timeout, text_length=len(user_copywriting)) # Teks pendek ke model murah
+
+    async def notify_retry(attempt, error, delay):
+        metrics.GEMINI_RETRIES.inc(path="text")
+        logger.warning("Error komunikasi sama Gemini (percobaan ke-%d): %s, retry %.1f detik lagi (Mode: %s)", attempt, error, delay, mode)
+        await context.bot.edit_message_text( # Edit pesan awal, kasih tau lagi nyoba
+            chat_id=update.message.chat_id,
+            message_id=initial_message.message_id,
+            text=f"Waduh, mesin roasting mode *{mode}* kayaknya lagi ngambek dikit... 😪\nGue coba sekali lagi ya... (percobaan ke-{attempt + 1})" # Pesan editan, info retry
+        )
 
-        lo ga perlu pake format markdown, kasih aja output lo dalam plaintext.
-        """
-    else: # Mode tidak dikenal (fallback, jaga-jaga error)
-        prompt = f"Roast copywriting ini: \"{user_copywriting}\"" # Prompt default sederhana
+    # --- Kirim Pesan Awal "Diterima" (langsung info mode, nanti diganti roast-nya lewat satu edit) ---
+    async with chat_actions.keep(context.bot, update.message.chat_id): # Satu task "typing" per chat selama roast jalan
+        placeholder_text = f"Copywriting lo udah gue terima nih! Wait, bahan lo lagi digoreng master chef pake mode *{mode}*! 🔥" # Pesan awal, info mode juga
+        initial_message = await update.message.reply_text(placeholder_text, parse_mode=telegram.constants.ParseMode.MARKDOWN)
+        lifecycle.track_placeholder(context.bot, update.message.chat_id, initial_message.message_id) # Diganti info retry kalo kepotong shutdown
+        try:
+            hooks = queue_hooks(context, initial_message, placeholder_text, telegram.constants.ParseMode.MARKDOWN)
+            async with admission.admit(update.effective_user.id, **hooks): # Ngantri kalo limit kena
+                gemini_roast = await gemini_retry_policy.run(generate_roast, on_retry=notify_retry)
+        except AdmissionRejected:
+            logger.info("Request roast User ID %s ditolak admission control.", update.effective_user.id)
+            metrics.ROASTS.inc(path="text", outcome="rejected")
+            gemini_roast = None
+            final_text = REJECTED_TEXT
+        except Exception as e:
+            logger.error("Error komunikasi sama Gemini: %s (Mode: %s)", e, mode) # Tambahkan info mode di log
+            metrics.ROASTS.inc(path="text", outcome="fallback")
+            gemini_roast = None
+            # --- ROAST CADANGAN KALO ERROR (gantiin pesan awal, bukan pesan baru) ---
+            final_text = f"Waduh, mesin roasting gue lagi error berat nih! 😫\n\nTapi tenang, gue tetep kasih roast spesial buat lo:\n\n\"Hmm, copywriting lo...  unik juga ya. Lain dari yang lain.  Pokoknya... jangan semangat & jangan berkarya!\" 😉\n\nIni roast darurat mode *{mode}* ya, lain kali gue roast beneran deh kalo otak gue udah bener. Coba lagi ya!" # Roast cadangan Bahasa Jaksel, info mode juga
+        else:
+            metrics.ROASTS.inc(path="text", outcome="ok" if gemini_roast else "empty")
+            final_text = gemini_roast or "Hmm, Gemini kayaknya speechless...  copywriting lo terlalu bagus (atau terlalu parah?)! Coba kirim yang lain deh." # Bahasa Jaksel
+
+    if gemini_roast:
+        # --- INCREMENT USAGE COUNT USER! --- # <----- TAMBAHAN PANGGIL increment_usage_count()
+        storage.increment_usage_count(update.effective_user.id) # Increment usage_count user
+        response_cache.put(cache_key, gemini_roast) # Simpen buat yang ngirim copywriting sama
+        if streaming.STREAMING_ENABLED: # Kalo streaming, roast-nya udah tampil di pesan awal
+            lifecycle.forget_placeholder()
+            return
+    await outbound.deliver(context.bot, update.message.chat_id, initial_message.message_id, final_text) # Satu edit, bukan delete + reply
+    lifecycle.forget_placeholder()
 
-    # --- RETRY MECHANISM ---
-    max_retries = 3 # Maksimal percobaan retry
-    retry_delay = 2 # Delay antar retry (detik)
-    retry_count = 0
+async def roast_image_copywriting(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Roasts user-submitted image copywriting (IMAGE MESSAGE HANDLER) with Retry Mechanism."""
+    user = update.effective_user
+    photos = [image_pipeline.select_photo(part.message.photo) for part in batching.current_parts(update)] # Album: semua foto di-roast bareng; ukuran terkecil yang masih kebaca, bukan yang paling gede
+    mode = await get_chat_mode(update, context)
+
+    async def reply_cached(cached_roast):
+        storage.increment_usage_count(user.id)
+        storage.increment_image_usage_count(user.id)
+        storage.increment_usage_count(user.id)
+        metrics.ROASTS.inc(path="image", outcome="cached")
+        await update.message.reply_text(cached_roast)
+
+    # --- Cek Cache Dulu (gambar yang sama/di-forward ulang nggak perlu di-download & ke Gemini lagi) ---
+    cache_key = roast_cache.image_key("+".join(photo.file_unique_id for photo in photos))
+    cached_roast = await response_cache.lookup(cache_key)
+    if cached_roast:
+        await reply_cached(cached_roast)
+        return
 
-    while retry_count < max_retries:
-        retry_count += 1
-        print(f"Mencoba panggil Gemini API (percobaan ke-{retry_count})... (Mode: {BOT_MODE})") # Log retry attempt
+    fallback_roast_image = "Waduh, mesin roast gambar gue lagi error berat nih! 😭\n\nTapi tenang, gue tetep kasih roast spesial buat gambar lo:\n\n\"Hmm, gambar copywriting lo...  menarik juga ya.  Visualnya...  lain dari yang lain.  Pokoknya... jangan semangat & jangan berkarya!\" 😉\n\nIni roast darurat gambar ya, lain kali gue roast beneran deh kalo otak gue udah bener. Coba lagi ya!" # Roast cadangan gambar
 
-        try:
-            await context.bot.send_chat_action(chat_id=update.message.chat_id, action=telegram.constants.ChatAction.TYPING) # Kirim chat action "typing"
-            # --- Edit Pesan Awal Jadi "Sabar ya..." ---
-            await context.bot.edit_message_text(
-                chat_id=update.message.chat_id,
-                message_id=initial_message.message_id, # Gunakan message_id dari pesan awal
-                text=f"Wait, bahan lo lagi digoreng master chef pake mode *{BOT_MODE}*! 🔥", # Pesan editan, info mode juga
-                parse_mode=telegram.constants.ParseMode.MARKDOWN
+    # --- RETRY MECHANISM FOR IMAGE ROASTING (async backoff + failover antar model) ---
+    async def call_model(model_name, timeout):
+        prompt = prompt_registry.get("album" if len(image_payloads) > 1 else "image") # Model vision-nya dibikin sekali pas start, bukan tiap percobaan
+        contents = [prompt.render(count=len(image_payloads)), *image_payloads]
+        if streaming.STREAMING_ENABLED:
+            return await stream_roast(
+                context, update.message.chat_id, initial_message.message_id,
+                contents, timeout, model=prompt.model(model_name)
             )
+        response = await gemini_client.generate(
+            contents, model=prompt.model(model_name), timeout=min(gemini_client.timeout, timeout)
+        )
+        return response.text
 
-            start_time = time.time()
-            await context.bot.send_chat_action(chat_id=update.message.chat_id, action=telegram.constants.ChatAction.TYPING) # Kirim chat action "typing"
-            response = model.generate_content(prompt)
-            end_time = time.time()
-            print(f"Waktu panggil Gemini API: {end_time - start_time:.2f} detik (Mode: {BOT_MODE})") # Tambahkan info mode di log
-            gemini_roast = response.text
-
-            if gemini_roast:
-                await context.bot.delete_message(
-                    chat_id=update.message.chat_id,
-                    message_id=initial_message.message_id
-                )
-                # --- INCREMENT USAGE COUNT USER! --- # <----- TAMBAHAN PANGGIL increment_usage_count()
-                increment_usage_count(update.effective_user.id) # Increment usage_count user
-                await update.message.reply_text(gemini_roast)
-            else:
-                await update.message.reply_text("Hmm, Gemini kayaknya speechless...  copywriting lo terlalu bagus (atau terlalu parah?)! Coba kirim yang lain deh.") # Bahasa Jaksel
+    async def generate_image_roast(timeout):
+        await prompt_registry.load() # Biasanya udah selesai di background sejak start
+        with metrics.GEMINI_LATENCY.time(path="image", mode=mode), metrics.span("gemini"):
+            return await model_router.run(call_model, timeout) # Gambar nggak pernah ke model murah
 
-        except Exception as e:
-            print(f"Error komunikasi sama Gemini: {e} (Mode: {BOT_MODE})") # Tambahkan info mode di log
-            if retry_count < max_retries: # Kalo masih ada kesempatan retry
-                await context.bot.edit_message_text( # Edit pesan awal, kasih tau lagi nyoba
-                    chat_id=update.message.chat_id,
-                    message_id=initial_message.message_id,
-                    text=f"Waduh, mesin roasting mode *{BOT_MODE}* kayaknya lagi ngambek dikit... 😪\nGue coba sekali lagi ya... (percobaan ke-{retry_count + 1})" # Pesan editan, info retry
-                )
-                time.sleep(retry_delay) # Tunggu sebentar sebelum retry
-                continue # Lanjut ke awal loop retry lagi
-
-        # --- ROAST CADANGAN KALO ERROR ---
-        fallback_roast = f"Waduh, mesin roasting gue lagi error berat nih! 😫\n\nTapi tenang, gue tetep kasih roast spesial buat lo:\n\n\"Hmm, copywriting lo...  unik juga ya. Lain dari yang lain.  Pokoknya... jangan semangat & jangan berkarya!\" 😉\n\nIni roast darurat mode *{BOT_MODE}* ya, lain kali gue roast beneran deh kalo otak gue udah bener. Coba lagi ya!" # Roast cadangan Bahasa Jaksel, info mode juga
-
-        # --- Edit Pesan Awal Jadi Pesan Error (Opsional) ---
+    async def notify_retry(attempt, error, delay):
+        metrics.GEMINI_RETRIES.inc(path="image")
+        logger.warning("Error komunikasi sama Gemini OCR (percobaan ke-%d): %s, retry %.1f detik lagi (Mode: %s)", attempt, error, delay, mode) # Log error OCR gambar
         await context.bot.edit_message_text(
             chat_id=update.message.chat_id,
-            message_id=initial_message.message_id, # Gunakan message_id dari pesan awal
-            text=f"Waduh, mesin roasting mode *{BOT_MODE}* lagi ngambek! 😭 Sabar ya, lagi diperbaiki nih...", # Pesan error editan, info mode juga
-            parse_mode=telegram.constants.ParseMode.MARKDOWN_V2
+            message_id=initial_message.message_id,
+            text=f"Waduh, mesin roast gambar mode *{mode}* kayaknya lagi ngambek dikit... 😪\nGue coba sekali lagi ya... (percobaan ke-{attempt + 1})" # Pesan editan, info retry gambar
         )
-        await update.message.reply_text(fallback_roast)
-        # --- AKHIR ROAST CADANGAN ---
 
-async def roast_image_copywriting(update: telegram.Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Roasts user-submitted image copywriting (IMAGE MESSAGE HANDLER) with Retry Mechanism."""
-    user = update.effective_user
-    photo = update.message.photo[-1]
-    file_id = photo.file_id
-    file = await context.bot.get_file(file_id)
-    image_path = f"downloads/{file_id}.jpg"
-    await file.download_to_drive(image_path)
-
-    await context.bot.send_chat_action(chat_id=update.message.chat_id, action=telegram.constants.ChatAction.TYPING)
-    initial_message = await update.message.reply_text("Gambar copywriting lo udah gue terima nih! Bentar ya, lagi gue bedah... 🧐")
-
-    # --- RETRY MECHANISM FOR IMAGE ROASTING ---
-    max_retries_image = 3 # Maksimal percobaan retry untuk roast gambar
-    retry_delay_image = 2 # Delay antar retry (detik) untuk roast gambar
-    retry_count_image = 0
-
-    formatted_roast_image = None # Inisialisasi variabel formatted_roast_image di luar loop retry
-    fallback_roast_image = "Waduh, mesin roast gambar gue lagi error berat nih! 😭\n\nTapi tenang, gue tetep kasih roast spesial buat gambar lo:\n\n\"Hmm, gambar copywriting lo...  menarik juga ya.  Visualnya...  lain dari yang lain.  Pokoknya... jangan semangat & jangan berkarya!\" 😉\n\nIni roast darurat gambar ya, lain kali gue roast beneran deh kalo otak gue udah bener. Coba lagi ya!" # Roast cadangan gambar (Inisialisasi di luar loop retry)
-
-
-    while retry_count_image < max_retries_image:
-        retry_count_image += 1
-        print(f"Mencoba panggil Gemini API OCR (percobaan ke-{retry_count_image})... (Mode: {BOT_MODE})") # Log retry attempt buat OCR gambar
-
-        try: # --- TRY BLOCK BUAT OCR GAMBAR (DI DALAM LOOP RETRY!) ---
-            # --- EKSTRAKSI TEKS DARI GAMBAR PAKE GEMINI API OCR! ---
-            img = Image.open(image_path)
-            vision_model = genai.GenerativeModel('gemini-2.0-flash')
-            # image_prompt = "Tolong ekstrak teks yang ada di gambar ini. Kalo ada teks copywriting atau pesan marketing, sebutkan juga."
-            image_prompt = "Lo itu seorang yang Graphic Designer dan Copywriter dengan pengalaman lebih dari 10 tahun. Lo juga orang yang sering nge-roasting desain dan copywriting yang aneh-aneh dengan gaya lo yang asik, friendly. Ga cuma roasting, lo juga suka ngasih edukasi ke orang-orang gimana benernya. Nah, sekarang gue mau lo roasting gambar ini dari segi visual dan copywriting-nya, straight to the point aja kayak lo lagi nongkrong santuy terus ada temen lo nunjukkin desain dan copywriting dia di gambar itu. Hasil roasting-nya langsung plaintext aja, ga usah pake format markdown"
-            response = vision_model.generate_content(
-                [image_prompt, img]
-            )
-            image_ocr_result = response.text
-
-            if image_ocr_result:
-                print(f"Hasil OCR Gemini API:\n{image_ocr_result}")
-
-                response_roast_image = image_ocr_result
-                gemini_roast_image = response_roast_image
-
-                if gemini_roast_image:
-                    formatted_roast_image = gemini_roast_image # Hasil roast Gemini (plaintext, sesuai gaya bot lo)
-                    # --- INCREMENT USAGE COUNT USER! ---
-                    increment_usage_count(user.id) # Tetap increment usage_count yang lama (untuk roast teks)
-                    increment_image_usage_count(user.id) # <----- INCREMENT IMAGE USAGE COUNT!
-                    # --- INCREMENT USAGE COUNT USER! ---
-                    increment_usage_count(user.id)
-                    await context.bot.delete_message(
-                        chat_id=update.message.chat_id,
-                        message_id=initial_message.message_id
-                    )
-                    await update.message.reply_text(formatted_roast_image)
-                    break  # <----- BREAK LOOP RETRY KALO SUKSES ROAST GAMBAR!
-
-                else: # Gemini gagal kasih roast gambar (response kosong, tapi bukan error API)
-                    await update.message.reply_text("Waduh, Gemini kayaknya speechless ngeroast gambar copywriting lo! 🤔 Coba gambar lain deh.")
-                    break # <----- BREAK LOOP RETRY, GAK PERLU RETRY KALO ROAST GEMINI KOSONG!
-
-            else: # Gemini gagal OCR gambar (response OCR kosong, tapi bukan error API)
-                await update.message.reply_text("Hmm, Gemini gagal fokus baca teks dari gambar lo. 😫 Coba gambar yang lebih jelas atau teksnya jangan terlalu kecil.")
-                break # <----- BREAK LOOP RETRY, GAK PERLU RETRY KALO OCR GEMINI KOSONG!
-
-
-        except Exception as e: # --- CATCH ERROR DI DALAM LOOP RETRY ---
-            print(f"Error komunikasi sama Gemini OCR (percobaan ke-{retry_count_image}): {e} (Mode: {BOT_MODE})") # Log error OCR gambar (UPDATE PESAN ERROR LOG!)
-            if retry_count_image < max_retries_image: # Kalo masih ada kesempatan retry
-                await context.bot.edit_message_text(
-                    chat_id=update.message.chat_id,
-                    message_id=initial_message.message_id,
-                    text=f"Waduh, mesin roast gambar mode *{BOT_MODE}* kayaknya lagi ngambek dikit... 😪\nGue coba sekali lagi ya... (percobaan ke-{retry_count_image + 1})" # Pesan editan, info retry gambar (UPDATE PESAN EDITAN!)
-                )
-                time.sleep(retry_delay_image) # Tunggu sebentar sebelum retry
-                continue # Lanjut ke awal loop retry lagi
-            else: # Kalo udah maksimal retry, keluar dari loop (kirim roast cadangan)
-                print(f"Semua percobaan retry OCR gambar gagal. Kirim roast cadangan gambar (Mode: {BOT_MODE}).") # Log roast cadangan gambar
-                await context.bot.edit_message_text(
-                    chat_id=update.message.chat_id,
-                    message_id=initial_message.message_id,
-                    text="Waduh, mesin roast gambar lagi ngambek! 😭 Sabar ya, lagi diperbaiki nih..." # Pesan error editan gambar (UPDATE PESAN EDITAN ERROR!)
-                )
-                # fallback_roast_image udah diinisialisasi di luar loop, jadi bisa langsung dipake
-
-        finally: # <----- FINALLY BLOCK (DI DALAM LOOP RETRY, SETELAH TRY-EXCEPT)!
-            try:
-                os.remove(image_path) # Hapus file gambar yang udah didownload
-                print(f"File gambar {image_path} berhasil dihapus.")
-            except Exception as e:
-                print(f"Error menghapus file gambar {image_path}: {e}")
-
-
-    # --- KIRIM GAMBAR YANG DI-ROAST + CAPTION (DI LUAR LOOP RETRY, SETELAH FINALLY BLOCK LOOP)! ---
-    # PENTING: formatted_roast_image & fallback_roast_image udah diinisialisasi di luar loop, jadi pasti punya nilai (None atau string roast)
-    # await update.message.reply_photo(photo=file_id, caption="Nih gambar copywriting lo abis di-roast! 🔥\n\n" + (formatted_roast_image if formatted_roast_image else fallback_roast_image)) # Kirim gambar + caption roast (pake formatted_roast_image kalo ada, fallback_roast_image kalo error)
+    async with chat_actions.keep(context.bot, update.message.chat_id): # "Typing" dari mulai download sampe roast-nya jadi
+        # --- Download Gambar ke Memory (sekali aja, dipake ulang di setiap retry) ---
+        with metrics.span("load_photo"):
+            loaded = await asyncio.gather(*(image_pipeline.load_photo(context.bot, photo) for photo in photos), return_exceptions=True) # Foto album di-download barengan
+        images = [image for image in loaded if not isinstance(image, Exception)]
+        for error in loaded:
+            if isinstance(error, Exception): # Download gagal atau gambarnya nggak bisa di-decode
+                logger.error("Error download/decode gambar: %s (Mode: %s).", error, mode)
+        if not images: # Nggak ada satu pun yang kebaca: kirim roast cadangan
+            metrics.ROASTS.inc(path="image", outcome="fallback")
+            await update.message.reply_text(fallback_roast_image)
+            return
+        images = [image for image in images if not image.blank] # Gambar polos nggak usah dikirim ke Gemini
+        if not images:
+            metrics.ROASTS.inc(path="image", outcome="blank")
+            await update.message.reply_text(BLANK_IMAGE_TEXT)
+            return
+
+        # --- Cek Cache Lagi Pake Perceptual Hash (foto hampir sama yang baru dikirim: di-screenshot/kompres ulang) ---
+        similar_key = roast_cache.image_key("phash:" + "+".join(
+            f"{duplicate_images.canonical(user.id, image.phash):016x}" for image in images
+        ))
+        cached_roast = await response_cache.lookup(similar_key)
+        if cached_roast:
+            response_cache.put(cache_key, cached_roast) # Forward berikutnya langsung kena tanpa download
+            await reply_cached(cached_roast)
+            return
+        image_payloads = [image.payload for image in images]
+        if len(image_payloads) > 1:
+            placeholder_text = f"{len(image_payloads)} gambar copywriting lo udah gue terima nih! Bentar ya, gue bedah sekaligus... 🧐"
+        else:
+            placeholder_text = "Gambar copywriting lo udah gue terima nih! Bentar ya, lagi gue bedah... 🧐"
+        initial_message = await update.message.reply_text(placeholder_text)
+        lifecycle.track_placeholder(context.bot, update.message.chat_id, initial_message.message_id) # Diganti info retry kalo kepotong shutdown
+
+        try:
+            async with admission.admit(user.id, **queue_hooks(context, initial_message, placeholder_text)):
+                image_ocr_result = await gemini_retry_policy.run(generate_image_roast, on_retry=notify_retry)
+        except AdmissionRejected:
+            logger.info("Request roast gambar User ID %s ditolak admission control.", user.id)
+            metrics.ROASTS.inc(path="image", outcome="rejected")
+            image_ocr_result = None
+            final_text = REJECTED_TEXT
+        except Exception as e:
+            logger.error("Semua percobaan retry OCR gambar gagal: %s. Kirim roast cadangan gambar (Mode: %s).", e, mode) # Log roast cadangan gambar
+            metrics.ROASTS.inc(path="image", outcome="fallback")
+            image_ocr_result = None
+            final_text = fallback_roast_image # Gantiin pesan awal, bukan pesan baru
+        else: # Kalo kosong: Gemini gagal OCR/roast gambar (response kosong, tapi bukan error API)
+            metrics.ROASTS.inc(path="image", outcome="ok" if image_ocr_result else "empty")
+            final_text = image_ocr_result or "Hmm, Gemini gagal fokus baca teks dari gambar lo. 😫 Coba gambar yang lebih jelas atau teksnya jangan terlalu kecil."
+
+    if image_ocr_result:
+        logger.debug("Hasil OCR Gemini API:\n%s", image_ocr_result)
+        # --- INCREMENT USAGE COUNT USER! ---
+        storage.increment_usage_count(user.id) # Tetap increment usage_count yang lama (untuk roast teks)
+        storage.increment_image_usage_count(user.id) # <----- INCREMENT IMAGE USAGE COUNT!
+        # --- INCREMENT USAGE COUNT USER! ---
+        storage.increment_usage_count(user.id)
+        response_cache.put(cache_key, image_ocr_result) # Simpen buat gambar yang sama
+        response_cache.put(similar_key, image_ocr_result) # ...dan buat gambar yang mirip
+        if streaming.STREAMING_ENABLED: # Kalo streaming, roast-nya udah tampil di pesan awal
+            lifecycle.forget_placeholder()
+            return
+    await outbound.deliver(context.bot, update.message.chat_id, initial_message.message_id, final_text) # Satu edit, bukan delete + reply
+    lifecycle.forget_placeholder()
 
 
 # --- 5. Error Handler (Optional - Add for better bot stability) ---
 async def error_handler(update: ContextTypes.DEFAULT_TYPE, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Log the error and send a telegram message to notify the developer."""
     # Log the error in your preferred way (e.g., to a file, database, or logging service)
-    print(f"Update {update} caused error {context.error}")
+    logger.error("Update %s caused error %s", update, context.error, exc_info=context.error)
     # Optionally, you can send a message to the user or a developer group if critical errors occur
 
-# async def webhook_handler(request: web.Request) -> web.Response: # <---- FUNGSI WEBHOOK HANDLER BARU!
-#     """Set route /telegram to receive updates."""
-#     update = telegram.Update.de_json(data=await request.json(), bot=application.bot)
-#     await application.process_update(update)
-#     return web.Response()
-
 # --- 6. Main Function ---
-def main() -> None:
-    """Start the bot and setup database."""
-    create_database_and_table() # <----- PANGGIL FUNGSI CREATE DATABASE DI MAIN()
-    global application
-    """Start the bot."""
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build() # Use Application.builder()
+def build_application() -> Application:
+    """Builds the Application and registers all handlers."""
+    update_queue = DurableUpdateQueue() # Update disimpen ke SQLite dulu sebelum webhook bales 200 (lihat durable_queue.py)
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .base_url(outbound.API_BASE_URL)
+        .base_file_url(outbound.API_FILE_URL)
+        .request(outbound.build_request()) # Connection pool keep-alive yang di-tune (lihat outbound.py)
+        .update_queue(update_queue)
+        .concurrent_updates(ChatOrderedUpdateProcessor(int(os.getenv("CONCURRENT_UPDATES", "64")), jobs=update_queue, batcher=batching.UpdateBatcher())) # Banyak chat diproses barengan, tapi update di satu chat tetep urut; foto satu album digabung
+        .post_init(post_init) # Buka koneksi database sekali pas start
+        .post_shutdown(post_shutdown) # Flush counter & tutup database pas shutdown
+        .build()
+    ) # Use Application.builder()
 
     # Command Handlers
     application.add_handler(CommandHandler("start", start))
@@ -493,6 +507,7 @@ def main() -> None:
     application.add_handler(CommandHandler("mode_solusi", mode_solusi)) # Tambahkan handler untuk /mode solusi
     application.add_handler(CommandHandler("tentang", about)) # <----- TAMBAH COMMAND HANDLER /ABOUT DI MAIN()
     application.add_handler(CommandHandler("info_akun", myaccount)) # <----- TAMBAH COMMAND HANDLER /MYACCOUNT DI MAIN()
+    application.add_handler(CommandHandler("peringkat", leaderboard)) # Top user + statistik harian
 
     # Message Handler (for all text messages that are not commands)
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, roast_copywriting)) # Sudah disesuaikan filters
@@ -500,35 +515,55 @@ def main() -> None:
 
     # Error Handler (optional but recommended)
     application.add_error_handler(error_handler)
+    startup.mark("build")
+    return application
+
+# --- ASGI (WEBHOOK_INGRESS=asgi): dipake platform serverless / `uvicorn main:app` ---
+app = ingress.ASGIApp(build_application, f"/{WEBHOOK_PATH}", FULL_WEBHOOK_URL, telegram.Update.ALL_TYPES) # Application-nya baru dibikin pas startup/request pertama
+
+def main() -> None:
+    """Start the bot."""
+    webhook_path = WEBHOOK_PATH
+    full_webhook_url = FULL_WEBHOOK_URL
 
-    # Start the Bot
-    # application.run_polling(allowed_updates=telegram.Update.ALL_TYPES) # Specify allowed_updates for clarity
-    
-    # # --- JALANKAN BOT DENGAN WEBHOOK DI VERCEL! ---
-    # print("Bot berjalan dalam mode Webhook di Vercel!") # Log info webhook mode
-    # global app
-    # app = web.Application() # <----- PAKE web.Application()
-    # app.router.add_post("/telegram", webhook_handler) # <---- DAFTAR PATH /TELEGRAM BUAT WEBHOOK
-    # runner = web.AppRunner(app) # <----- PAKE web.AppRunner()
-    # await runner.setup() # <----- AWAIT runner.setup()
-    # site = web.TCPSite(runner, "0.0.0.0", port=int(os.environ.get("PORT", 8080))) # <----- PAKE web.TCPSite()
-    # await site.start() # <----- AWAIT site.start()
-    # await asyncio.Event().wait() # Keep app running
-
-    WEBHOOK_URL = "https://kopiwraiting-bot-webhook.vercel.app/"
-    # --- JALANKAN BOT DENGAN WEBHOOK SECARA LOKAL! ---
-    # print("Bot berjalan dalam mode Webhook LOKAL!") # Info mode lokal
-    webhook_path = TELEGRAM_BOT_TOKEN
-    full_webhook_url = f"{WEBHOOK_URL}/{webhook_path}"
-    # logger.info(f"Mendaftarkan webhook di: {full_webhook_url}")
-    
     # Jalankan webhook
     # Parameter:
     # - listen: alamat IP lokal yang didengarkan (misalnya 0.0.0.0)
     # - port: port untuk menerima koneksi (misalnya 8443 atau sesuai dengan variabel lingkungan PORT)
     # - url_path: path pada URL webhook (disini menggunakan token bot)
     # - webhook_url: URL publik lengkap yang akan didaftarkan ke Telegram
-    application.run_webhook(
+    if sys.argv[1:] == ["set-webhook"]: # Buat step deploy (WEBHOOK_SETUP=never): daftarin webhook sekali, bukan tiap cold start
+        asyncio.run(scaling.ensure_webhook(full_webhook_url, telegram.Update.ALL_TYPES, setup="always"))
+        return
+
+    if ingress.INGRESS in ("ptb", "asgi"): # --- SERVER WEBHOOK BAWAAN PTB / ASGI (lihat ingress.py) ---
+        run = scaling.run_ptb if ingress.INGRESS == "ptb" else scaling.run_asgi
+        run(
+            build_application,
+            listen="0.0.0.0",
+            port=int(os.getenv("PORT", "8443")),
+            url_path=webhook_path,
+            webhook_url=full_webhook_url,
+            allowed_updates=telegram.Update.ALL_TYPES
+        )
+        return
+
+    num_workers = int(os.getenv("BOT_WORKERS", "1"))
+    if num_workers > 1: # --- MODE SCALE-OUT: N worker process di belakang satu endpoint webhook ---
+        scaling.run_scaled(
+            build_application,
+            num_workers,
+            listen="0.0.0.0",
+            port=int(os.getenv("PORT", "8443")),
+            url_path=webhook_path,
+            webhook_url=full_webhook_url,
+            allowed_updates=telegram.Update.ALL_TYPES
+        )
+        return
+
+    # --- MODE SATU PROSES: webhook + /metrics di server aiohttp yang sama (lihat scaling.py) ---
+    scaling.run_single(
+        build_application,
         listen="0.0.0.0",
         port=int(os.getenv("PORT", "8443")),
         url_path=webhook_path,
@@ -539,4 +574,3 @@ def main() -> None:
 
 if __name__ == "__main__":
     main()
-    # asyncio.run(main())
@@ -0,0 +1,255 @@
+"""In-process metrics (counters, gauges, latency histograms) and optional per-update trace spans.
+
+Semua angka dikumpulin di memory proses ini dan di-render dalam format teks
+Prometheus di endpoint ``/metrics`` (sebelahan sama path webhook). Di mode
+scale-out tiap worker nge-render punyanya sendiri (pake label ``worker``),
+terus proses front ngegabungin semuanya jadi satu halaman.
+"""
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import logging
+import os
+import time
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+TRACE_ENABLED = os.getenv("METRICS_TRACE", "0") == "1"  # Log durasi tiap langkah per update (level DEBUG)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)  # Batas bucket histogram (detik)
+LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))  # Seberapa sering lag event loop diukur (detik)
+
+logger = logging.getLogger(__name__)
+
+
+def _label_text(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{n}="{v}"' for (n, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # tuple nilai label -> nilai
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} butuh label {self.labelnames}, dapetnya {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collect(self):
+        """Yields ``(suffix, label values, extra labels, value)`` samples."""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonic counter, optionally split by labels."""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        for key, value in self._values.items():
+            yield "", key, (), value
+
+
+class Gauge(_Metric):
+    """Point-in-time value; either ``set`` directly or read from ``func`` at render time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), func=None):
+        super().__init__(name, documentation, labelnames)
+        self.func = func
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def collect(self):
+        if self.func is not None:
+            try:
+                yield "", (), (), self.func()
+            except Exception as e:  # Sumber datanya udah ditutup (misal pas shutdown)
+                logger.debug("Gauge %s gagal dibaca: %s", self.name, e)
+            return
+        for key, value in self._values.items():
+            yield "", key, (), value
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram for latencies (seconds)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        series = self._values.get(key)
+        if series is None:
+            series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]  # [hitungan per bucket, sum, count]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observes how long the block took (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels):
+        series = self._values.get(self._key(labels))
+        return series[2] if series else 0
+
+    def collect(self):
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                yield "_bucket", key, (("le", _format_value(bound)),), cumulative
+            yield "_sum", key, (), total
+            yield "_count", key, (), count
+
+
+class Registry:
+    """Holds metrics by name and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing  # Modul yang di-import ulang/dipanggil dua kali dapet metric yang sama
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), func=None):
+        gauge = self._register(Gauge(name, documentation, labelnames))
+        if func is not None:
+            gauge.func = func  # Sumber terbaru yang menang (misal Application baru setelah restart)
+        return gauge
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self, const_labels=()):
+        """Returns every metric as Prometheus exposition text; ``const_labels`` go on every sample."""
+        const_labels = tuple(const_labels)
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, key, extra, value in metric.collect():
+                labels = _label_text(metric.labelnames, key, (*const_labels, *extra))
+                lines.append(f"{metric.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def merge_expositions(texts):
+    """Merges Prometheus texts from several processes, keeping each metric family together."""
+    families = {}  # nama -> [baris HELP/TYPE, baris sample]
+    for text in texts:
+        current = None
+        for line in text.splitlines():
+            if line.startswith("# HELP ") or line.startswith("# TYPE "):
+                name = line.split(" ", 3)[2]
+                current = families.setdefault(name, [[], []])
+                if line not in current[0]:
+                    current[0].append(line)
+            elif line and current is not None:
+                current[1].append(line)
+    return "".join("\n".join(header + samples) + "\n" for header, samples in families.values())
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+render = REGISTRY.render
+
+# --- Metric Hot Path ---
+GEMINI_LATENCY = histogram("gemini_request_seconds", "Durasi satu percobaan panggilan Gemini.", ("path", "mode"))
+GEMINI_RETRIES = counter("gemini_retries_total", "Percobaan ulang panggilan Gemini.", ("path",))
+ROASTS = counter("roasts_total", "Roast yang dibales, per hasil (ok, cached, fallback, empty, rejected).", ("path", "outcome"))
+SQLITE_LATENCY = histogram("sqlite_op_seconds", "Durasi operasi SQLite (termasuk antri di thread executor).", ("db", "op"),
+                           buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5))
+TELEGRAM_LATENCY = histogram("telegram_api_seconds", "Durasi panggilan Bot API Telegram.", ("method",))
+TELEGRAM_ERRORS = counter("telegram_api_errors_total", "Panggilan Bot API Telegram yang gagal.", ("method",))
+EVENT_LOOP_LAG = histogram("event_loop_lag_seconds", "Telatnya event loop bangun dari sleep (kerjaan yang nge-block loop).",
+                           buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5))
+
+
+async def monitor_event_loop(interval=LOOP_LAG_INTERVAL):
+    """Samples event-loop lag forever: how much later than asked a ``sleep(interval)`` wakes up."""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - start - interval))
+
+
+# --- Trace Span (opsional) ---
+
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+@contextlib.contextmanager
+def trace_update(update_id):
+    """Collects ``span``s recorded while handling one update and logs them at the end.
+
+    No-op unless ``METRICS_TRACE=1`` and DEBUG logging is enabled.
+    """
+    if not (TRACE_ENABLED and logger.isEnabledFor(logging.DEBUG)):
+        yield
+        return
+    spans = []
+    token = _trace.set(spans)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _trace.reset(token)
+        logger.debug("trace update=%s total=%.3fs %s", update_id, time.perf_counter() - start,
+                     " ".join(f"{name}={duration:.3f}s" for name, duration in spans))
+
+
+@contextlib.contextmanager
+def span(name):
+    """Records how long the block took in the current update's trace (if one is active)."""
+    spans = _trace.get()
+    if spans is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans.append((name, time.perf_counter() - start))
@@ -0,0 +1,150 @@
+"""Routes Gemini calls across model tiers: a cheap fast model, the primary model and a fallback.
+
+Roast teks pendek dikirim ke model yang lebih murah/cepet. Kalo model yang
+dipilih kena 429, timeout atau error server, panggilan langsung dioper ke
+model berikutnya (tanpa backoff) sebelum nyerah ke retry policy. Tiap model
+punya circuit breaker, EWMA latency & error rate sendiri, jadi model yang
+lagi lemot/error otomatis turun urutan.
+"""
+import asyncio
+import logging
+import os
+import time
+
+import metrics
+from retry_policy import CircuitBreaker, CircuitOpenError, is_retryable
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+PRIMARY_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")  # Model utama (teks panjang & gambar)
+FAST_MODEL = os.getenv("GEMINI_FAST_MODEL", "gemini-2.0-flash-lite")  # Model murah buat teks pendek, kosong = mati
+FALLBACK_MODEL = os.getenv("GEMINI_FALLBACK_MODEL", "gemini-1.5-flash")  # Model cadangan pas yang lain 429/timeout, kosong = mati
+FAST_MAX_CHARS = int(os.getenv("GEMINI_FAST_MAX_CHARS", "280"))  # Copywriting sependek ini boleh ke model murah
+FAILOVER_TIMEOUT = float(os.getenv("GEMINI_FAILOVER_TIMEOUT", "15"))  # Timeout per model kalo masih ada model cadangan (detik)
+EWMA_ALPHA = 0.2  # Bobot sampel terbaru buat rata-rata latency & error rate
+DEGRADED_ERROR_RATE = 0.5  # Model dengan error rate di atas ini dicoba paling belakang
+
+logger = logging.getLogger(__name__)
+
+MODEL_LATENCY = metrics.histogram("gemini_model_seconds", "Latency panggilan Gemini yang sukses per model.", ("model",))
+MODEL_ERRORS = metrics.counter("gemini_model_errors_total", "Panggilan Gemini yang gagal per model.", ("model", "error"))
+FAILOVERS = metrics.counter("gemini_failovers_total", "Panggilan yang dioper ke model berikutnya.", ("source", "target"))
+
+
+class ModelRoute:
+    """Health of one model: its own circuit breaker plus moving averages of latency and errors."""
+
+    def __init__(self, name, breaker=None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = None  # EWMA detik, None = belum ada sampel
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+
+    @property
+    def degraded(self):
+        return self.breaker.state != "closed" or self.error_rate > DEGRADED_ERROR_RATE
+
+    def record_success(self, elapsed):
+        self.calls += 1
+        self.latency = elapsed if self.latency is None else self.latency + EWMA_ALPHA * (elapsed - self.latency)
+        self.error_rate -= EWMA_ALPHA * self.error_rate
+        self.breaker.record_success()
+        MODEL_LATENCY.observe(elapsed, model=self.name)
+
+    def record_failure(self, error):
+        self.calls += 1
+        self.errors += 1
+        self.error_rate += EWMA_ALPHA * (1 - self.error_rate)
+        self.breaker.record_failure()
+        MODEL_ERRORS.inc(model=self.name, error=type(error).__name__)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency": None if self.latency is None else round(self.latency, 3),
+            "error_rate": round(self.error_rate, 3),
+            "breaker": self.breaker.state,
+        }
+
+
+class ModelRouter:
+    """Picks the model order for a request and fails over between models within one attempt.
+
+    Empty model names switch a tier off; duplicates collapse into one route.
+    """
+
+    def __init__(self, primary=PRIMARY_MODEL, fast=FAST_MODEL, fallback=FALLBACK_MODEL,
+                 fast_max_chars=FAST_MAX_CHARS, failover_timeout=FAILOVER_TIMEOUT):
+        self.primary = primary
+        self.fast = fast or None
+        self.fallback = fallback or None
+        self.fast_max_chars = fast_max_chars
+        self.failover_timeout = failover_timeout
+        self.routes = {name: ModelRoute(name) for name in (primary, self.fast, self.fallback) if name}
+
+    @property
+    def model_names(self):
+        """Every routed model name, primary first (the order models get built in)."""
+        return list(self.routes)
+
+    def candidates(self, text_length=None):
+        """Returns the routes to try, in order, for a text of ``text_length`` chars (``None`` = image).
+
+        Short text prefers the fast model unless it has turned out slower than
+        the primary. Degraded models (breaker not closed, high error rate) move
+        to the back.
+        """
+        names = [self.primary, self.fallback]
+        if self.fast and text_length is not None and text_length <= self.fast_max_chars:
+            fast, primary = self.routes[self.fast], self.routes[self.primary]
+            if fast.latency is None or primary.latency is None or fast.latency <= primary.latency:
+                names.insert(0, self.fast)
+            else:
+                names.insert(1, self.fast)
+        routes = [self.routes[name] for name in dict.fromkeys(names) if name]
+        return sorted(routes, key=lambda route: route.degraded)  # Stabil: urutan preferensi tetep kejaga
+
+    async def run(self, call, timeout, text_length=None):
+        """Awaits ``call(model_name, timeout)`` on each candidate model until one succeeds.
+
+        Transient errors (429, 5xx, timeouts) fail over to the next model;
+        permanent errors are raised at once. Every model but the last gets at
+        most ``failover_timeout`` seconds. Raises the last error (or
+        ``CircuitOpenError`` when every model's breaker is open).
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        routes = self.candidates(text_length)
+        last_error = CircuitOpenError("Semua model Gemini lagi di-skip circuit breaker")
+        previous = None
+        for index, route in enumerate(routes):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            if not route.breaker.allow():
+                continue
+            if previous is not None:
+                FAILOVERS.inc(source=previous.name, target=route.name)
+                logger.warning("Model %s gagal (%s), oper ke %s.", previous.name, last_error, route.name)
+            attempt_timeout = remaining if index == len(routes) - 1 else min(remaining, self.failover_timeout)
+            started = time.monotonic()
+            try:
+                result = await call(route.name, attempt_timeout)
+            except asyncio.CancelledError:
+                route.breaker.release_trial()
+                raise
+            except Exception as e:
+                if not is_retryable(e):
+                    route.breaker.record_success()  # Error permanen (misal konten diblok) bukan tanda modelnya down
+                    raise
+                route.record_failure(e)
+                last_error, previous = e, route
+                continue
+            route.record_success(time.monotonic() - started)
+            return result
+        raise last_error
+
+    def stats(self):
+        return {name: route.stats() for name, route in self.routes.items()}
@@ -0,0 +1,121 @@
+"""Outbound Telegram layer for the roast flow: fewer, cheaper Bot API calls.
+
+Tiap panggilan Bot API itu satu round trip HTTPS dan kehitung ke flood limit
+Telegram, jadi di sini chat action "typing" cuma dikirim sama satu task
+keep-alive per chat, placeholder diganti roast-nya lewat satu edit (bukan
+delete + reply), dan semua request lewat satu connection pool yang di-tune.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+
+import telegram
+from telegram.request import HTTPXRequest
+
+import metrics
+from streaming import MAX_MESSAGE_LENGTH, StreamingReply, split_point
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+CHAT_ACTION_INTERVAL = 4.5  # Status "typing" di Telegram ilang setelah ~5 detik, jadi dikirim ulang sebelum itu
+POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "64"))  # Koneksi HTTP keep-alive ke api.telegram.org
+CONNECT_TIMEOUT = float(os.getenv("TELEGRAM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("TELEGRAM_READ_TIMEOUT", "10"))
+WRITE_TIMEOUT = float(os.getenv("TELEGRAM_WRITE_TIMEOUT", "10"))
+POOL_TIMEOUT = float(os.getenv("TELEGRAM_POOL_TIMEOUT", "5"))  # Nunggu koneksi kosong di pool
+HTTP_VERSION = os.getenv("TELEGRAM_HTTP_VERSION", "1.1")  # "2" butuh paket h2
+API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")  # Ganti kalo pake Bot API server sendiri (atau server palsu di bench/)
+API_FILE_URL = os.getenv("TELEGRAM_API_FILE_URL", "https://api.telegram.org/file/bot")
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """``HTTPXRequest`` that records latency and failures per Bot API method."""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        try:
+            with metrics.TELEGRAM_LATENCY.time(method=api_method), metrics.span(api_method):
+                code, payload = await super().do_request(url, method, *args, **kwargs)
+        except Exception:
+            metrics.TELEGRAM_ERRORS.inc(method=api_method)
+            raise
+        if code >= 400:
+            metrics.TELEGRAM_ERRORS.inc(method=api_method)
+        return code, payload
+
+
+def build_request(pool_size=POOL_SIZE):
+    """Returns the pooled, keep-alive ``HTTPXRequest`` used for all Bot API calls."""
+    return InstrumentedRequest(
+        connection_pool_size=pool_size,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        write_timeout=WRITE_TIMEOUT,
+        pool_timeout=POOL_TIMEOUT,
+        http_version=HTTP_VERSION,
+    )
+
+
+class ChatActionKeeper:
+    """Keeps one chat action alive per chat with a single background task.
+
+    Every roast in a chat holds the action via ``keep(bot, chat_id)``; the
+    first holder starts the task, the last one to leave stops it, so
+    overlapping roasts and retries never send extra chat actions.
+    """
+
+    def __init__(self, interval=CHAT_ACTION_INTERVAL, action=telegram.constants.ChatAction.TYPING):
+        self.interval = interval
+        self.action = action
+        self._tasks = {}  # chat_id -> [task keep-alive, jumlah yang lagi pake]
+
+    def __len__(self):
+        return len(self._tasks)
+
+    @contextlib.asynccontextmanager
+    async def keep(self, bot, chat_id):
+        entry = self._tasks.get(chat_id)
+        if entry is None:
+            entry = self._tasks[chat_id] = [asyncio.create_task(self._keep_alive(bot, chat_id)), 0]
+        entry[1] += 1
+        try:
+            yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                entry[0].cancel()
+                del self._tasks[chat_id]
+
+    async def _keep_alive(self, bot, chat_id):
+        while True:
+            delay = self.interval
+            try:
+                await bot.send_chat_action(chat_id=chat_id, action=self.action)
+            except telegram.error.RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                delay = max(delay, retry_after)
+            except telegram.error.TelegramError as e:
+                logger.warning("Error kirim chat action ke chat %s: %s", chat_id, e)
+            await asyncio.sleep(delay)
+
+
+async def deliver(bot, chat_id, message_id, text, max_length=MAX_MESSAGE_LENGTH):
+    """Turns the placeholder message into the final text with one edit.
+
+    Text longer than one message continues in new messages. If the
+    placeholder can't be edited anymore (e.g. deleted), the text is sent as
+    new messages instead.
+    """
+    reply = StreamingReply(bot, chat_id, message_id, edit_interval=0, max_length=max_length)
+    try:
+        await reply.append(text)
+        await reply.finish()
+    except telegram.error.BadRequest as e:
+        logger.warning("Gagal edit placeholder %s, kirim pesan baru: %s", message_id, e)
+        await reply.discard()  # Buang lanjutan yang udah sempet kekirim biar teksnya nggak dobel
+        while text:
+            cut = split_point(text, max_length)
+            await bot.send_message(chat_id=chat_id, text=text[:cut])
+            text = text[cut:]
@@ -0,0 +1,260 @@
+"""Prompt registry: Gemini instructions built once at startup, user input trimmed to a token budget.
+
+Instruksi tiap mode (persona, aturan gaya, format output) dipasang sebagai
+``system_instruction`` di model-nya sendiri, jadi yang dikirim per pesan cuma
+copywriting user-nya. Copywriting yang kepanjangan dipotong di tengah (awal
+& akhirnya dipertahanin, biasanya headline & CTA) sampe muat di budget token.
+Opsional: instruksinya disimpen di context cache Gemini (``GEMINI_CONTEXT_CACHE=1``).
+"""
+import asyncio
+import datetime
+import inspect
+import logging
+import os
+import time
+
+import metrics
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+MAX_INPUT_TOKENS = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "1500"))  # Budget token copywriting user per roast
+MIN_CHARS_PER_TOKEN = 2.0  # Teks sependek budget * ini pasti muat, nggak perlu nanya token counter
+ESTIMATED_CHARS_PER_TOKEN = 4.0  # Perkiraan kasar kalo token counter-nya gagal
+TRUNCATION_MARKER = "\n[...]\n"
+CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE", "0") == "1"  # Cuma jalan kalo model & panjang instruksinya didukung Gemini
+CONTEXT_CACHE_TTL = float(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))  # Umur cache (detik), diperpanjang otomatis
+
+logger = logging.getLogger(__name__)
+
+PROMPTS_TRIMMED = metrics.counter("prompt_input_trimmed_total", "Copywriting yang dipotong karena lewat budget token.")
+
+_PERSONA = """
+    Lo adalah seorang stand up komedi dengan pengalaman lebih dari 10 tahun. Spesialis lo adalah di roasting. Lo paling bisa kalo soal roasting. Ga cuma itu, lo juga ahli dalam copywriting sembari lo jadi stand up komedian. Nah sekarang lo ditugasin buat roasting-in hasil copywriting orang.
+"""
+
+_INSTRUCTIONS = {
+    "pedas": _PERSONA + """
+    Lo ga perlu mikirin solusi, lo cukup kasih roasting-an sebagai hiburan. Anggep aja lo sekarang lagi di tongkrongan terus ada temen lo nunjukkin copywriting-nya!
+
+    Lo ga usah intro, langsung kasih roasting pake bahasa sehari-hari yang gaul & friendly kayak lo gue gitu, ga usah formal.
+
+    Lo ga perlu pake format markdown, kasih aja output lo dalam plaintext.
+    """,
+    "solusi": _PERSONA + """
+    Karena situasinya lo lagi ditongkrongan sama temen lu yang minta roasting-in copywriting-nya, selain ngasih roasting, lo kasih saran dan solusi juga sekalian ngebuktiin (pamer) skill lo dibidang copywriting yang udah 10 tahun itu.
+
+    Lo ga usah intro, kasih roasting & saran pake bahasa sehari-hari yang gaul & friendly kayak lo gue gitu, ga usah formal.
+
+    Lo ga perlu pake format markdown, kasih aja output lo dalam plaintext.
+    """,
+    "image": """
+    Lo itu seorang yang Graphic Designer dan Copywriter dengan pengalaman lebih dari 10 tahun. Lo juga orang yang sering nge-roasting desain dan copywriting yang aneh-aneh dengan gaya lo yang asik, friendly. Ga cuma roasting, lo juga suka ngasih edukasi ke orang-orang gimana benernya.
+
+    Tugas lo: roasting gambar yang dikirim dari segi visual dan copywriting-nya, straight to the point aja kayak lo lagi nongkrong santuy terus ada temen lo nunjukkin desain dan copywriting dia di gambar itu. Hasil roasting-nya langsung plaintext aja, ga usah pake format markdown.
+    """,
+}
+
+_INSTRUCTIONS["album"] = _INSTRUCTIONS["image"]
+
+_TEMPLATES = {
+    "pedas": 'Nih teks copywriting-nya:\n"{copy}"',
+    "solusi": 'Nih teks Copywriting-nya:\n"{copy}"',
+    "image": "Roasting gambar ini.",
+    "album": "Ini {count} gambar dari satu postingan (carousel/album), urut dari slide pertama. Roasting sebagai satu kesatuan: visual, copywriting, dan alur antar slide-nya.",
+    None: 'Roast copywriting ini: "{copy}"',  # Mode tidak dikenal (fallback, jaga-jaga error)
+}
+
+
+def clean(text):
+    """Strips the source indentation and surrounding blank lines from a prompt literal."""
+    return inspect.cleandoc(text)
+
+
+def truncate_middle(text, max_chars, marker=TRUNCATION_MARKER):
+    """Shortens ``text`` to about ``max_chars`` by cutting the middle at word boundaries.
+
+    Keeps roughly the first 70% and last 30%: for copywriting that's the
+    headline/hook and the call to action.
+    """
+    if len(text) <= max_chars:
+        return text
+    keep = max(0, max_chars - len(marker))
+    head_size = int(keep * 0.7)
+    tail_size = keep - head_size
+    head = text[:head_size]
+    space = head.rfind(" ", head_size // 2)
+    if space != -1:
+        head = head[:space]
+    tail = text[len(text) - tail_size:] if tail_size else ""
+    space = tail.find(" ", 0, tail_size // 2)
+    if space != -1:
+        tail = tail[space + 1:]
+    return head.rstrip() + marker + tail.lstrip()
+
+
+class Prompt:
+    """One mode's system instruction, user template and the models configured with it (one per model name)."""
+
+    __slots__ = ("name", "system_instruction", "template", "models", "caches")
+
+    def __init__(self, name, system_instruction, template, models):
+        self.name = name
+        self.system_instruction = system_instruction
+        self.template = template
+        self.models = models  # nama model -> model dengan system_instruction ini (urutan pertama = default)
+        self.caches = {}  # nama model -> (CachedContent, model dari cache, kadaluarsa)
+
+    def render(self, copy="", **fields):
+        """Returns the per-message user text (the instructions live in the model)."""
+        return self.template.format(copy=copy, **fields)
+
+    def model(self, model_name=None):
+        """Returns the model for ``model_name`` (default: the first one), from the context cache while it's fresh."""
+        model_name = model_name or next(iter(self.models))
+        cached = self.caches.get(model_name)
+        if cached is not None and time.time() < cached[2] - 60:  # Hampir/udah kadaluarsa: balik ke model biasa
+            return cached[1]
+        return self.models[model_name]
+
+
+class PromptRegistry:
+    """Builds every mode's prompt and models once; ``get(mode)`` never formats instructions again.
+
+    ``model_factory`` is ``genai.GenerativeModel`` (or a stand-in), called as
+    ``model_factory(model_name, system_instruction=...)`` for every model name.
+    Pass ``loader`` instead to defer that: it's called once in a thread by
+    ``load()`` and returns the factory (e.g. after importing the Gemini SDK).
+    """
+
+    def __init__(self, model_factory=None, model_names=(), max_input_tokens=MAX_INPUT_TOKENS, loader=None):
+        self.model_factory = None
+        self.model_names = [model_names] if isinstance(model_names, str) else list(dict.fromkeys(model_names))
+        self.max_input_tokens = max_input_tokens
+        self.loader = loader
+        self._prompts = {}
+        self._loading = None
+        self._refresh_task = None
+        if model_factory is not None:
+            self._build(model_factory)
+
+    @property
+    def loaded(self):
+        return bool(self._prompts)
+
+    async def load(self):
+        """Runs ``loader`` and builds the models in a thread on first call; later calls return at once."""
+        if self._prompts:
+            return
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(asyncio.to_thread(lambda: self._build(self.loader())))
+        loading = self._loading
+        try:
+            await asyncio.shield(loading)  # Yang nunggu di-cancel nggak ngebatalin load buat yang lain
+        except Exception:
+            if self._loading is loading:
+                self._loading = None  # Gagal: panggilan berikutnya nyoba load ulang
+            raise
+
+    def _build(self, model_factory):
+        prompts = {}
+        models = {}  # Mode dengan instruksi sama (image & album) pake model yang sama
+        for name, template in _TEMPLATES.items():
+            instruction = clean(_INSTRUCTIONS[name]) if name in _INSTRUCTIONS else None
+            if instruction not in models:
+                models[instruction] = {
+                    model_name: model_factory(model_name, system_instruction=instruction) if instruction else model_factory(model_name)
+                    for model_name in self.model_names
+                }
+            prompts[name] = Prompt(name, instruction, template, models[instruction])
+        self.model_factory = model_factory
+        self._prompts = prompts  # Sekali assign: thread loader nggak pernah kelihatan setengah jadi
+
+    def get(self, mode):
+        """Returns the prompt for a bot mode (``"pedas"``, ``"solusi"``, ``"image"``), or the fallback prompt.
+
+        With a ``loader``, ``await load()`` first.
+        """
+        return self._prompts.get(mode) or self._prompts[None]
+
+    async def fit(self, text, client):
+        """Returns ``text`` trimmed to ``max_input_tokens`` using the model's token counter.
+
+        Short texts skip the counter entirely; if counting fails, a character
+        estimate is used instead.
+        """
+        if len(text) <= self.max_input_tokens * MIN_CHARS_PER_TOKEN:
+            return text
+        try:
+            tokens = await client.count_tokens(text, model=self._prompts[None].model())
+        except Exception as e:
+            logger.warning("Gagal ngitung token, pake perkiraan: %s", e)
+            tokens = len(text) / ESTIMATED_CHARS_PER_TOKEN
+        if tokens <= self.max_input_tokens:
+            return text
+        PROMPTS_TRIMMED.inc()
+        logger.info("Copywriting %d token dipotong ke budget %d token.", tokens, self.max_input_tokens)
+        return truncate_middle(text, int(len(text) * self.max_input_tokens / tokens * 0.95))
+
+    # --- Context Cache (opsional) ---
+
+    async def enable_context_cache(self, ttl=CONTEXT_CACHE_TTL):
+        """Moves each instruction into a Gemini context cache where the model/API accepts it.
+
+        Gemini only caches content above a minimum size and only for some
+        model versions; prompts it refuses keep using ``system_instruction``.
+        """
+        from google.generativeai import caching
+
+        for instruction, prompts in self._by_instruction().items():
+            names = "/".join(p.name for p in prompts)
+            for model_name in self.model_names:
+                try:
+                    cache = await asyncio.to_thread(
+                        caching.CachedContent.create,
+                        model=model_name,
+                        display_name=f"roast-{prompts[0].name}",
+                        system_instruction=instruction,
+                        ttl=datetime.timedelta(seconds=ttl),
+                    )
+                except Exception as e:
+                    logger.info("Context cache buat prompt '%s' (%s) nggak dipake: %s", names, model_name, e)
+                    continue
+                entry = (cache, self.model_factory.from_cached_content(cache), time.time() + ttl)
+                for prompt in prompts:  # Mode dengan instruksi sama cukup satu cache
+                    prompt.caches[model_name] = entry
+                logger.info("Prompt '%s' (%s) pake context cache %s.", names, model_name, cache.name)
+        if any(p.caches for p in self._prompts.values()):
+            self._refresh_task = asyncio.create_task(self._refresh_context_cache(ttl))
+
+    def _by_instruction(self):
+        groups = {}
+        for prompt in self._prompts.values():
+            if prompt.system_instruction:
+                groups.setdefault(prompt.system_instruction, []).append(prompt)
+        return groups
+
+    async def _refresh_context_cache(self, ttl):
+        while True:
+            await asyncio.sleep(ttl / 2)
+            for prompts in self._by_instruction().values():
+                for model_name, (cache, model, _) in list(prompts[0].caches.items()):
+                    try:
+                        await asyncio.to_thread(cache.update, ttl=datetime.timedelta(seconds=ttl))
+                    except Exception as e:
+                        logger.warning("Gagal perpanjang context cache prompt '%s' (%s): %s", prompts[0].name, model_name, e)
+                        continue
+                    for prompt in prompts:
+                        prompt.caches[model_name] = (cache, model, time.time() + ttl)
+
+    async def close(self):
+        """Stops the cache refresh and deletes the context caches (they cost storage while alive)."""
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        for prompts in self._by_instruction().values():
+            for model_name, (cache, _, _) in prompts[0].caches.items():
+                try:
+                    await asyncio.to_thread(cache.delete)
+                except Exception as e:
+                    logger.warning("Gagal hapus context cache prompt '%s' (%s): %s", prompts[0].name, model_name, e)
+            for prompt in prompts:
+                prompt.caches = {}
@@ -0,0 +1,146 @@
+"""Async retry policy (exponential backoff + jitter) and circuit breaker for Gemini calls."""
+import asyncio
+import os
+import random
+import time
+
+from google.api_core import exceptions as google_exceptions
+
+from gemini_client import GeminiTimeoutError
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))  # Maksimal percobaan per request
+BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))  # Delay awal backoff (detik)
+MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "8"))  # Batas atas delay backoff (detik)
+DEADLINE = float(os.getenv("RETRY_DEADLINE", "60"))  # Total waktu maksimal per request, termasuk semua retry (detik)
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))  # Gagal berturut-turut sebelum circuit kebuka
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("BREAKER_RECOVERY_TIMEOUT", "30"))  # Lama circuit kebuka sebelum dicoba lagi (detik)
+
+# Error yang layak di-retry: rate limit (429), error server (5xx), timeout & koneksi putus
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServerError,
+    google_exceptions.DeadlineExceeded,
+    GeminiTimeoutError,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised when the circuit breaker is open and calls are short-circuited."""
+
+
+def is_retryable(error):
+    """Returns True for transient errors (429, 5xx, timeouts), False for permanent ones."""
+    return isinstance(error, RETRYABLE_ERRORS)
+
+
+class CircuitBreaker:
+    """Opens after consecutive transient failures so callers can go straight to the fallback.
+
+    After ``recovery_timeout`` seconds the breaker lets one trial call through
+    (half-open); a success closes it again, a failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, recovery_timeout=BREAKER_RECOVERY_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.failure_count = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.recovery_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """Returns True when a call may go through."""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial_in_progress:
+            self._trial_in_progress = True  # Cuma satu percobaan yang boleh lewat pas half-open
+            return True
+        return False
+
+    def release_trial(self):
+        """Frees the half-open trial slot without counting a success or failure (e.g. cancelled call)."""
+        self._trial_in_progress = False
+
+    def record_success(self):
+        self.failure_count = 0
+        self.opened_at = None
+        self._trial_in_progress = False
+
+    def record_failure(self):
+        self.failure_count += 1
+        self._trial_in_progress = False
+        if self.opened_at is not None or self.failure_count >= self.failure_threshold:
+            self.opened_at = time.monotonic()  # Buka (lagi) circuit-nya
+
+
+class RetryPolicy:
+    """Retries an async call with exponential backoff, jitter and a total deadline."""
+
+    def __init__(self, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY, max_delay=MAX_DELAY, deadline=DEADLINE, breaker=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.breaker = breaker
+
+    def backoff_delay(self, attempt):
+        """Delay after the given (1-based) failed attempt, with equal jitter."""
+        delay = min(self.max_delay, self.base_delay * (2 ** (attempt - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def run(self, func, on_retry=None):
+        """Runs ``await func(timeout)`` until it succeeds or retries are exhausted.
+
+        ``timeout`` is the time left before the deadline. ``on_retry(attempt,
+        error, delay)`` is awaited before each backoff sleep. Permanent errors
+        are raised immediately; after the last attempt the last error is raised.
+        Raises ``CircuitOpenError`` without calling ``func`` when the breaker is open.
+        """
+        started = time.monotonic()
+        attempt = 0
+
+        while True:
+            if self.breaker and not self.breaker.allow():
+                raise CircuitOpenError("Circuit breaker Gemini lagi kebuka")
+
+            attempt += 1
+            remaining = self.deadline - (time.monotonic() - started)
+            try:
+                result = await func(remaining)
+            except asyncio.CancelledError:
+                if self.breaker:
+                    self.breaker.release_trial()  # Dibatalin dari luar (shutdown/timeout), bukan tanda Gemini sehat/down
+                raise
+            except Exception as e:
+                retryable = is_retryable(e)
+                if self.breaker:
+                    if retryable:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()  # Error permanen bukan tanda Gemini down
+                if not retryable or attempt >= self.max_attempts:
+                    raise
+
+                delay = self.backoff_delay(attempt)
+                if time.monotonic() - started + delay >= self.deadline:
+                    raise  # Nggak cukup waktu buat retry sebelum deadline
+                if on_retry:
+                    await on_retry(attempt, e, delay)
+                await asyncio.sleep(delay)  # Non-blocking, chat lain tetep diproses
+                continue
+
+            if self.breaker:
+                self.breaker.record_success()
+            return result
@@ -0,0 +1,231 @@
+"""Content-addressed cache for Gemini roasts.
+
+Copywriting/gambar yang sama nggak perlu dikirim ulang ke Gemini: hasil roast
+disimpen di memory (LRU + TTL + batas memory), opsional di-backup ke SQLite
+biar tetep ada setelah restart.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import hashlib
+import logging
+import os
+import random
+import re
+import sqlite3
+import time
+
+import metrics
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+CACHE_TTL = float(os.getenv("ROAST_CACHE_TTL", str(7 * 24 * 3600)))  # Umur entry cache (detik), default 7 hari
+CACHE_MAX_ENTRIES = int(os.getenv("ROAST_CACHE_MAX_ENTRIES", "5000"))  # Maksimal jumlah key di memory
+CACHE_MAX_BYTES = int(os.getenv("ROAST_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))  # Batas memory teks roast (byte)
+CACHE_MAX_VARIANTS = int(os.getenv("ROAST_CACHE_MAX_VARIANTS", "3"))  # Maksimal variasi roast per key
+CACHE_REFRESH_PROBABILITY = float(os.getenv("ROAST_CACHE_REFRESH_PROBABILITY", "0.2"))  # Peluang bikin variasi baru pas hit
+CACHE_DB_FILE = os.getenv("ROAST_CACHE_DB", "")  # Kosong = cache cuma di memory
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    """Normalizes copywriting so trivial differences (case, spacing) hit the same entry."""
+    return _WHITESPACE_RE.sub(" ", text).strip().casefold()
+
+
+def text_key(mode, text):
+    """Cache key for a text roast in the given bot mode."""
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"text:{mode}:{digest}"
+
+
+def image_key(image_id):
+    """Cache key for an image roast (Telegram ``file_unique_id`` or an image hash)."""
+    return f"image:{image_id}"
+
+
+class _Entry:
+    __slots__ = ("variants", "expires_at", "size", "last_served")
+
+    def __init__(self, expires_at):
+        self.variants = []
+        self.expires_at = expires_at
+        self.size = 0
+        self.last_served = None
+
+
+class RoastCache:
+    """LRU + TTL roast cache with a memory cap, hit/miss counters and optional SQLite backing.
+
+    Each key holds up to ``max_variants`` different roasts; ``get`` serves a
+    random one (avoiding the one served last) so repeats don't look canned.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+                 max_variants=CACHE_MAX_VARIANTS, refresh_probability=CACHE_REFRESH_PROBABILITY, db_file=CACHE_DB_FILE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_variants = max_variants
+        self.refresh_probability = refresh_probability
+        self.db_file = db_file
+        self.hits = 0
+        self.misses = 0
+        self.total_bytes = 0
+        self._entries = collections.OrderedDict()
+        self._conn = None
+        self._executor = None
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        """Returns cache counters as a dictionary."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hit_ratio,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+        }
+
+    # --- Lookup ---
+
+    def get(self, key):
+        """Returns a cached roast for the key, or None on a miss.
+
+        Occasionally reports a miss for keys that still have room for more
+        variants, so the caller generates (and ``put``s) a fresh roast.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.time():
+            self._remove(key)
+            entry = None
+
+        if entry is None or (len(entry.variants) < self.max_variants and random.random() < self.refresh_probability):
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)  # Tandain paling baru dipake (LRU)
+        self.hits += 1
+        choices = [v for v in entry.variants if v != entry.last_served] or entry.variants
+        entry.last_served = random.choice(choices)
+        return entry.last_served
+
+    async def lookup(self, key):
+        """Like ``get``, but on a memory miss also checks the on-disk backing.
+
+        The backing file can be shared by several worker processes, so a roast
+        cached by one worker is found by the others.
+        """
+        if key in self._entries or self._executor is None:
+            return self.get(key)
+
+        loop = asyncio.get_running_loop()
+        with metrics.SQLITE_LATENCY.time(db="roast_cache", op="read"):
+            rows = await loop.run_in_executor(self._executor, self._read, key)
+        for roast, expires_at in rows:
+            self.put(key, roast, persist=False, expires_at=expires_at)
+        return self.get(key)
+
+    def put(self, key, roast, persist=True, expires_at=None):
+        """Stores a roast variant for the key.
+
+        ``expires_at`` overrides the entry's expiry (used when loading from disk).
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry(time.time() + self.ttl)
+        if expires_at is not None:
+            entry.expires_at = expires_at
+        self._entries.move_to_end(key)
+        if roast in entry.variants:
+            return
+
+        if len(entry.variants) >= self.max_variants:
+            dropped = entry.variants.pop(0)  # Buang variasi paling lama
+            entry.size -= len(dropped.encode("utf-8"))
+            self.total_bytes -= len(dropped.encode("utf-8"))
+        size = len(roast.encode("utf-8"))
+        entry.variants.append(roast)
+        entry.size += size
+        self.total_bytes += size
+        self._evict()
+
+        if persist and self._executor is not None:
+            self._executor.submit(self._write, key, roast, entry.expires_at)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.total_bytes -= entry.size
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            self._remove(next(iter(self._entries)))  # Key paling lama nggak dipake
+
+    # --- SQLite Backing (opsional) ---
+
+    def start(self):
+        """Opens the on-disk backing (if configured) and warms the memory cache from it."""
+        if not self.db_file:
+            return
+        if os.path.dirname(self.db_file):
+            os.makedirs(os.path.dirname(self.db_file), exist_ok=True)
+        try:
+            self._conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")  # Aman dipake bareng beberapa worker process
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS roast_cache (
+                    cache_key TEXT NOT NULL,
+                    roast TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    PRIMARY KEY (cache_key, roast)
+                )
+            """)
+            self._conn.execute("DELETE FROM roast_cache WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+            rows = self._conn.execute(
+                "SELECT cache_key, roast, expires_at FROM roast_cache ORDER BY expires_at ASC"
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Error buka cache roast di %s: %s", self.db_file, e)
+            self._conn = None
+            return
+
+        for cache_key, roast, expires_at in rows:
+            self.put(cache_key, roast, persist=False, expires_at=expires_at)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="roast-cache")
+        logger.info("Cache roast dimuat dari disk: %d key.", len(self._entries))
+
+    def _read(self, key):
+        try:
+            return self._conn.execute(
+                "SELECT roast, expires_at FROM roast_cache WHERE cache_key = ? AND expires_at > ?",
+                (key, time.time()),
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Error baca cache roast dari disk: %s", e)
+            return []
+
+    def _write(self, key, roast, expires_at):
+        try:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO roast_cache (cache_key, roast, expires_at) VALUES (?, ?, ?)",
+                    (key, roast, expires_at),
+                )
+        except sqlite3.Error as e:
+            logger.error("Error nyimpen cache roast ke disk: %s", e)
+
+    def close(self):
+        """Waits for pending disk writes and closes the backing database."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,347 @@
+"""Webhook server, single-process or multi-process scale-out.
+
+Mode satu proses: server aiohttp nerima webhook, ``/healthz`` dan ``/metrics``
+langsung di proses bot (pilihan ingress lain ada di ``ingress``). Mode
+scale-out: satu proses "front" nerima webhook dari Telegram, terus nerusin
+tiap update ke salah satu dari N worker process. Pilihan
+worker-nya berdasarkan chat_id, jadi update dari chat yang sama selalu ke
+worker yang sama (urutannya kejaga). Semua state bareng (user, counter, mode,
+cache) lewat SQLite mode WAL yang aman diakses banyak proses.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import signal
+
+import aiohttp
+import telegram
+from aiohttp import web
+
+import ingress
+import lifecycle
+import metrics
+import outbound
+import startup
+from ingress import METRICS_CONTENT_TYPE, METRICS_PATH
+from update_processor import KeyedLocks
+
+WORKER_BASE_PORT = int(os.getenv("BOT_WORKER_BASE_PORT", "9100"))  # Worker ke-i dengerin di port BASE + i (localhost)
+WORKER_RESTART_DELAY = 2.0  # Jeda sebelum worker yang mati dinyalain lagi (detik)
+FORWARD_TIMEOUT = 10.0  # Timeout nerusin update ke worker (detik)
+WORKER_STOP_TIMEOUT = lifecycle.DRAIN_TIMEOUT + 15  # Drain + flush/close sebelum worker di-kill
+SHARED_CACHE_DB = "data/roast_cache.db"  # Cache roast dibagi antar worker lewat SQLite kalo ROAST_CACHE_DB belum diatur
+WEBHOOK_SETUP = os.getenv("WEBHOOK_SETUP", "auto")  # auto = setWebhook cuma kalo setelannya berubah, always, never (didaftarin pas deploy)
+WEBHOOK_STAMP_FILE = os.getenv("WEBHOOK_STAMP_FILE", "data/webhook.stamp")  # Fingerprint setelan webhook terakhir yang didaftarin
+
+logger = logging.getLogger(__name__)
+
+_CHAT_PATHS = (
+    ("message", "chat"),
+    ("edited_message", "chat"),
+    ("channel_post", "chat"),
+    ("edited_channel_post", "chat"),
+    ("my_chat_member", "chat"),
+    ("chat_member", "chat"),
+    ("chat_join_request", "chat"),
+)
+
+
+def routing_key(data):
+    """Extracts the chat id (or user id) used to pin an update to a worker from raw update JSON."""
+    for field, chat_field in _CHAT_PATHS:
+        if field in data:
+            return data[field][chat_field]["id"]
+    for value in data.values():
+        if isinstance(value, dict):
+            if isinstance(value.get("message"), dict):
+                return value["message"]["chat"]["id"]  # callback_query
+            if isinstance(value.get("from"), dict):
+                return value["from"]["id"]  # inline_query, poll_answer, dst.
+    return data.get("update_id", 0)
+
+
+async def _wait_for_stop_signal():
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+    await stop_event.wait()
+
+
+async def _set_webhook(webhook_url, allowed_updates, secret_token=None):
+    try:
+        async with telegram.Bot(os.environ["TELEGRAM_BOT_TOKEN"], base_url=outbound.API_BASE_URL) as bot:
+            await bot.set_webhook(url=webhook_url, allowed_updates=allowed_updates, secret_token=secret_token or None)
+    except telegram.error.TelegramError as e:
+        logger.error("Error daftarin webhook ke Telegram: %s", e)
+        return False
+    return True
+
+
+def webhook_fingerprint(webhook_url, allowed_updates, secret_token=None):
+    """Hash of the webhook settings; a changed URL, update list or secret means ``setWebhook`` has to run again."""
+    settings = [webhook_url, sorted(allowed_updates or [])]
+    if secret_token:
+        settings.append(hashlib.sha256(secret_token.encode("utf-8")).hexdigest())  # Secret-nya sendiri nggak ditulis ke disk
+    return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()
+
+
+async def ensure_webhook(webhook_url, allowed_updates, setup=None, stamp_file=None, secret_token=None):
+    """Registers the webhook with Telegram unless that's known to be done already.
+
+    ``setup`` is ``"auto"`` (skip when ``stamp_file`` holds the same
+    fingerprint), ``"always"`` or ``"never"`` (the deploy registers it, e.g.
+    ``python main.py set-webhook``). ``secret_token`` defaults to
+    ``ingress.WEBHOOK_SECRET``. Returns True when ``setWebhook`` was called and succeeded.
+    """
+    setup = setup or WEBHOOK_SETUP
+    stamp_file = stamp_file or WEBHOOK_STAMP_FILE
+    secret_token = ingress.WEBHOOK_SECRET if secret_token is None else secret_token
+    if setup == "never":
+        return False
+    fingerprint = webhook_fingerprint(webhook_url, allowed_updates, secret_token)
+    if setup == "auto":
+        try:
+            with open(stamp_file) as f:
+                if f.read().strip() == fingerprint:
+                    logger.debug("Webhook udah terdaftar dengan setelan yang sama, setWebhook di-skip.")
+                    return False
+        except OSError:
+            pass  # Belum pernah didaftarin dari sini
+    if not await _set_webhook(webhook_url, allowed_updates, secret_token):
+        return False
+    try:
+        if os.path.dirname(stamp_file):
+            os.makedirs(os.path.dirname(stamp_file), exist_ok=True)
+        with open(stamp_file, "w") as f:
+            f.write(fingerprint)
+    except OSError as e:  # Filesystem read-only (serverless): start berikutnya daftar ulang, nggak masalah
+        logger.debug("Gagal nyimpen stamp webhook: %s", e)
+    logger.info("Webhook didaftarin ke Telegram.")
+    return True
+
+
+# --- Worker Process (juga dipake buat mode satu proses) ---
+
+def _worker_main(build_application, index, port):
+    os.environ["BOT_WORKER_INDEX"] = str(index)  # Tiap worker punya file antrian update sendiri
+    asyncio.run(_serve_application(build_application, "127.0.0.1", port, "/update", worker=index))
+
+
+async def _serve_application(build_application, listen, port, update_path, worker=None, webhook_url=None, allowed_updates=None):
+    application = build_application()
+    await lifecycle.start_application(application)
+    startup.mark("init")
+
+    # Update diproses sama update processor (urut per chat). Worker cuma nerima dari front, yang udah ngecek secret-nya
+    webhook = ingress.UpdateIngress(
+        ingress.application_deliver(application), ingress.application_health(application),
+        name="aiohttp", secret_token="" if worker is not None else ingress.WEBHOOK_SECRET,
+    )
+    const_labels = () if worker is None else (("worker", worker),)
+
+    async def serve_metrics(request):
+        return web.Response(text=metrics.render(const_labels), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+    app = web.Application(client_max_size=webhook.max_body)
+    ingress.add_aiohttp_routes(app, webhook, update_path)
+    app.router.add_get(METRICS_PATH, serve_metrics)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, listen, port).start()
+    startup.mark("serve")
+    startup.report()
+    webhook_task = None
+    if webhook_url:  # Di background: nggak nahan update pertama
+        webhook_task = asyncio.create_task(ensure_webhook(webhook_url, allowed_updates))
+    if worker is None:
+        logger.info("Webhook jalan di %s:%s (PID %s).", listen, port, os.getpid())
+    else:
+        logger.info("Worker %s siap di port %s (PID %s).", worker, port, os.getpid())
+
+    await _wait_for_stop_signal()
+
+    logger.info("Bot berhenti...")
+    if webhook_task:
+        webhook_task.cancel()
+    await runner.cleanup()  # Stop nerima update baru dulu
+    await lifecycle.stop_application(application)  # Drain roast yang lagi jalan, flush counter & tutup database
+
+
+# --- Front Process ---
+
+class WorkerPool:
+    """Spawns and supervises the worker processes."""
+
+    def __init__(self, build_application, num_workers, base_port=WORKER_BASE_PORT):
+        self.build_application = build_application
+        self.num_workers = num_workers
+        self.base_port = base_port
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = [None] * num_workers
+        self._stopping = False
+
+    def port(self, index):
+        return self.base_port + index
+
+    def alive(self):
+        """Number of worker processes currently running."""
+        return sum(1 for process in self._processes if process is not None and process.is_alive())
+
+    def start(self):
+        for index in range(self.num_workers):
+            self._spawn(index)
+
+    def _spawn(self, index):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.build_application, index, self.port(index)),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def supervise(self):
+        """Restarts workers that die unexpectedly."""
+        while not self._stopping:
+            await asyncio.sleep(WORKER_RESTART_DELAY)
+            for index, process in enumerate(self._processes):
+                if not self._stopping and not process.is_alive():
+                    logger.warning("Worker %s mati (exit code %s), dinyalain ulang...", index, process.exitcode)
+                    self._spawn(index)
+
+    async def stop(self, timeout=WORKER_STOP_TIMEOUT):
+        """Sends SIGTERM to every worker and waits for them to drain."""
+        self._stopping = True
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            await asyncio.to_thread(process.join, timeout)
+            if process.is_alive():
+                process.kill()
+
+
+async def _serve_front(pool, listen, port, url_path, webhook_url, allowed_updates):
+    session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=0),
+        timeout=aiohttp.ClientTimeout(total=FORWARD_TIMEOUT),
+    )
+
+    chat_locks = KeyedLocks()
+
+    async def forward_updates(items):
+        for item in items:
+            try:
+                key = routing_key(item)
+            except (AttributeError, KeyError, TypeError) as e:
+                logger.warning("Update nggak valid dari webhook: %s", e)
+                return 400
+            status = await forward_update(key, json.dumps(item))
+            if status != 200:
+                return status  # Telegram kirim ulang semuanya; yang udah nyampe di-dedupe antrian worker
+        return 200
+
+    async def forward_update(key, body):
+        index = key % pool.num_workers
+        # Satu update per chat yang lagi diterusin: update berikutnya dari chat yang
+        # sama baru jalan setelah worker nerima yang sebelumnya, jadi nggak bisa nyalip
+        async with chat_locks.hold(key):
+            try:
+                async with session.post(
+                    f"http://127.0.0.1:{pool.port(index)}/update",
+                    data=body,
+                    headers={"Content-Type": "application/json"},
+                ) as response:
+                    return response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # Worker lagi restart/macet: balikin 503 biar Telegram kirim ulang update-nya nanti
+                logger.warning("Gagal nerusin update ke worker %s: %r", index, e)
+                return 503
+
+    def health():
+        alive = pool.alive()
+        return alive > 0, {"workers": pool.num_workers, "alive": alive}
+
+    webhook = ingress.UpdateIngress(forward_updates, health, name="aiohttp-front")
+
+    async def fetch_worker_metrics(index):
+        try:
+            async with session.get(f"http://127.0.0.1:{pool.port(index)}{METRICS_PATH}") as response:
+                return await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning("Gagal ambil metrics worker %s: %r", index, e)
+            return ""  # Worker lagi restart: halaman tetep kebentuk dari worker lain
+
+    async def serve_metrics(request):
+        texts = await asyncio.gather(*(fetch_worker_metrics(i) for i in range(pool.num_workers)))
+        return web.Response(text=metrics.merge_expositions(texts), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+    app = web.Application(client_max_size=webhook.max_body)
+    ingress.add_aiohttp_routes(app, webhook, f"/{url_path.strip('/')}")
+    app.router.add_get(METRICS_PATH, serve_metrics)
+    runner = web.AppRunner(app, handle_signals=False)
+    await runner.setup()
+    await web.TCPSite(runner, listen, port).start()
+    startup.mark("serve")
+    startup.report()
+
+    webhook_task = asyncio.create_task(ensure_webhook(webhook_url, allowed_updates))
+    logger.info("Front webhook jalan di %s:%s dengan %s worker.", listen, port, pool.num_workers)
+
+    supervisor = asyncio.create_task(pool.supervise())
+    await _wait_for_stop_signal()
+
+    logger.info("Front webhook berhenti, nunggu worker selesai...")
+    webhook_task.cancel()
+    await runner.cleanup()
+    supervisor.cancel()
+    await pool.stop()
+    await session.close()
+
+
+def run_single(build_application, listen, port, url_path, webhook_url, allowed_updates=None):
+    """Runs the bot and its webhook + ``/metrics`` server in this process until SIGTERM/SIGINT."""
+    asyncio.run(_serve_application(
+        build_application, listen, port, f"/{url_path.strip('/')}", webhook_url=webhook_url, allowed_updates=allowed_updates
+    ))
+
+
+def run_ptb(build_application, listen, port, url_path, webhook_url, allowed_updates=None):
+    """Runs the bot behind PTB's built-in webhook server (``WEBHOOK_INGRESS=ptb``) until SIGTERM/SIGINT.
+
+    Needs ``python-telegram-bot[webhooks]``. PTB registers the webhook on every
+    start and has no ``/healthz``, ``/metrics``, body limit or drain deadline.
+    """
+    application = build_application()
+    application.run_webhook(
+        listen=listen,
+        port=port,
+        url_path=url_path,
+        webhook_url=webhook_url,
+        allowed_updates=allowed_updates,
+        secret_token=ingress.WEBHOOK_SECRET or None,
+    )
+
+
+def run_asgi(build_application, listen, port, url_path, webhook_url, allowed_updates=None):
+    """Serves ``ingress.ASGIApp`` with uvicorn (``WEBHOOK_INGRESS=asgi``) until SIGTERM/SIGINT."""
+    import uvicorn  # Opsional: cuma dibutuhin kalo ASGI-nya dijalanin dari sini, bukan dari platform serverless
+
+    app = ingress.ASGIApp(build_application, f"/{url_path.strip('/')}", webhook_url, allowed_updates)
+    uvicorn.run(app, host=listen, port=port, lifespan="on", log_level="warning")
+
+
+def run_scaled(build_application, num_workers, listen, port, url_path, webhook_url, allowed_updates=None):
+    """Runs the webhook front process plus ``num_workers`` worker processes until SIGTERM/SIGINT.
+
+    ``build_application`` must be a picklable module-level function that
+    returns a fully configured (not yet initialized) ``Application``.
+    """
+    os.environ.setdefault("ROAST_CACHE_DB", SHARED_CACHE_DB)  # Diwarisin ke worker, jadi cache-nya kebagi
+    pool = WorkerPool(build_application, num_workers)
+    pool.start()
+    asyncio.run(_serve_front(pool, listen, port, url_path, webhook_url, allowed_updates))
@@ -0,0 +1,51 @@
+"""Startup timing report: how long each cold-start phase (imports, build, init, serve) took.
+
+Di-import paling awal di ``main.py``, jadi fase ``import`` ngukur semua import
+modul bot. Hasilnya di-log sekali pas bot siap nerima update, plus diekspos di
+/metrics (``startup_phase_seconds``).
+"""
+import logging
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STARTUP_PHASES = metrics.gauge("startup_phase_seconds", "Durasi tiap fase startup (detik).", ("phase",))
+
+
+class StartupTimer:
+    """Records consecutive startup phases (``mark``) and side tasks measured separately (``record``)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = {}
+        self.reported = False
+
+    def mark(self, phase):
+        """Ends ``phase`` now: its duration is the time since the previous mark."""
+        now = time.perf_counter()
+        self.record(phase, now - self._last)
+        self._last = now
+
+    def record(self, phase, seconds):
+        """Records a phase that ran off the critical path (e.g. a background import)."""
+        self.phases[phase] = seconds
+        STARTUP_PHASES.set(seconds, phase=phase)
+
+    def report(self):
+        """Logs the startup breakdown once (later calls do nothing) and returns the total seconds."""
+        total = self._last - self.started
+        if not self.reported:
+            self.reported = True
+            STARTUP_PHASES.set(total, phase="total")
+            breakdown = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases.items())
+            logger.info("Startup %.0fms (%s).", total * 1000, breakdown)
+        return total
+
+
+TIMER = StartupTimer()
+mark = TIMER.mark
+record = TIMER.record
+report = TIMER.report
@@ -0,0 +1,484 @@
+"""Long-lived SQLite persistence layer for the bot.
+
+Satu koneksi SQLite (mode WAL) dipake terus selama proses hidup, semua query
+jalan di satu thread khusus biar event loop nggak ke-block, dan increment
+usage count ditampung dulu di memory terus di-flush per batch.
+"""
+import asyncio
+import atexit
+import collections
+import concurrent.futures
+import logging
+import os
+import pathlib
+import sqlite3
+import time
+
+import metrics
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+DATABASE_FILE = os.getenv("DATABASE_FILE", "data/users.db")  # Lokasi file database
+FLUSH_INTERVAL_MS = int(os.getenv("COUNTER_FLUSH_INTERVAL_MS", "2000"))  # Flush counter tiap N milidetik
+FLUSH_MAX_EVENTS = int(os.getenv("COUNTER_FLUSH_MAX_EVENTS", "100"))  # ...atau tiap N increment, mana yang duluan
+STATS_CACHE_SIZE = int(os.getenv("STATS_CACHE_SIZE", "100000"))  # Maksimal user yang statistiknya disimpen di memory
+STATS_CACHE_TTL = float(os.getenv("STATS_CACHE_TTL", "600"))  # Umur cache statistik user (detik), biar increment dari worker lain ikut kebaca
+LEADERBOARD_TTL = float(os.getenv("LEADERBOARD_TTL", "30"))  # Umur cache hasil /peringkat (detik)
+BUSY_TIMEOUT_MS = 5000  # Tunggu lock database maksimal 5 detik sebelum error
+
+logger = logging.getLogger(__name__)
+
+
+def _migrate_v1(conn):
+    """Users & per-chat mode tables (``IF NOT EXISTS``: database lama tanpa versi udah punya tabel ini)."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            join_time TEXT,
+            usage_count INTEGER DEFAULT 0
+        )
+    """)
+    # Mode bot disimpen per chat: di private chat sama aja dengan per user, di grup jadi mode grupnya
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_modes (
+            chat_id INTEGER PRIMARY KEY,
+            mode TEXT NOT NULL
+        )
+    """)
+
+
+def _migrate_v2(conn):
+    """Adds ``image_usage_count`` (database lama mungkin udah punya kolomnya dari ALTER yang dulu)."""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(users)")}
+    if "image_usage_count" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN image_usage_count INTEGER DEFAULT 0")
+
+
+def _migrate_v3(conn):
+    """Per-day usage events, daily rollups, running totals and the leaderboard index."""
+    # Event pemakaian di-bucket per hari per user (bukan satu baris per roast), ditulis bareng batch counter
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS usage_events (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            usage_count INTEGER NOT NULL DEFAULT 0,
+            image_usage_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, user_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_events_user ON usage_events (user_id, day)")
+    # Rollup harian diupdate di transaksi yang sama, jadi statistik nggak perlu scan tabel apa pun
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT PRIMARY KEY,
+            roasts INTEGER NOT NULL DEFAULT 0,
+            image_roasts INTEGER NOT NULL DEFAULT 0,
+            active_users INTEGER NOT NULL DEFAULT 0,
+            new_users INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    conn.execute("INSERT OR IGNORE INTO totals (name, value) SELECT 'users', COUNT(*) FROM users")  # Sekali scan pas migrasi
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_users_usage ON users (usage_count DESC)")  # Top N tanpa sort seluruh tabel
+
+
+def _today():
+    return time.strftime("%Y-%m-%d")  # Bucket harian, zona waktu lokal server (sama kayak join_time)
+
+
+_MIGRATIONS = [_migrate_v1, _migrate_v2, _migrate_v3]  # Index i = migrasi dari versi i ke i+1, cuma boleh ditambah di belakang
+SCHEMA_VERSION = len(_MIGRATIONS)
+
+
+class Storage:
+    """Persistent SQLite connection with an off-loop executor and a batched counter buffer."""
+
+    def __init__(self, database_file=DATABASE_FILE, flush_interval_ms=FLUSH_INTERVAL_MS, flush_max_events=FLUSH_MAX_EVENTS):
+        self.database_file = database_file
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_max_events = flush_max_events
+        self._conn = None
+        # Satu thread aja: semua akses ke koneksi otomatis berurutan, nggak perlu lock
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._pending = {}  # user_id -> [usage_count, image_usage_count] yang belum ditulis
+        self._pending_days = {}  # hari -> {user_id -> [usage_count, image_usage_count]} buat usage_events & rollup
+        self._pending_events = 0
+        # Reader terpisah (koneksi + thread sendiri): query statistik nggak pernah ngantri di belakang writer
+        self._reader = None
+        self._read_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-read")
+        self._stats = collections.OrderedDict()  # user_id -> [username, usage, image_usage, dimuat_kapan] (LRU)
+        self._stats_loads = {}  # user_id -> task yang lagi muat statistik user itu
+        self._load_deltas = {}  # user_id -> increment yang masuk selama statistiknya lagi dimuat
+        self._leaderboard = None  # (kadaluarsa, limit, hasil)
+        self._flush_task = None
+        self._periodic_task = None
+        self._writes = set()  # Batch counter yang lagi ditulis di executor
+
+    # --- Lifecycle ---
+
+    async def start(self):
+        """Opens the connection and starts the periodic counter flush."""
+        await self._run(self._open)
+        await self._read(self._open_reader)
+        self._periodic_task = asyncio.create_task(self._periodic_flush())
+        atexit.register(self._flush_at_exit)
+
+    async def close(self):
+        """Flushes buffered counters and closes the connection."""
+        if self._periodic_task:
+            self._periodic_task.cancel()
+            self._periodic_task = None
+        if self._writes:
+            await asyncio.wait(self._writes)  # Tunggu batch yang lagi jalan, jangan dibatalin
+        await self.flush()
+        await self._read(self._close_reader)
+        self._read_executor.shutdown(wait=True)
+        await self._run(self._close)
+        self._executor.shutdown(wait=True)
+        atexit.unregister(self._flush_at_exit)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        with metrics.SQLITE_LATENCY.time(db="users", op=func.__name__.strip("_")), metrics.span(f"sqlite{func.__name__}"):
+            return await loop.run_in_executor(self._executor, func, *args)
+
+    async def _read(self, func, *args):
+        loop = asyncio.get_running_loop()
+        with metrics.SQLITE_LATENCY.time(db="users", op=func.__name__.strip("_")), metrics.span(f"sqlite{func.__name__}"):
+            return await loop.run_in_executor(self._read_executor, func, *args)
+
+    def _open(self):
+        if os.path.dirname(self.database_file):
+            os.makedirs(os.path.dirname(self.database_file), exist_ok=True)
+        self._conn = sqlite3.connect(self.database_file, check_same_thread=False, timeout=BUSY_TIMEOUT_MS / 1000)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # Reader nggak nge-block writer & sebaliknya
+        self._conn.execute("PRAGMA synchronous=NORMAL")  # Aman buat WAL, fsync jauh lebih jarang
+        self._conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self._create_tables()
+
+    def _close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    def _open_reader(self):
+        # Read-only di mode WAL: baca snapshot terakhir yang udah commit, nggak pernah nunggu/nahan writer
+        uri = pathlib.Path(self.database_file).absolute().as_uri() + "?mode=ro"
+        self._reader = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                                       timeout=BUSY_TIMEOUT_MS / 1000)
+
+    def _close_reader(self):
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+
+    def _create_tables(self):
+        """Brings the schema up to ``SCHEMA_VERSION``; an up-to-date database costs one PRAGMA read."""
+        try:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version >= SCHEMA_VERSION:
+                logger.debug("Skema database udah versi %s.", version)
+                return
+            with self._conn:  # Satu transaksi: migrasi setengah jalan nggak bakal kesimpen
+                self._conn.execute("BEGIN")
+                for target, migrate in enumerate(_MIGRATIONS[version:], start=version + 1):
+                    migrate(self._conn)
+                    logger.info("Migrasi database ke versi %s selesai.", target)
+                self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+            logger.info("Database dan tabel 'users' berhasil dibuat/terhubung.")  # Log success
+        except sqlite3.Error as e:
+            logger.error("Error membuat database atau tabel: %s", e)  # Log error
+
+    # --- Users ---
+
+    async def add_user_to_database(self, user):
+        """Adds a new user to the database if they don't already exist.
+
+        Returns True if the user was added, False if they already existed or on error.
+        """
+        return await self._run(self._add_user, user.id, user.username)
+
+    def _add_user(self, user_id, username):
+        try:
+            join_time = time.strftime('%Y-%m-%dT%H:%M:%S')  # Format waktu join: YYYY-MM-DDTHH:MM:SS (ISO 8601)
+            with self._conn:
+                cursor = self._conn.execute("""
+                    INSERT OR IGNORE INTO users (user_id, username, join_time)
+                    VALUES (?, ?, ?)
+                """, (user_id, username, join_time))
+                if cursor.rowcount:  # Total & rollup user baru ikut di transaksi yang sama
+                    self._conn.execute("UPDATE totals SET value = value + 1 WHERE name = 'users'")
+                    self._conn.execute("""
+                        INSERT INTO daily_stats (day, new_users) VALUES (?, 1)
+                        ON CONFLICT(day) DO UPDATE SET new_users = new_users + 1
+                    """, (_today(),))
+            if cursor.rowcount == 0:
+                logger.debug("User ID %s sudah terdaftar di database.", user_id)  # Log kalo user udah ada
+                return False
+            logger.info("User baru %s (ID: %s) berhasil ditambahkan ke database.", username, user_id)  # Log user baru
+            return True
+        except sqlite3.Error as e:
+            logger.error("Error menambahkan user ke database: %s", e)
+            return False
+
+    async def get_user_account_data(self, user_id):
+        """Retrieves user account data (username, usage_count, image_usage_count).
+
+        Served from the in-memory stats cache when possible (no database
+        access); counters include increments that are still buffered. Returns
+        None if the user is not found or on error.
+        """
+        entry = self._stats.get(user_id)
+        if entry is not None and time.monotonic() - entry[3] < STATS_CACHE_TTL:
+            self._stats.move_to_end(user_id)
+            return {"username": entry[0], "usage_count": entry[1], "image_usage_count": entry[2]}
+        load = self._stats_loads.get(user_id)
+        if load is None:  # Satu query per user walau /info_akun-nya dateng barengan
+            load = self._stats_loads[user_id] = asyncio.ensure_future(self._load_stats(user_id))
+            load.add_done_callback(lambda _: self._stats_loads.pop(user_id, None))
+        return await asyncio.shield(load)
+
+    async def _load_stats(self, user_id):
+        # Yang belum ada di database pas query jalan: buffer saat ini (batch-nya pasti ditulis setelah query ini,
+        # karena writer cuma satu thread) + increment yang masuk selama query
+        usage_delta, image_usage_delta = self._pending.get(user_id, (0, 0))
+        self._load_deltas[user_id] = [0, 0]
+        try:
+            user_data = await self._run(self._get_user, user_id)
+        finally:
+            late_usage, late_image_usage = self._load_deltas.pop(user_id)
+        if user_data is None:
+            return None
+
+        user_data["usage_count"] += usage_delta + late_usage
+        user_data["image_usage_count"] += image_usage_delta + late_image_usage
+        self._stats[user_id] = [user_data["username"], user_data["usage_count"], user_data["image_usage_count"], time.monotonic()]
+        self._stats.move_to_end(user_id)
+        while len(self._stats) > STATS_CACHE_SIZE:
+            self._stats.popitem(last=False)
+        return user_data
+
+    def _get_user(self, user_id):
+        try:
+            row = self._conn.execute("""
+                SELECT username, usage_count, image_usage_count
+                FROM users
+                WHERE user_id = ?
+            """, (user_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Error mengambil data user dari database: %s", e)
+            return None
+
+        if row is None:
+            return None  # User tidak ditemukan
+        username, usage_count, image_usage_count = row
+        return {
+            "username": username,
+            "usage_count": usage_count,
+            "image_usage_count": image_usage_count
+        }
+
+    async def get_chat_mode(self, chat_id):
+        """Returns the chat's saved bot mode, or None if not set (or on error)."""
+        return await self._run(self._get_mode, chat_id)
+
+    def _get_mode(self, chat_id):
+        try:
+            row = self._conn.execute("SELECT mode FROM chat_modes WHERE chat_id = ?", (chat_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error("Error mengambil mode chat dari database: %s", e)
+            return None
+        return row[0] if row else None
+
+    async def set_chat_mode(self, chat_id, mode):
+        """Saves the chat's bot mode.
+
+        Returns True on success, False on error.
+        """
+        return await self._run(self._set_mode, chat_id, mode)
+
+    def _set_mode(self, chat_id, mode):
+        try:
+            with self._conn:
+                self._conn.execute("""
+                    INSERT INTO chat_modes (chat_id, mode)
+                    VALUES (?, ?)
+                    ON CONFLICT(chat_id) DO UPDATE SET mode = excluded.mode
+                """, (chat_id, mode))
+            logger.info("Mode Chat ID %s diganti ke '%s'.", chat_id, mode)
+            return True
+        except sqlite3.Error as e:
+            logger.error("Error menyimpan mode chat ke database: %s", e)
+            return False
+
+    # --- Counter Buffer ---
+
+    def increment_usage_count(self, user_id):
+        """Buffers a usage_count increment for the user (written on the next flush)."""
+        self._buffer_increment(user_id, 1, 0)
+
+    def increment_image_usage_count(self, user_id):
+        """Buffers an image_usage_count increment for the user (written on the next flush)."""
+        self._buffer_increment(user_id, 0, 1)
+
+    def _buffer_increment(self, user_id, usage_delta, image_usage_delta):
+        for counts in (self._pending.setdefault(user_id, [0, 0]),
+                       self._pending_days.setdefault(_today(), {}).setdefault(user_id, [0, 0])):
+            counts[0] += usage_delta
+            counts[1] += image_usage_delta
+        self._pending_events += 1
+        # Statistik di memory ikut naik langsung, /info_akun nggak perlu nunggu flush
+        cached = self._stats.get(user_id)
+        if cached is not None:
+            cached[1] += usage_delta
+            cached[2] += image_usage_delta
+        elif user_id in self._load_deltas:
+            late = self._load_deltas[user_id]
+            late[0] += usage_delta
+            late[1] += image_usage_delta
+
+        if self._pending_events >= self.flush_max_events and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def _periodic_flush(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Error flush usage count ke database: %s", e)
+
+    async def flush(self):
+        """Writes all buffered counter increments in a single transaction."""
+        if not self._pending or self._conn is None:
+            return
+        batch = (self._pending, self._pending_days)
+        self._pending, self._pending_days, self._pending_events = {}, {}, 0
+
+        # Batch langsung diantriin ke thread writer sebelum await apa pun: query yang dikirim
+        # setelah ini pasti udah lihat batch-nya (dipake _load_stats biar nggak ngitung dobel/kurang)
+        submitted = asyncio.get_running_loop().run_in_executor(self._executor, self._write_counters, batch)
+        # Penulisan batch jalan sebagai task sendiri dan di-shield: kalo yang nunggu
+        # di-cancel (misal pas shutdown), batch-nya tetep ditulis, nggak ilang di tengah jalan
+        write = asyncio.ensure_future(self._write_batch(batch, submitted))
+        self._writes.add(write)
+        write.add_done_callback(self._write_done)
+        await asyncio.shield(write)
+
+    def _write_done(self, write):
+        self._writes.discard(write)
+        if not write.cancelled() and write.exception() is not None:
+            logger.error("Error flush usage count ke database: %s", write.exception())
+
+    async def _write_batch(self, batch, submitted):
+        try:
+            with metrics.SQLITE_LATENCY.time(db="users", op="write_counters"):
+                await submitted
+        except Exception:
+            self._merge_back(batch)  # Balikin ke buffer biar nggak ilang, dicoba lagi di flush berikutnya
+            raise
+
+    def _write_counters(self, batch):
+        users, days = batch
+        with self._conn:  # Satu transaksi buat seluruh batch: counter user, event per hari & rollup-nya
+            self._conn.executemany("""
+                UPDATE users
+                SET usage_count = usage_count + ?,
+                    image_usage_count = image_usage_count + ?
+                WHERE user_id = ?
+            """, [(usage, image_usage, user_id) for user_id, (usage, image_usage) in users.items()])
+            for day, day_users in days.items():
+                # rowcount INSERT OR IGNORE = user yang baru aktif hari itu
+                new_active = self._conn.executemany(
+                    "INSERT OR IGNORE INTO usage_events (day, user_id) VALUES (?, ?)",
+                    [(day, user_id) for user_id in day_users],
+                ).rowcount
+                self._conn.executemany("""
+                    UPDATE usage_events
+                    SET usage_count = usage_count + ?,
+                        image_usage_count = image_usage_count + ?
+                    WHERE day = ? AND user_id = ?
+                """, [(usage, image_usage, day, user_id) for user_id, (usage, image_usage) in day_users.items()])
+                self._conn.execute("""
+                    INSERT INTO daily_stats (day, roasts, image_roasts, active_users) VALUES (?, ?, ?, ?)
+                    ON CONFLICT(day) DO UPDATE SET
+                        roasts = roasts + excluded.roasts,
+                        image_roasts = image_roasts + excluded.image_roasts,
+                        active_users = active_users + excluded.active_users
+                """, (day, sum(c[0] for c in day_users.values()), sum(c[1] for c in day_users.values()), new_active))
+        logger.debug("Usage count untuk %d user berhasil di-flush ke database.", len(users))
+
+    def _merge_back(self, batch):
+        users, days = batch
+        for user_id, (usage, image_usage) in users.items():
+            counts = self._pending.setdefault(user_id, [0, 0])
+            counts[0] += usage
+            counts[1] += image_usage
+            self._pending_events += 1
+        for day, day_users in days.items():
+            for user_id, (usage, image_usage) in day_users.items():
+                counts = self._pending_days.setdefault(day, {}).setdefault(user_id, [0, 0])
+                counts[0] += usage
+                counts[1] += image_usage
+
+    # --- Statistik & Peringkat (lewat reader, nggak pernah nunggu writer) ---
+
+    async def get_leaderboard(self, limit=10):
+        """Returns the top ``limit`` users by roast count as ``(user_id, username, usage_count)`` tuples.
+
+        Uses the ``usage_count`` index (no table scan) and is cached for
+        ``LEADERBOARD_TTL`` seconds; buffered increments show up after the next flush.
+        """
+        now = time.monotonic()
+        if self._leaderboard is not None and self._leaderboard[0] > now and self._leaderboard[1] >= limit:
+            return self._leaderboard[2][:limit]
+        rows = await self._read(self._top_users, limit)
+        self._leaderboard = (now + LEADERBOARD_TTL, limit, rows)
+        return rows
+
+    def _top_users(self, limit):
+        try:
+            return self._reader.execute("""
+                SELECT user_id, username, usage_count
+                FROM users
+                ORDER BY usage_count DESC
+                LIMIT ?
+            """, (limit,)).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Error mengambil peringkat user dari database: %s", e)
+            return []
+
+    async def get_usage_summary(self, days=7):
+        """Returns total users plus the daily rollups (newest first) of the last ``days`` days.
+
+        Only reads ``totals`` and ``daily_stats`` rows, so the cost doesn't grow with the user count.
+        """
+        return await self._read(self._usage_summary, days)
+
+    def _usage_summary(self, days):
+        try:
+            total = self._reader.execute("SELECT value FROM totals WHERE name = 'users'").fetchone()
+            rows = self._reader.execute("""
+                SELECT day, roasts, image_roasts, active_users, new_users
+                FROM daily_stats
+                ORDER BY day DESC
+                LIMIT ?
+            """, (days,)).fetchall()
+        except sqlite3.Error as e:
+            logger.error("Error mengambil statistik harian dari database: %s", e)
+            return None
+        return {
+            "total_users": total[0] if total else 0,
+            "days": [
+                {"day": day, "roasts": roasts, "image_roasts": image_roasts, "active_users": active, "new_users": new}
+                for day, roasts, image_roasts, active, new in rows
+            ],
+        }
+
+    def _flush_at_exit(self):
+        # Jaring pengaman kalo proses mati tanpa lewat close() (thread executor udah berhenti di titik ini)
+        if self._pending and self._conn is not None:
+            batch = (self._pending, self._pending_days)
+            self._pending, self._pending_days = {}, {}
+            self._write_counters(batch)
+            self._close()
@@ -0,0 +1,99 @@
+"""Progressive roast delivery: edit the placeholder message as Gemini streams text.
+
+Edit-nya di-throttle biar aman dari rate limit Telegram, dan kalo teksnya
+kepanjangan buat satu pesan, lanjut otomatis ke pesan baru.
+"""
+import asyncio
+import logging
+import os
+import time
+
+import telegram
+
+# --- Konfigurasi Default (bisa diatur lewat environment variables) ---
+STREAMING_ENABLED = os.getenv("ROAST_STREAMING", "0") == "1"  # Opt-in: kirim roast sambil jalan
+STREAM_EDIT_INTERVAL = float(os.getenv("ROAST_STREAM_EDIT_INTERVAL", "1.0"))  # Jarak minimal antar edit (detik)
+MAX_MESSAGE_LENGTH = telegram.constants.MessageLimit.MAX_TEXT_LENGTH  # 4096 karakter per pesan
+
+logger = logging.getLogger(__name__)
+
+
+def split_point(text, limit):
+    """Index to split ``text`` at so the first part fits ``limit``, preferring newlines/spaces."""
+    if len(text) <= limit:
+        return len(text)
+    for separator in ("\n", " "):
+        index = text.rfind(separator, limit // 2, limit)
+        if index != -1:
+            return index + 1
+    return limit
+
+
+class StreamingReply:
+    """Renders a growing text into ``message_id``, rolling over into new messages when full."""
+
+    def __init__(self, bot, chat_id, message_id, edit_interval=STREAM_EDIT_INTERVAL, max_length=MAX_MESSAGE_LENGTH):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.edit_interval = edit_interval
+        self.max_length = max_length
+        self.text = ""
+        self._message_ids = [message_id]  # Pesan pertama = placeholder "lagi digoreng"
+        self._offset = 0  # Awal teks yang masuk ke pesan terakhir
+        self._rendered = ""  # Teks yang terakhir ke-render di pesan terakhir
+        self._next_edit_at = 0.0
+
+    async def append(self, chunk):
+        """Adds a chunk and updates Telegram if the throttle window allows it."""
+        self.text += chunk
+        if time.monotonic() >= self._next_edit_at:
+            await self._render()
+
+    async def finish(self):
+        """Renders whatever is left, ignoring the throttle."""
+        await self._render(force=True)
+
+    async def discard(self):
+        """Deletes rolled-over messages (used when the attempt fails midway)."""
+        for message_id in self._message_ids[1:]:
+            try:
+                await self.bot.delete_message(chat_id=self.chat_id, message_id=message_id)
+            except telegram.error.TelegramError as e:
+                logger.warning("Error hapus pesan streaming %s: %s", message_id, e)
+        del self._message_ids[1:]
+        self._offset = 0
+        self._rendered = ""
+
+    async def _render(self, force=False):
+        pending = self.text[self._offset:]
+
+        # Pesan sekarang udah penuh: kunci isinya, lanjut ke pesan baru
+        while len(pending) > self.max_length:
+            cut = split_point(pending, self.max_length)
+            await self._edit(pending[:cut], force=True)  # Isi pesan yang ditutup harus lengkap
+            self._offset += cut
+            pending = self.text[self._offset:]
+            message = await self.bot.send_message(chat_id=self.chat_id, text=pending[:self.max_length] or "...")
+            self._message_ids.append(message.message_id)
+            self._rendered = pending[:self.max_length] or "..."
+
+        if pending.strip():
+            await self._edit(pending, force=force)
+
+    async def _edit(self, text, force=False):
+        """Edits the last message. ``force`` waits out flood limits instead of skipping the edit."""
+        while text != self._rendered:
+            try:
+                await self.bot.edit_message_text(chat_id=self.chat_id, message_id=self._message_ids[-1], text=text)
+                self._rendered = text
+                self._next_edit_at = time.monotonic() + self.edit_interval
+            except telegram.error.RetryAfter as e:
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                self._next_edit_at = time.monotonic() + retry_after
+                if not force:
+                    return  # Kena flood limit: skip edit ini, nanti ke-render di chunk berikutnya
+                await asyncio.sleep(retry_after)
+            except telegram.error.BadRequest as e:
+                if "not modified" not in str(e).lower():
+                    raise
+                self._rendered = text
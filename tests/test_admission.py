@@ -0,0 +1,130 @@
+import asyncio
+import types
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, TokenBucket
+from update_processor import ChatOrderedUpdateProcessor, slot_released
+
+
+def test_token_bucket_reservations_queue_up():
+    bucket = TokenBucket(rate=2, capacity=2, now=0.0)
+    assert bucket.reserve(now=0.0) == 0
+    assert bucket.reserve(now=0.0) == 0
+    assert bucket.reserve(now=0.0) == pytest.approx(0.5)
+    assert bucket.reserve(now=0.0) == pytest.approx(1.0)
+    assert not bucket.is_full(now=1.0)
+    assert bucket.is_full(now=2.0)
+
+
+def test_concurrency_gate_reports_queue_position():
+    async def scenario():
+        controller = AdmissionController(user_rate_per_minute=6000, user_burst=10, global_rate_per_second=1000,
+                                         global_burst=10, max_inflight=1)
+        positions = []
+        release = asyncio.Event()
+
+        async def job(user_id):
+            async def on_queued(position):
+                positions.append((user_id, position))
+            async with controller.admit(user_id, on_queued=on_queued):
+                await release.wait()
+
+        tasks = [asyncio.create_task(job(i)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        assert controller.inflight == 1 and controller.waiting == 2
+        release.set()
+        await asyncio.gather(*tasks)
+        return controller, positions
+
+    controller, positions = asyncio.run(scenario())
+    assert positions == [(1, 1), (2, 2)]
+    assert controller.stats()["admitted"] == 3
+    assert controller.stats()["queued"] == 2
+
+
+def test_user_over_rate_waits_then_gets_rejected():
+    async def scenario():
+        controller = AdmissionController(user_rate_per_minute=600, user_burst=1, max_wait=0.15)
+
+        async def job(user_id):
+            async with controller.admit(user_id):
+                pass
+
+        # Token ke-2 user 1 baru ada ~0.1 detik lagi (ngantri), ke-3 ~0.2 detik (lewat max_wait)
+        results = await asyncio.gather(job(1), job(1), job(1), job(2), return_exceptions=True)
+        return controller, results
+
+    controller, results = asyncio.run(scenario())
+    assert [isinstance(r, AdmissionRejected) for r in results] == [False, False, True, False]
+    assert (controller.admitted, controller.queued, controller.rejected) == (3, 1, 1)
+
+
+def test_full_queue_rejects_new_waiters():
+    async def scenario():
+        controller = AdmissionController(max_inflight=1, max_queue=1)
+        release = asyncio.Event()
+
+        async def job(user_id):
+            async with controller.admit(user_id):
+                await release.wait()
+
+        tasks = [asyncio.create_task(job(i)) for i in range(2)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected):
+            async with controller.admit(99):
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        return controller
+
+    assert asyncio.run(scenario()).rejected == 1
+
+
+def _update(chat_id):
+    return types.SimpleNamespace(
+        effective_chat=types.SimpleNamespace(id=chat_id),
+        effective_message=types.SimpleNamespace(photo=None, document=None),
+    )
+
+
+def test_queued_roasts_free_processor_slots():
+    async def scenario():
+        processor = ChatOrderedUpdateProcessor(2)
+        controller = AdmissionController(max_inflight=1, max_queue=2)
+        release = asyncio.Event()
+        events = []
+
+        async def roast(chat_id):
+            async def on_queued(position):
+                events.append((chat_id, "queued", position))
+
+            async def on_admitted():
+                events.append((chat_id, "admitted"))
+
+            try:
+                async with controller.admit(chat_id, on_queued=on_queued, on_admitted=on_admitted, waiting=slot_released):
+                    await release.wait()
+            except AdmissionRejected:
+                events.append((chat_id, "rejected"))
+
+        async def command(chat_id):
+            events.append((chat_id, "command"))
+
+        tasks = [asyncio.create_task(processor.process_update(_update(c), roast(c))) for c in (1, 2, 3, 4)]
+        await asyncio.sleep(0.01)
+        # Roast 2 & 3 ngantri tanpa makan slot processor: command chat lain tetep jalan, antrian penuh tetep nolak
+        await asyncio.wait_for(processor.process_update(_update(5), command(5)), 1)
+        release.set()
+        await asyncio.gather(*tasks)
+        return events
+
+    events = asyncio.run(scenario())
+    assert events[:4] == [(2, "queued", 1), (3, "queued", 2), (4, "rejected"), (5, "command")]
+    assert (2, "admitted") in events and (3, "admitted") in events
+
+
+def test_global_limits_are_split_across_workers():
+    controller = AdmissionController(global_rate_per_second=10, global_burst=20, max_inflight=16, max_queue=200, workers=4)
+    assert (controller.max_inflight, controller.max_queue) == (4, 50)
+    assert (controller._global.rate, controller._global.capacity) == (2.5, 5)
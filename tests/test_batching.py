@@ -0,0 +1,69 @@
+import asyncio
+import types
+
+import batching
+from update_processor import ChatOrderedUpdateProcessor
+
+
+def _update(update_id, chat_id=1, media_group_id=None, text=None):
+    message = types.SimpleNamespace(
+        chat_id=chat_id, text=text, media_group_id=media_group_id,
+        photo=None if text else [types.SimpleNamespace(file_unique_id=f"p{update_id}")], document=None,
+    )
+    return types.SimpleNamespace(
+        update_id=update_id, message=message, effective_message=message,
+        effective_chat=types.SimpleNamespace(id=chat_id),
+    )
+
+
+class FakeJobs:
+    def __init__(self):
+        self.done = []
+
+    async def mark_done(self, update):
+        self.done.append(update.update_id)
+
+
+def test_album_parts_run_one_handler_and_finish_together():
+    async def scenario():
+        jobs = FakeJobs()
+        processor = ChatOrderedUpdateProcessor(4, jobs=jobs, batcher=batching.UpdateBatcher(album_window=0.05))
+        handled = []
+
+        async def handle(update):
+            handled.append([part.update_id for part in batching.current_parts(update)])
+
+        album = [_update(i, media_group_id="g1") for i in (1, 2, 3)]
+        tasks = []
+        for update in album:
+            tasks.append(asyncio.create_task(processor.process_update(update, handle(update))))
+            await asyncio.sleep(0.02)  # Tiap foto nyampe sebelum window-nya abis
+        tasks.append(asyncio.create_task(processor.process_update(_update(4, text="habis album"), handle(_update(4, text="x")))))
+        await asyncio.gather(*tasks)
+        return handled, jobs.done
+
+    handled, done = asyncio.run(scenario())
+    assert handled == [[1, 2, 3], [4]]  # Album dulu (urutan chat kejaga), teks nggak ikut digabung
+    assert sorted(done) == [1, 2, 3, 4]
+
+
+def test_text_bursts_batch_only_when_enabled_and_respect_max_parts():
+    batcher = batching.UpdateBatcher(album_window=1, text_window=0)
+    assert batcher.batch_key(_update(1, text="halo")) is None
+    assert batcher.batch_key(_update(2, media_group_id="g")) == ("album", "g")
+
+    async def scenario():
+        batcher = batching.UpdateBatcher(text_window=0.05, max_parts=2)
+        first, leader = batcher.join(_update(1, text="a"))
+        second, follower_leads = batcher.join(_update(2, text="b"))
+        third, third_leads = batcher.join(_update(3, text="c"))  # Batch pertama udah penuh
+        assert batcher.batch_key(_update(4, text="/start")) is None
+        parts = await batcher.collect(first)
+        return leader, follower_leads, third_leads, first is second, [u.update_id for u in parts]
+
+    assert asyncio.run(scenario()) == (True, False, True, True, [1, 2])
+
+
+def test_current_parts_defaults_to_the_update_itself():
+    update = _update(9, text="sendiri")
+    assert batching.current_parts(update) == [update]
@@ -0,0 +1,70 @@
+import asyncio
+
+import aiohttp
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+import metrics
+from bench import fake_gemini
+from bench.fake_telegram import FakeTelegramServer
+from bench.loadgen import LoadGenerator, histogram_summary, parse_exposition, percentile
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 99), percentile([], 50)) == (50, 99, None)
+
+
+def test_histogram_summary_sums_workers():
+    registry = metrics.Registry()
+    latency = registry.histogram("op_seconds", "Op.", ("op",), buckets=(0.1, 1))
+    for value in (0.05, 0.05, 0.5, 0.5):
+        latency.observe(value, op="get")
+    text = metrics.merge_expositions([registry.render((("worker", 0),)), registry.render((("worker", 1),))])
+    summary = histogram_summary(parse_exposition(text), "op_seconds", ("op",))[("get",)]
+    assert summary["count"] == 8
+    assert summary["mean"] == pytest.approx(0.275)
+    assert summary["p50"] == pytest.approx(0.1)
+    assert 0.1 < summary["p95"] <= 1
+
+
+def test_fake_gemini_bursts_and_latency():
+    settings = fake_gemini.Settings(latency=0.01, jitter=0, error_rate=0, burst_every=10, burst_length=2, epoch=0)
+    model = fake_gemini.FakeGenerativeModel(settings=settings)
+    assert settings.in_burst(now=101) and not settings.in_burst(now=105)
+
+    settings.burst_every = 0
+    response = asyncio.run(model.generate_content_async("roast dong"))
+    assert fake_gemini.ROAST_MARKER in response.text
+
+    settings.burst_every, settings.epoch = 10, 0
+    settings.burst_length = 10  # Selalu lagi burst
+    with pytest.raises(google_exceptions.TooManyRequests):
+        asyncio.run(model.generate_content_async("roast dong"))
+
+
+def test_fake_telegram_records_calls_and_generator_matches_final_reply():
+    async def scenario():
+        generator = LoadGenerator("http://unused", rate=1, duration=1)
+        server = FakeTelegramServer(on_call=generator.on_call)
+        await server.start()
+        generator.pending[7].append((1, "text", 0.0))
+        async with aiohttp.ClientSession() as session:
+            for text in ("Copywriting lo udah gue terima nih!", f"{fake_gemini.ROAST_MARKER} roast"):
+                async with session.post(f"{server.base_url}123:x/sendMessage", data={"chat_id": "7", "text": text}) as response:
+                    body = await response.json()
+        await server.stop()
+        return generator, server, body
+
+    generator, server, body = asyncio.run(scenario())
+    assert body["result"]["chat"]["id"] == 7
+    assert server.count("sendMessage") == 2
+    assert [(kind, outcome) for kind, outcome, _ in generator.results] == [("text", "ok")]
+
+
+def test_ingress_benchmark_counts_every_update():
+    from bench.ingress import run_ingress_benchmark
+
+    result = asyncio.run(run_ingress_benchmark("aiohttp", requests=40, concurrency=4, port=18690, batch=2))
+    assert result["statuses"] == {200: 40}
+    assert result["queued"] == 80 and result["rps"] > 0
@@ -0,0 +1,114 @@
+import asyncio
+
+import telegram
+
+from durable_queue import DurableUpdateQueue
+from update_processor import ChatOrderedUpdateProcessor
+
+
+def _update(update_id, chat_id=1, text="halo"):
+    return telegram.Update.de_json({
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": 1700000000, "chat": {"id": chat_id, "type": "private"}, "text": text},
+    }, None)
+
+
+def test_put_persists_and_drops_redelivered_updates(tmp_path):
+    async def scenario():
+        queue = DurableUpdateQueue(str(tmp_path / "jobs.db"))
+        await queue.start(None)
+        await queue.put(_update(1))
+        await queue.put(_update(1))  # Redelivery dari Telegram
+        await queue.put(_update(2))
+        assert queue.qsize() == 2 and queue.duplicates == 1
+        assert await queue.pending_count() == 2
+        await queue.close()
+
+    asyncio.run(scenario())
+
+
+def test_unfinished_updates_resume_after_restart(tmp_path):
+    db_file = str(tmp_path / "jobs.db")
+
+    async def first_run():
+        queue = DurableUpdateQueue(db_file)
+        await queue.start(None)
+        for update_id in (1, 2, 3):
+            await queue.put(_update(update_id))
+        await queue.mark_done(await queue.get())  # Cuma update 1 yang sempet selesai
+        await queue.close()
+
+    async def second_run():
+        queue = DurableUpdateQueue(db_file)
+        await queue.start(None)
+        resumed = [queue.get_nowait().update_id for _ in range(queue.qsize())]
+        await queue.put(_update(1))  # Yang udah selesai tetep dianggap duplikat
+        await queue.close()
+        return resumed, queue.duplicates
+
+    asyncio.run(first_run())
+    assert asyncio.run(second_run()) == ([2, 3], 1)
+
+
+def test_update_that_keeps_crashing_is_dropped(tmp_path):
+    db_file = str(tmp_path / "jobs.db")
+
+    async def run(put=False):
+        queue = DurableUpdateQueue(db_file, max_attempts=2)
+        await queue.start(None)
+        if put:
+            await queue.put(_update(7))
+        resumed = queue.resumed
+        await queue.close()  # "Crash" sebelum mark_done
+        return resumed
+
+    assert asyncio.run(run(put=True)) == 0
+    assert asyncio.run(run()) == 1
+    assert asyncio.run(run()) == 0
+
+
+def test_processor_marks_jobs_done_and_serves_text_first(tmp_path):
+    order = []
+
+    async def handle(update, delay=0.0):
+        await asyncio.sleep(delay)
+        order.append(update.update_id)
+
+    def photo_update(update_id, chat_id):
+        return telegram.Update.de_json({
+            "update_id": update_id,
+            "message": {"message_id": update_id, "date": 1700000000, "chat": {"id": chat_id, "type": "private"},
+                        "photo": [{"file_id": "f", "file_unique_id": "u", "width": 1, "height": 1}]},
+        }, None)
+
+    async def scenario():
+        queue = DurableUpdateQueue(str(tmp_path / "jobs.db"))
+        await queue.start(None)
+        processor = ChatOrderedUpdateProcessor(1, jobs=queue)
+        updates = [_update(1, chat_id=1), photo_update(2, chat_id=2), _update(3, chat_id=3)]
+        for update in updates:
+            await queue.put(update)
+        tasks = [asyncio.create_task(processor.process_update(updates[0], handle(updates[0], 0.05)))]
+        await asyncio.sleep(0.01)  # Slot satu-satunya lagi kepake update 1
+        tasks += [asyncio.create_task(processor.process_update(u, handle(u))) for u in updates[1:]]
+        await asyncio.gather(*tasks)
+        pending = await queue.pending_count()
+        await queue.close()
+        return pending
+
+    assert asyncio.run(scenario()) == 0
+    assert order == [1, 3, 2]  # Teks (3) nyalip gambar (2) yang dateng duluan
+
+
+def test_put_many_persists_a_batch_in_order_and_skips_known_ids(tmp_path):
+    async def scenario():
+        queue = DurableUpdateQueue(str(tmp_path / "jobs.db"))
+        await queue.start(None)
+        await queue.put(_update(2))
+        await queue.put_many([_update(1), _update(2), _update(3)])
+        queued = [queue.get_nowait().update_id for _ in range(queue.qsize())]
+        pending = await queue.pending_count()
+        await queue.close()
+        return queued, pending, queue.duplicates
+
+    assert asyncio.run(scenario()) == ([2, 1, 3], 3, 1)
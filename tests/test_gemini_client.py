@@ -0,0 +1,108 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+from gemini_client import GeminiCancelledError, GeminiClient, GeminiTimeoutError
+
+
+class FakeModel:
+    def __init__(self, chunks=("a", "b", "c"), chunk_delay=0.0, delay=0.0):
+        self.chunks = chunks
+        self.chunk_delay = chunk_delay
+        self.delay = delay
+
+    async def generate_content_async(self, contents, stream=False, **kwargs):
+        await asyncio.sleep(self.delay)
+        if not stream:
+            return types.SimpleNamespace(text="".join(self.chunks))
+        return self._stream()
+
+    async def count_tokens_async(self, contents, **kwargs):
+        await asyncio.sleep(self.delay)
+        return types.SimpleNamespace(total_tokens=len(contents.split()))
+
+    async def _stream(self):
+        for chunk in self.chunks:
+            await asyncio.sleep(self.chunk_delay)
+            yield types.SimpleNamespace(text=chunk)
+
+
+async def _collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_generate_runs_calls_concurrently():
+    client = GeminiClient(FakeModel(delay=0.1), max_concurrency=10)
+
+    async def scenario():
+        started = time.monotonic()
+        results = await asyncio.gather(*(client.generate("p") for _ in range(10)))
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(scenario())
+    assert results[0].text == "abc"
+    assert elapsed < 0.5
+
+
+def test_generate_timeout():
+    client = GeminiClient(FakeModel(delay=1), timeout=0.05)
+    with pytest.raises(GeminiTimeoutError):
+        asyncio.run(client.generate("p"))
+    assert client.inflight_count == 0
+
+
+def test_count_tokens_and_timeout():
+    assert asyncio.run(GeminiClient(FakeModel()).count_tokens("satu dua tiga")) == 3
+    with pytest.raises(GeminiTimeoutError):
+        asyncio.run(GeminiClient(FakeModel(delay=0.2), timeout=0.05).count_tokens("p"))
+
+
+def test_thread_pool_fallback():
+    model = types.SimpleNamespace(generate_content=lambda contents, **kwargs: types.SimpleNamespace(text=contents))
+    client = GeminiClient(model, use_thread_pool=True)
+    assert asyncio.run(client.generate("halo")).text == "halo"
+    client.close()
+
+
+def test_stream_yields_chunks():
+    client = GeminiClient(FakeModel())
+    assert asyncio.run(_collect(client.stream("p"))) == ["a", "b", "c"]
+
+
+def test_stream_total_timeout_caps_trickling_stream():
+    # Tiap chunk cepet (di bawah timeout per chunk), tapi totalnya lewat deadline
+    client = GeminiClient(FakeModel(chunks=["x"] * 50, chunk_delay=0.02), timeout=1)
+    started = time.monotonic()
+    with pytest.raises(GeminiTimeoutError):
+        asyncio.run(_collect(client.stream("p", total_timeout=0.1)))
+    assert time.monotonic() - started < 0.5
+
+
+def test_stream_releases_slot_while_consumer_is_slow():
+    client = GeminiClient(FakeModel(chunks=["x", "y"]), max_concurrency=1)
+
+    async def scenario():
+        stream = client.stream("p")
+        first = await stream.__anext__()
+        await asyncio.sleep(0.05)  # Consumer lagi nunggu (misal RetryAfter Telegram)
+        other = await asyncio.wait_for(client.generate("q"), 0.5)  # Slot udah lepas
+        rest = [chunk async for chunk in stream]
+        return first, other.text, rest
+
+    assert asyncio.run(scenario()) == ("x", "xy", ["y"])
+
+
+def test_cancel_all_cancels_only_the_gemini_call():
+    client = GeminiClient(FakeModel(chunks=["x"] * 10, chunk_delay=0.05))
+
+    async def scenario():
+        chunks = []
+        with pytest.raises(GeminiCancelledError):
+            async for chunk in client.stream("p"):
+                chunks.append(chunk)
+                client.cancel_all()
+        return chunks
+
+    assert asyncio.run(scenario()) == ["x"]
@@ -0,0 +1,99 @@
+import asyncio
+import io
+import types
+
+import pytest
+from PIL import Image
+
+import image_pipeline
+from image_pipeline import DuplicateIndex, hash_distance, load_photo, prepare_image, screen_image, select_photo
+
+
+def _encode(img, format="PNG"):
+    buffer = io.BytesIO()
+    img.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def _decode(payload):
+    return Image.open(io.BytesIO(payload["data"]))
+
+
+def test_large_image_is_downscaled_keeping_aspect_ratio():
+    payload = prepare_image(_encode(Image.new("RGB", (2000, 1000), "red")), max_side=500)
+    assert payload["mime_type"] == "image/jpeg"
+    assert _decode(payload).size == (500, 250)
+
+
+def test_rgba_is_converted_to_jpeg():
+    payload = prepare_image(_encode(Image.new("RGBA", (64, 64), (0, 255, 0, 128))))
+    img = _decode(payload)
+    assert img.format == "JPEG" and img.mode == "RGB"
+
+
+def test_small_image_is_never_upscaled():
+    assert _decode(prepare_image(_encode(Image.new("RGB", (100, 40))), max_side=1024)).size == (100, 40)
+
+
+def test_undecodable_bytes_raise():
+    with pytest.raises(OSError):
+        prepare_image(b"bukan gambar")
+
+
+def test_load_photo_downloads_into_memory():
+    data = _encode(Image.new("RGB", (30, 30)), format="JPEG")
+
+    class FakeBot:
+        async def get_file(self, file_id):
+            async def download_as_bytearray():
+                return bytearray(data)
+            return types.SimpleNamespace(download_as_bytearray=download_as_bytearray)
+
+    prepared = asyncio.run(load_photo(FakeBot(), types.SimpleNamespace(file_id="f")))
+    assert _decode(prepared.payload).size == (30, 30)
+
+
+def _copywriting(width=1200, height=900, offset=0):
+    from PIL import ImageDraw
+
+    img = Image.new("RGB", (width, height), (250, 220, 60))
+    draw = ImageDraw.Draw(img)
+    for y in range(0, height, 60):
+        draw.rectangle((40 + offset, y + 10, width // 2 + y % 300, y + 40), fill=(20, 20, 20))
+    return img
+
+
+def test_select_photo_picks_the_smallest_size_that_is_sharp_enough():
+    sizes = [types.SimpleNamespace(width=w, height=h) for w, h in ((90, 68), (320, 240), (800, 600), (1280, 960))]
+    assert select_photo(sizes, min_side=800).width == 800
+    assert select_photo(sizes, min_side=2000).width == 1280  # Nggak ada yang cukup: ambil yang paling gede
+    assert select_photo(list(reversed(sizes)), min_side=300).width == 320
+
+
+def test_blank_image_is_flagged():
+    assert screen_image(_encode(Image.new("RGB", (800, 600), "white"))).blank
+    assert not screen_image(_encode(_copywriting())).blank
+
+
+def test_near_duplicates_have_close_hashes():
+    original = screen_image(_encode(_copywriting()))
+    recompressed = screen_image(_encode(_copywriting().resize((600, 450)), format="JPEG"))
+    different = screen_image(_encode(_copywriting().transpose(Image.FLIP_LEFT_RIGHT)))
+    assert hash_distance(original.phash, recompressed.phash) <= image_pipeline.DUPLICATE_MAX_DISTANCE
+    assert hash_distance(original.phash, different.phash) > image_pipeline.DUPLICATE_MAX_DISTANCE
+
+
+def test_small_jpeg_is_passed_through_untouched():
+    buffer = io.BytesIO()
+    _copywriting(400, 300).save(buffer, format="JPEG", quality=60, optimize=True)
+    assert prepare_image(buffer.getvalue(), quality=90)["data"] == buffer.getvalue()
+
+
+def test_duplicate_index_maps_near_duplicates_per_user():
+    index = DuplicateIndex(max_distance=2, window=60, max_users=2)
+    assert index.canonical(1, 0b1111) == 0b1111
+    assert index.canonical(1, 0b1101) == 0b1111  # Beda 1 bit: dianggap gambar yang sama
+    assert index.canonical(1, 0b110000) == 0b110000
+    assert index.canonical(2, 0b1101) == 0b1101  # User lain punya riwayat sendiri
+    index.canonical(3, 0)
+    assert index.canonical(1, 0b1101) == 0b1101  # User 1 udah kebuang (paling lama nggak ngirim)
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import types
+
+import aiohttp
+from aiohttp import test_utils, web
+
+import ingress
+
+
+def _body(*update_ids):
+    updates = [{"update_id": i, "message": {"message_id": i, "date": 1700000000, "chat": {"id": i, "type": "private"},
+                                            "text": "halo"}} for i in update_ids]
+    return json.dumps(updates[0] if len(updates) == 1 else updates).encode()
+
+
+class Recorder:
+    def __init__(self, statuses=()):
+        self.batches = []
+        self.statuses = list(statuses)
+
+    async def __call__(self, items):
+        self.batches.append([item["update_id"] for item in items])
+        return self.statuses.pop(0) if self.statuses else 200
+
+
+def test_receive_checks_secret_size_and_json():
+    deliver = Recorder()
+    webhook = ingress.UpdateIngress(deliver, secret_token="rahasia", max_body=1000)
+
+    async def scenario():
+        return [
+            await webhook.receive(_body(1), secret=None),
+            await webhook.receive(_body(1), secret="salah"),
+            await webhook.receive(b"x" * 2000, secret="rahasia"),
+            await webhook.receive(b"bukan json", secret="rahasia"),
+            await webhook.receive(b'{"message": {}}', secret="rahasia"),
+            await webhook.receive(_body(1), secret="rahasia"),
+        ]
+
+    assert asyncio.run(scenario()) == [403, 403, 413, 400, 400, 200]
+    assert deliver.batches == [[1]]
+
+
+def test_batches_are_delivered_once_and_redeliveries_rejected():
+    deliver = Recorder(statuses=[503])
+    webhook = ingress.UpdateIngress(deliver, secret_token="")
+
+    async def scenario():
+        return [
+            await webhook.receive(_body(1, 2)),  # Antrian lagi nggak bisa nerima
+            await webhook.receive(_body(1, 2, 2)),  # Kiriman ulang Telegram tetep diterima
+            await webhook.receive(_body(2)),
+            await webhook.receive(_body(2, 3)),
+        ]
+
+    assert asyncio.run(scenario()) == [503, 200, 200, 200]
+    assert deliver.batches == [[1, 2], [1, 2], [3]]
+
+
+def test_recent_ids_forget_the_oldest():
+    recent = ingress.RecentIds(size=2)
+    for update_id in (1, 2, 3):
+        recent.add(update_id)
+    assert 1 not in recent and 2 in recent and 3 in recent
+
+
+def test_aiohttp_routes_serve_webhook_and_health():
+    deliver = Recorder()
+    webhook = ingress.UpdateIngress(deliver, lambda: (True, {"queued": 0}), name="aiohttp", secret_token="s", max_body=300)
+
+    async def scenario():
+        app = web.Application(client_max_size=webhook.max_body)
+        ingress.add_aiohttp_routes(app, webhook, "/token")
+        async with test_utils.TestClient(test_utils.TestServer(app)) as client:
+            headers = {ingress.SECRET_HEADER: "s"}
+            ok = await client.post("/token", data=_body(1), headers=headers)
+            forbidden = await client.post("/token", data=_body(2))
+            too_large = await client.post("/token", data=b"x" * 5000, headers=headers)
+            health = await client.get(ingress.HEALTH_PATH)
+            return ok.status, forbidden.status, too_large.status, health.status, await health.json()
+
+    ok, forbidden, too_large, health_status, health = asyncio.run(scenario())
+    assert (ok, forbidden, too_large, health_status) == (200, 403, 413, 200)
+    assert health == {"status": "ok", "ingress": "aiohttp", "queued": 0}
+    assert deliver.batches == [[1]]
+
+
+class FakeApplication:
+    def __init__(self):
+        self.bot = None
+        self.bot_data = {}
+        self.update_queue = asyncio.Queue()
+        self.running = False
+        self.post_init = self.post_stop = self.post_shutdown = None
+        self.calls = []
+
+    async def initialize(self):
+        self.calls.append("initialize")
+
+    async def start(self):
+        self.running = True
+        self.calls.append("start")
+
+    async def stop(self):
+        self.running = False
+        self.calls.append("stop")
+
+    async def shutdown(self):
+        self.calls.append("shutdown")
+
+
+async def _asgi_request(app, method, path, body=b"", headers=()):
+    sent = []
+    chunks = [{"type": "http.request", "body": body[:10], "more_body": True},
+              {"type": "http.request", "body": body[10:], "more_body": False}]
+
+    async def receive():
+        return chunks.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path,
+             "headers": [(name.lower().encode(), value.encode()) for name, value in headers]}
+    await app(scope, receive, send)
+    return sent[0]["status"], sent[1]["body"]
+
+
+def test_asgi_app_starts_lazily_and_stops_on_lifespan_shutdown():
+    built = []
+
+    def build_application():
+        built.append(FakeApplication())
+        return built[-1]
+
+    app = ingress.ASGIApp(build_application, "/token", secret_token="s", max_body=1000)
+
+    async def scenario():
+        health_before = await _asgi_request(app, "GET", ingress.HEALTH_PATH)
+        accepted = await asyncio.gather(*(
+            _asgi_request(app, "POST", "/token", _body(i), [(ingress.SECRET_HEADER, "s")]) for i in (1, 2)
+        ))
+        forbidden = await _asgi_request(app, "POST", "/token", _body(3))
+        too_large = await _asgi_request(app, "POST", "/token", b"x" * 2000, [(ingress.SECRET_HEADER, "s")])
+        health = await _asgi_request(app, "GET", ingress.HEALTH_PATH)
+        missing = await _asgi_request(app, "GET", "/lain")
+        queued = built[0].update_queue.qsize()
+
+        lifespan = [{"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return lifespan.pop(0)
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await app({"type": "lifespan"}, receive, send)
+        return health_before[0], [status for status, _ in accepted], forbidden[0], too_large[0], health, missing[0], queued, sent
+
+    health_before, accepted, forbidden, too_large, health, missing, queued, sent = asyncio.run(scenario())
+    assert health_before == 503
+    assert accepted == [200, 200] and forbidden == 403 and too_large == 413 and missing == 404
+    assert health[0] == 200 and json.loads(health[1])["queued"] == 2
+    assert len(built) == 1 and queued == 2  # Request barengan nungguin start yang sama
+    assert built[0].calls == ["initialize", "start", "stop", "shutdown"]
+    assert sent == ["lifespan.shutdown.complete"]
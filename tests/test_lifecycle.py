@@ -0,0 +1,99 @@
+import asyncio
+import types
+
+from lifecycle import Lifecycle
+from update_processor import ChatOrderedUpdateProcessor
+
+
+def _update(update_id, chat_id):
+    message = types.SimpleNamespace(chat_id=chat_id, photo=None, document=None)
+    return types.SimpleNamespace(
+        update_id=update_id, message=message, effective_message=message,
+        effective_chat=types.SimpleNamespace(id=chat_id),
+    )
+
+
+class FakeJobs:
+    def __init__(self):
+        self.done = []
+
+    async def mark_done(self, update):
+        self.done.append(update.update_id)
+
+
+class FakeBot:
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        self.edits.append((chat_id, message_id, text))
+
+
+def test_drain_waits_for_running_updates_and_cancels_the_rest():
+    async def scenario():
+        jobs, bot = FakeJobs(), FakeBot()
+        processor = ChatOrderedUpdateProcessor(4, jobs=jobs)
+        deadline_hits = []
+        lifecycle = Lifecycle(drain_timeout=0.1, on_deadline=[lambda: deadline_hits.append(1)], retry_notice="ulang ya")
+        application = types.SimpleNamespace(update_processor=processor)
+        finished = []
+
+        async def handle(update, seconds):
+            lifecycle.track_placeholder(bot, update.message.chat_id, update.update_id * 10)
+            await asyncio.sleep(seconds)
+            finished.append(update.update_id)
+
+        quick, slow, waiting = _update(1, chat_id=1), _update(2, chat_id=2), _update(3, chat_id=2)
+        tasks = [
+            asyncio.create_task(processor.process_update(quick, handle(quick, 0.02))),
+            asyncio.create_task(processor.process_update(slow, handle(slow, 10))),
+            asyncio.create_task(processor.process_update(waiting, handle(waiting, 0))),  # Antri di belakang chat 2
+        ]
+        await asyncio.sleep(0.01)
+        await lifecycle.drain(application)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return finished, jobs.done, bot.edits, deadline_hits, results
+
+    finished, done, edits, deadline_hits, results = asyncio.run(scenario())
+    assert finished == [1]
+    assert done == [1]  # Yang dibatalin & yang belum mulai tetep pending di antrian durable
+    assert edits == [(2, 20, "ulang ya")]
+    assert deadline_hits == [1]
+    assert isinstance(results[1], asyncio.CancelledError) and results[2] is None
+
+
+def test_drain_without_running_updates_returns_at_once_and_skips_new_ones():
+    async def scenario():
+        jobs = FakeJobs()
+        processor = ChatOrderedUpdateProcessor(2, jobs=jobs)
+        lifecycle = Lifecycle(drain_timeout=5)
+        await lifecycle.drain(types.SimpleNamespace(update_processor=processor))
+        ran = []
+
+        async def handle():
+            ran.append(1)
+
+        await processor.process_update(_update(1, chat_id=1), handle())
+        return ran, jobs.done
+
+    assert asyncio.run(scenario()) == ([], [])
+
+
+def test_delivered_placeholder_is_left_alone():
+    async def scenario():
+        bot = FakeBot()
+        processor = ChatOrderedUpdateProcessor(1)
+        lifecycle = Lifecycle(drain_timeout=0.05)
+
+        async def handle():
+            lifecycle.track_placeholder(bot, 1, 10)
+            lifecycle.forget_placeholder()  # Roast-nya udah kekirim, tinggal beres-beres
+            await asyncio.sleep(10)
+
+        task = asyncio.create_task(processor.process_update(_update(1, chat_id=1), handle()))
+        await asyncio.sleep(0.01)
+        await lifecycle.drain(types.SimpleNamespace(update_processor=processor))
+        await asyncio.gather(task, return_exceptions=True)
+        return bot.edits
+
+    assert asyncio.run(scenario()) == []
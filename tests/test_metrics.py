@@ -0,0 +1,79 @@
+import json
+import logging
+
+import metrics
+import startup
+from logging_config import JsonFormatter
+
+
+def test_render_counters_gauges_and_histograms():
+    registry = metrics.Registry()
+    roasts = registry.counter("roasts_total", "Roast.", ("path", "outcome"))
+    latency = registry.histogram("latency_seconds", "Latency.", ("path",), buckets=(0.1, 1))
+    registry.gauge("queue_depth", "Antrian.", func=lambda: 3)
+    roasts.inc(path="text", outcome="ok")
+    roasts.inc(path="text", outcome="ok")
+    latency.observe(0.05, path="text")
+    latency.observe(0.5, path="text")
+    latency.observe(5, path="text")
+
+    lines = registry.render((("worker", 1),)).splitlines()
+    assert "# TYPE roasts_total counter" in lines
+    assert 'roasts_total{path="text",outcome="ok",worker="1"} 2' in lines
+    assert 'latency_seconds_bucket{path="text",worker="1",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{path="text",worker="1",le="1.0"} 2' in lines
+    assert 'latency_seconds_bucket{path="text",worker="1",le="+Inf"} 3' in lines
+    assert 'latency_seconds_count{path="text",worker="1"} 3' in lines
+    assert 'queue_depth{worker="1"} 3' in lines
+
+
+def test_same_name_returns_same_metric():
+    registry = metrics.Registry()
+    assert registry.counter("a_total", "A.") is registry.counter("a_total", "A.")
+
+
+def test_merge_keeps_families_together():
+    first = "# HELP a_total A.\n# TYPE a_total counter\na_total{worker=\"0\"} 1\n# HELP b B.\n# TYPE b gauge\nb{worker=\"0\"} 2\n"
+    second = first.replace('"0"', '"1"')
+    merged = metrics.merge_expositions([first, "", second]).splitlines()
+    assert merged == [
+        "# HELP a_total A.", "# TYPE a_total counter", 'a_total{worker="0"} 1', 'a_total{worker="1"} 1',
+        "# HELP b B.", "# TYPE b gauge", 'b{worker="0"} 2', 'b{worker="1"} 2',
+    ]
+
+
+def test_trace_update_logs_spans(monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "TRACE_ENABLED", True)
+    with caplog.at_level(logging.DEBUG, logger="metrics"):
+        with metrics.trace_update(42):
+            with metrics.span("gemini"):
+                pass
+            with metrics.span("sendMessage"):
+                pass
+    with metrics.span("outside"):  # Di luar update: nggak kecatet di mana-mana
+        pass
+    (record,) = [r for r in caplog.records if r.name == "metrics"]
+    assert "update=42" in record.getMessage()
+    assert "gemini=" in record.getMessage() and "sendMessage=" in record.getMessage()
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.LogRecord("bot", logging.INFO, __file__, 1, "roast %s selesai", ("teks",), None)
+    record.chat_id = 7
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["msg"] == "roast teks selesai"
+    assert entry["level"] == "INFO" and entry["chat_id"] == 7
+
+
+def test_startup_timer_reports_phases_once(caplog):
+    timer = startup.StartupTimer()
+    timer.mark("import")
+    timer.record("gemini_import", 1.5)
+    timer.mark("init")
+    with caplog.at_level(logging.INFO, logger="startup"):
+        total = timer.report()
+        timer.report()
+    assert list(timer.phases) == ["import", "gemini_import", "init"]
+    assert total < 1  # Fase background nggak ikut total critical path
+    assert len([r for r in caplog.records if r.name == "startup"]) == 1
+    assert 'startup_phase_seconds{phase="gemini_import"} 1.5' in metrics.render()
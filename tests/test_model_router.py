@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from gemini_client import GeminiTimeoutError
+from model_router import ModelRouter
+from retry_policy import CircuitOpenError
+
+
+def _router(**kwargs):
+    return ModelRouter(primary="pro", fast="lite", fallback="backup", fast_max_chars=10, **kwargs)
+
+
+def test_short_text_goes_to_the_fast_model_first():
+    router = _router()
+    assert [r.name for r in router.candidates(5)] == ["lite", "pro", "backup"]
+    assert [r.name for r in router.candidates(50)] == ["pro", "backup"]
+    assert [r.name for r in router.candidates(None)] == ["pro", "backup"]  # Gambar
+
+    router.routes["lite"].latency, router.routes["pro"].latency = 3.0, 1.0  # Model "cepet" ternyata lebih lemot
+    assert [r.name for r in router.candidates(5)] == ["pro", "lite", "backup"]
+
+
+def test_fails_over_on_rate_limit_and_timeout():
+    router = _router()
+    calls = []
+
+    async def call(model_name, timeout):
+        calls.append((model_name, timeout))
+        if model_name == "pro":
+            raise google_exceptions.TooManyRequests("429")
+        if model_name == "lite":
+            raise GeminiTimeoutError("lemot")
+        return f"roast dari {model_name}"
+
+    assert asyncio.run(router.run(call, 60, text_length=5)) == "roast dari backup"
+    assert [name for name, _ in calls] == ["lite", "pro", "backup"]
+    assert calls[0][1] == router.failover_timeout and calls[2][1] > router.failover_timeout  # Model terakhir dapet sisa waktunya
+    assert router.routes["pro"].errors == 1 and router.routes["backup"].latency is not None
+
+
+def test_permanent_error_is_raised_without_failover():
+    router = _router()
+    calls = []
+
+    async def call(model_name, timeout):
+        calls.append(model_name)
+        raise google_exceptions.InvalidArgument("konten diblok")
+
+    with pytest.raises(google_exceptions.InvalidArgument):
+        asyncio.run(router.run(call, 60))
+    assert calls == ["pro"]
+
+
+def test_degraded_models_move_back_and_open_breakers_are_skipped():
+    router = _router()
+    for _ in range(router.routes["pro"].breaker.failure_threshold):
+        router.routes["pro"].record_failure(google_exceptions.TooManyRequests("429"))
+    assert [r.name for r in router.candidates(None)] == ["backup", "pro"]
+
+    for _ in range(router.routes["backup"].breaker.failure_threshold):
+        router.routes["backup"].record_failure(google_exceptions.TooManyRequests("429"))
+
+    async def call(model_name, timeout):
+        raise AssertionError("nggak boleh dipanggil")
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(router.run(call, 60))
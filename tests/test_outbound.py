@@ -0,0 +1,69 @@
+import asyncio
+import types
+
+import telegram
+
+from outbound import ChatActionKeeper, build_request, deliver
+
+
+class FakeBot:
+    def __init__(self, edit_error=None):
+        self.calls = []
+        self.edit_error = edit_error
+
+    async def send_chat_action(self, chat_id, action):
+        self.calls.append(("send_chat_action", chat_id))
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        if self.edit_error:
+            raise self.edit_error
+        self.calls.append(("edit_message_text", message_id, text))
+
+    async def send_message(self, chat_id, text):
+        self.calls.append(("send_message", chat_id, text))
+        return types.SimpleNamespace(message_id=99)
+
+    async def delete_message(self, chat_id, message_id):
+        self.calls.append(("delete_message", message_id))
+
+
+def test_one_chat_action_task_per_chat():
+    bot = FakeBot()
+
+    async def scenario():
+        keeper = ChatActionKeeper(interval=0.05)
+        async with keeper.keep(bot, 1):
+            async with keeper.keep(bot, 1):  # Roast kedua di chat yang sama nggak nambah task
+                assert len(keeper) == 1
+                await asyncio.sleep(0.12)
+        assert len(keeper) == 0
+        sent = len(bot.calls)
+        await asyncio.sleep(0.1)
+        return sent
+
+    sent = asyncio.run(scenario())
+    assert 2 <= sent <= 3  # t=0, 0.05, (0.1)
+    assert len(bot.calls) == sent  # Task-nya udah berhenti
+
+
+def test_deliver_replaces_placeholder_with_one_edit():
+    bot = FakeBot()
+    asyncio.run(deliver(bot, chat_id=1, message_id=10, text="roast"))
+    assert bot.calls == [("edit_message_text", 10, "roast")]
+
+
+def test_deliver_falls_back_to_new_message():
+    bot = FakeBot(edit_error=telegram.error.BadRequest("Message to edit not found"))
+    asyncio.run(deliver(bot, chat_id=1, message_id=10, text="roast"))
+    assert bot.calls == [("send_message", 1, "roast")]
+
+
+def test_deliver_fallback_splits_long_text():
+    bot = FakeBot(edit_error=telegram.error.BadRequest("Message to edit not found"))
+    asyncio.run(deliver(bot, chat_id=1, message_id=10, text="aaaa bbbb cccc", max_length=10))
+    assert bot.calls == [("send_message", 1, "aaaa bbbb "), ("send_message", 1, "cccc")]
+
+
+def test_build_request_uses_pool_size():
+    request = build_request(pool_size=8)
+    assert request._client_kwargs["limits"].max_connections == 8
@@ -0,0 +1,107 @@
+import asyncio
+
+import prompts
+
+
+class FakeModel:
+    def __init__(self, model_name, system_instruction=None):
+        self.model_name = model_name
+        self.system_instruction = system_instruction
+
+
+class RecordingFactory:
+    def __init__(self):
+        self.created = []
+
+    def __call__(self, model_name, **kwargs):
+        model = FakeModel(model_name, **kwargs)
+        self.created.append(model)
+        return model
+
+
+class FakeCounter:
+    def __init__(self, tokens_per_char=0.25, error=None):
+        self.tokens_per_char = tokens_per_char
+        self.error = error
+        self.calls = 0
+
+    async def count_tokens(self, contents, model=None, timeout=None):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return int(len(contents) * self.tokens_per_char)
+
+
+def test_registry_builds_each_model_once_with_clean_system_instruction():
+    factory = RecordingFactory()
+    registry = prompts.PromptRegistry(factory, ["gemini-test", "gemini-lite"])
+
+    assert len(factory.created) == 8  # 4 instruksi (image & album sama) x 2 model
+    pedas = registry.get("pedas")
+    assert pedas.model().system_instruction == pedas.system_instruction
+    assert pedas.model().model_name == "gemini-test" and pedas.model("gemini-lite").model_name == "gemini-lite"
+    assert registry.get("album").model("gemini-lite") is registry.get("image").model("gemini-lite")
+    assert pedas.system_instruction.startswith("Lo adalah") and pedas.system_instruction.endswith("plaintext.")
+    assert "\n    " not in pedas.system_instruction
+    assert pedas.render("Beli sekarang!") == 'Nih teks copywriting-nya:\n"Beli sekarang!"'
+    assert registry.get("ngaco").render("x") == 'Roast copywriting ini: "x"'
+    assert registry.get("ngaco").model().system_instruction is None
+    registry.get("solusi")
+    assert len(factory.created) == 8  # get() nggak bikin model baru
+
+
+def test_fit_skips_the_counter_for_short_text():
+    registry = prompts.PromptRegistry(RecordingFactory(), "gemini-test", max_input_tokens=100)
+    counter = FakeCounter()
+    assert asyncio.run(registry.fit("pendek aja", counter)) == "pendek aja"
+    assert counter.calls == 0
+
+
+def test_fit_trims_the_middle_of_long_text():
+    registry = prompts.PromptRegistry(RecordingFactory(), "gemini-test", max_input_tokens=100)
+    counter = FakeCounter(tokens_per_char=0.5)
+    text = "HEADLINE " + "isi " * 500 + "BELI SEKARANG"
+
+    trimmed = asyncio.run(registry.fit(text, counter))
+
+    assert counter.calls == 1
+    assert trimmed.startswith("HEADLINE") and trimmed.endswith("BELI SEKARANG")
+    assert prompts.TRUNCATION_MARKER in trimmed
+    assert len(trimmed) * 0.5 <= 100
+
+
+def test_fit_falls_back_to_an_estimate_when_counting_fails():
+    registry = prompts.PromptRegistry(RecordingFactory(), "gemini-test", max_input_tokens=100)
+    text = "kata " * 1000
+    trimmed = asyncio.run(registry.fit(text, FakeCounter(error=RuntimeError("quota"))))
+    assert len(trimmed) < len(text)
+
+
+def test_truncate_middle_keeps_short_text():
+    assert prompts.truncate_middle("halo", 10) == "halo"
+
+
+def test_lazy_registry_loads_once_and_retries_after_failure():
+    factory = RecordingFactory()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        if len(loads) == 1:
+            raise ImportError("SDK belum ada")
+        return factory
+
+    registry = prompts.PromptRegistry(model_names="gemini-test", loader=loader)
+    assert not registry.loaded and not factory.created
+
+    async def scenario():
+        try:
+            await registry.load()
+        except ImportError:
+            pass
+        await asyncio.gather(registry.load(), registry.load())
+        await registry.load()
+
+    asyncio.run(scenario())
+    assert registry.loaded and len(loads) == 2
+    assert registry.get("pedas").model().model_name == "gemini-test"
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+from google.api_core import exceptions as google_exceptions
+
+from retry_policy import CircuitBreaker, CircuitOpenError, RetryPolicy, is_retryable
+
+
+def test_is_retryable_classification():
+    assert is_retryable(google_exceptions.TooManyRequests("429"))
+    assert is_retryable(google_exceptions.ServiceUnavailable("503"))
+    assert is_retryable(asyncio.TimeoutError())
+    assert not is_retryable(google_exceptions.InvalidArgument("400"))
+    assert not is_retryable(ValueError("blocked"))
+
+
+def test_retries_transient_errors_then_succeeds():
+    calls = []
+
+    async def func(timeout):
+        calls.append(timeout)
+        if len(calls) < 3:
+            raise google_exceptions.ServiceUnavailable("503")
+        return "roast"
+
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001)
+    assert asyncio.run(policy.run(func)) == "roast"
+    assert len(calls) == 3
+
+
+def test_permanent_error_is_not_retried():
+    calls = []
+
+    async def func(timeout):
+        calls.append(timeout)
+        raise ValueError("blocked")
+
+    with pytest.raises(ValueError):
+        asyncio.run(RetryPolicy(max_attempts=3, base_delay=0.001).run(func))
+    assert len(calls) == 1
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    policy = RetryPolicy(base_delay=1, max_delay=4)
+    for attempt in range(1, 6):
+        expected = min(4, 2 ** (attempt - 1))
+        assert expected / 2 <= policy.backoff_delay(attempt) <= expected
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0.01)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    asyncio.run(asyncio.sleep(0.02))
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # Cuma satu percobaan pas half-open
+    breaker.record_success()
+    assert breaker.state == "closed"
+
+
+def test_open_breaker_short_circuits():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+    breaker.record_failure()
+
+    async def func(timeout):
+        raise AssertionError("should not be called")
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(RetryPolicy(breaker=breaker).run(func))
+
+
+def test_cancelled_half_open_trial_releases_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.01)
+    policy = RetryPolicy(max_attempts=1, breaker=breaker)
+
+    async def hang(timeout):
+        await asyncio.sleep(10)
+
+    async def ok(timeout):
+        return "roast"
+
+    async def scenario():
+        breaker.record_failure()
+        await asyncio.sleep(0.02)
+        task = asyncio.create_task(policy.run(hang))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await policy.run(ok)
+
+    assert asyncio.run(scenario()) == "roast"
+    assert breaker.state == "closed"
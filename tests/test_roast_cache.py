@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+from roast_cache import RoastCache, image_key, normalize_text, text_key
+
+
+def test_text_key_normalizes_case_and_whitespace():
+    assert normalize_text("  Beli\n  SEKARANG ") == "beli sekarang"
+    assert text_key("pedas", "Beli  Sekarang") == text_key("pedas", " beli sekarang\n")
+    assert text_key("pedas", "beli") != text_key("solusi", "beli")
+    assert image_key("abc") == "image:abc"
+
+
+def test_hit_miss_counters():
+    cache = RoastCache(refresh_probability=0)
+    assert cache.get("k") is None
+    cache.put("k", "roast")
+    assert cache.get("k") == "roast"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    assert cache.hit_ratio == 0.5
+
+
+def test_ttl_expiry():
+    cache = RoastCache(ttl=0.01, refresh_probability=0)
+    cache.put("k", "roast")
+    time.sleep(0.02)
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0 and cache.total_bytes == 0
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = RoastCache(max_entries=2, refresh_probability=0)
+    cache.put("a", "1")
+    cache.put("b", "2")
+    cache.get("a")  # "b" jadi yang paling lama nggak dipake
+    cache.put("c", "3")
+    assert cache.get("b") is None and cache.get("a") == "1"
+
+    cache = RoastCache(max_bytes=10, refresh_probability=0)
+    cache.put("a", "12345")
+    cache.put("b", "123456")
+    assert cache.get("a") is None and cache.get("b") == "123456"
+    assert cache.total_bytes == 6
+
+
+def test_oversized_roast_is_not_cached():
+    cache = RoastCache(max_bytes=4, refresh_probability=0)
+    cache.put("k", "way too long", expires_at=time.time() + 60)
+    assert cache.get("k") is None and cache.total_bytes == 0
+
+
+def test_variants_rotate_and_are_capped():
+    cache = RoastCache(max_variants=2, refresh_probability=0)
+    for roast in ("v1", "v2", "v3"):
+        cache.put("k", roast)
+    served = {cache.get("k") for _ in range(4)}
+    assert served == {"v2", "v3"}
+    first = cache.get("k")
+    assert cache.get("k") != first  # Nggak ngulang roast yang barusan
+
+
+def test_disk_backing_survives_restart(tmp_path):
+    db_file = str(tmp_path / "cache.db")
+    cache = RoastCache(db_file=db_file, refresh_probability=0)
+    cache.start()
+    cache.put("k", "roast")
+    cache.close()
+
+    restarted = RoastCache(db_file=db_file, refresh_probability=0)
+    restarted.start()
+    assert restarted.get("k") == "roast"
+    restarted.close()
+
+
+def test_lookup_reads_through_shared_backing(tmp_path):
+    db_file = str(tmp_path / "cache.db")
+    writer = RoastCache(db_file=db_file, refresh_probability=0)
+    reader = RoastCache(db_file=db_file, refresh_probability=0)
+    writer.start()
+    reader.start()
+    writer.put("k", "roast dari worker lain")
+    writer.close()
+
+    assert asyncio.run(reader.lookup("k")) == "roast dari worker lain"
+    reader.close()
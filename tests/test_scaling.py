@@ -0,0 +1,60 @@
+import asyncio
+
+import scaling
+from scaling import routing_key
+from update_processor import KeyedLocks
+
+
+def test_routing_key_uses_chat_id():
+    data = {"update_id": 1, "message": {"chat": {"id": -100}, "text": "halo"}}
+    assert routing_key(data) == -100
+
+
+def test_routing_key_callback_query_and_fallbacks():
+    assert routing_key({"update_id": 2, "callback_query": {"message": {"chat": {"id": 7}}, "from": {"id": 9}}}) == 7
+    assert routing_key({"update_id": 3, "inline_query": {"from": {"id": 9}}}) == 9
+    assert routing_key({"update_id": 4}) == 4
+
+
+def test_keyed_locks_keep_fifo_order_per_key():
+    order = []
+
+    async def job(locks, key, name, delay):
+        async with locks.hold(key):
+            await asyncio.sleep(delay)
+            order.append(name)
+
+    async def run():
+        locks = KeyedLocks()
+        await asyncio.gather(
+            job(locks, 1, "a1", 0.03),
+            job(locks, 1, "a2", 0.0),
+            job(locks, 2, "b1", 0.01),
+        )
+        return locks
+
+    locks = asyncio.run(run())
+    assert order.index("a1") < order.index("a2")
+    assert order[0] == "b1"  # Chat lain nggak ikut nunggu
+    assert len(locks) == 0
+
+
+def test_ensure_webhook_skips_unchanged_settings(tmp_path, monkeypatch):
+    calls = []
+
+    async def fake_set_webhook(url, allowed_updates, secret_token=None):
+        calls.append(url)
+        return True
+
+    monkeypatch.setattr(scaling, "_set_webhook", fake_set_webhook)
+    stamp = str(tmp_path / "webhook.stamp")
+
+    async def scenario():
+        results = [await scaling.ensure_webhook("https://bot/a", ["message"], setup="auto", stamp_file=stamp) for _ in range(2)]
+        results.append(await scaling.ensure_webhook("https://bot/b", ["message"], setup="auto", stamp_file=stamp))
+        results.append(await scaling.ensure_webhook("https://bot/b", ["message"], setup="never", stamp_file=stamp))
+        results.append(await scaling.ensure_webhook("https://bot/b", ["message"], setup="always", stamp_file=stamp))
+        return results
+
+    assert asyncio.run(scenario()) == [True, False, True, False, True]
+    assert calls == ["https://bot/a", "https://bot/b", "https://bot/b"]
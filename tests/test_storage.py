@@ -0,0 +1,192 @@
+import asyncio
+import sqlite3
+import time
+import types
+
+import storage as storage_module
+from storage import Storage
+
+
+def _user(user_id, username="tester"):
+    return types.SimpleNamespace(id=user_id, username=username)
+
+
+def _counts(db_file, user_id):
+    conn = sqlite3.connect(db_file)
+    try:
+        return conn.execute(
+            "SELECT usage_count, image_usage_count FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+    finally:
+        conn.close()
+
+
+def test_increments_are_batched_and_visible_before_flush(tmp_path):
+    db_file = str(tmp_path / "users.db")
+
+    async def scenario():
+        storage = Storage(db_file, flush_interval_ms=60_000, flush_max_events=1000)
+        await storage.start()
+        assert await storage.add_user_to_database(_user(1))
+        assert not await storage.add_user_to_database(_user(1))
+
+        storage.increment_usage_count(1)
+        storage.increment_usage_count(1)
+        storage.increment_image_usage_count(1)
+        data = await storage.get_user_account_data(1)
+        assert (data["usage_count"], data["image_usage_count"]) == (2, 1)
+        assert _counts(db_file, 1) == (0, 0)  # Belum di-flush
+
+        await storage.flush()
+        assert _counts(db_file, 1) == (2, 1)
+        await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_flush_triggered_by_event_count(tmp_path):
+    db_file = str(tmp_path / "users.db")
+
+    async def scenario():
+        storage = Storage(db_file, flush_interval_ms=60_000, flush_max_events=3)
+        await storage.start()
+        await storage.add_user_to_database(_user(1))
+        for _ in range(3):
+            storage.increment_usage_count(1)
+        await asyncio.sleep(0.1)
+        assert _counts(db_file, 1) == (3, 0)
+        await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_close_keeps_batch_queued_behind_slow_query(tmp_path):
+    db_file = str(tmp_path / "users.db")
+
+    async def scenario():
+        storage = Storage(db_file, flush_interval_ms=10, flush_max_events=1000)
+        await storage.start()
+        await storage.add_user_to_database(_user(1))
+        storage.increment_usage_count(1)
+
+        # Query lambat nahan satu-satunya thread executor pas periodic flush lagi nunggu giliran
+        slow = asyncio.ensure_future(storage._run(time.sleep, 0.2))
+        await asyncio.sleep(0.05)
+        await storage.close()
+        await slow
+
+    asyncio.run(scenario())
+    assert _counts(db_file, 1) == (1, 0)
+
+
+def test_chat_mode_round_trip(tmp_path):
+    db_file = str(tmp_path / "users.db")
+
+    async def scenario():
+        storage = Storage(db_file)
+        await storage.start()
+        assert await storage.get_chat_mode(5) is None
+        assert await storage.set_chat_mode(5, "solusi")
+        assert await storage.set_chat_mode(-100, "pedas")
+        assert await storage.get_chat_mode(5) == "solusi"
+        assert await storage.get_chat_mode(-100) == "pedas"
+        await storage.close()
+
+    asyncio.run(scenario())
+
+
+def test_schema_migrates_legacy_database_once(tmp_path):
+    db_file = str(tmp_path / "users.db")
+    conn = sqlite3.connect(db_file)  # Database versi lama: belum ada user_version & kolom gambar
+    conn.execute("CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, join_time TEXT, usage_count INTEGER DEFAULT 0)")
+    conn.execute("INSERT INTO users (user_id, username, usage_count) VALUES (1, 'lama', 5)")
+    conn.commit()
+    conn.close()
+
+    async def scenario():
+        for _ in range(2):  # Start kedua cuma baca user_version
+            storage = Storage(db_file)
+            await storage.start()
+            data = await storage.get_user_account_data(1)
+            await storage.close()
+        return data
+
+    data = asyncio.run(scenario())
+    assert (data["usage_count"], data["image_usage_count"]) == (5, 0)
+    conn = sqlite3.connect(db_file)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == storage_module.SCHEMA_VERSION
+    finally:
+        conn.close()
+
+
+def test_account_stats_are_cached_and_follow_increments(tmp_path):
+    db_file = str(tmp_path / "users.db")
+
+    async def scenario():
+        storage = Storage(db_file, flush_interval_ms=60_000, flush_max_events=1000)
+        await storage.start()
+        await storage.add_user_to_database(_user(1))
+        storage.increment_usage_count(1)
+        first = await storage.get_user_account_data(1)
+        await storage.flush()
+        storage.increment_usage_count(1)
+        storage.increment_image_usage_count(1)
+        storage._conn.execute("UPDATE users SET username = 'diubah-langsung'")  # Cache nggak baca database lagi
+        second = await storage.get_user_account_data(1)
+        await storage.close()
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert (first["usage_count"], first["image_usage_count"]) == (1, 0)
+    assert second == {"username": "tester", "usage_count": 2, "image_usage_count": 1}
+
+
+def test_daily_rollups_and_leaderboard(tmp_path):
+    db_file = str(tmp_path / "users.db")
+
+    async def scenario():
+        storage = Storage(db_file, flush_interval_ms=60_000, flush_max_events=1000)
+        await storage.start()
+        for user_id, roasts in ((1, 3), (2, 5), (3, 1)):
+            await storage.add_user_to_database(_user(user_id, f"user{user_id}"))
+            for _ in range(roasts):
+                storage.increment_usage_count(user_id)
+        storage.increment_image_usage_count(2)
+        await storage.flush()
+        storage.increment_usage_count(1)  # User yang sama di hari yang sama nggak nambah active_users
+        await storage.flush()
+        summary = await storage.get_usage_summary(7)
+        top = await storage.get_leaderboard(2)
+        await storage.close()
+        return summary, top
+
+    summary, top = asyncio.run(scenario())
+    assert summary["total_users"] == 3
+    assert len(summary["days"]) == 1
+    day = summary["days"][0]
+    assert (day["roasts"], day["image_roasts"], day["active_users"], day["new_users"]) == (10, 1, 3, 3)
+    assert [(user_id, usage) for user_id, _, usage in top] == [(2, 5), (1, 4)]
+
+
+def test_stats_reads_do_not_wait_for_an_open_write_transaction(tmp_path):
+    db_file = str(tmp_path / "users.db")
+
+    async def scenario():
+        storage = Storage(db_file)
+        await storage.start()
+        await storage.add_user_to_database(_user(1))
+        writer = sqlite3.connect(db_file)
+        writer.execute("BEGIN IMMEDIATE")  # Pegang write lock
+        writer.execute("UPDATE users SET usage_count = 99")
+        started = time.monotonic()
+        top = await storage.get_leaderboard(5)
+        elapsed = time.monotonic() - started
+        writer.rollback()
+        writer.close()
+        await storage.close()
+        return top, elapsed
+
+    top, elapsed = asyncio.run(scenario())
+    assert top == [(1, "tester", 0)]  # Snapshot yang udah commit
+    assert elapsed < 1
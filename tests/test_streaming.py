@@ -0,0 +1,94 @@
+import asyncio
+import datetime
+import itertools
+import types
+
+import telegram
+
+from streaming import StreamingReply, split_point
+
+
+class FakeBot:
+    def __init__(self, retry_after_once=False):
+        self.messages = {1: ""}
+        self.edits = 0
+        self._ids = itertools.count(2)
+        self._retry_after_once = retry_after_once
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        if self._retry_after_once:
+            self._retry_after_once = False
+            raise telegram.error.RetryAfter(datetime.timedelta(seconds=0.01))
+        self.edits += 1
+        self.messages[message_id] = text
+
+    async def send_message(self, chat_id, text):
+        message_id = next(self._ids)
+        self.messages[message_id] = text
+        return types.SimpleNamespace(message_id=message_id)
+
+    async def delete_message(self, chat_id, message_id):
+        del self.messages[message_id]
+
+
+def test_split_point_prefers_newline_then_space():
+    assert split_point("short", 10) == 5
+    assert split_point("aaaaaaa\nbb cc dd", 12) == 8
+    assert split_point("aaaa bbbb cccc", 12) == 10
+    assert split_point("x" * 20, 12) == 12
+
+
+def test_rollover_keeps_full_text_across_messages():
+    bot = FakeBot()
+    words = [f"kata{i} " for i in range(40)]
+
+    async def scenario():
+        reply = StreamingReply(bot, chat_id=1, message_id=1, edit_interval=0, max_length=50)
+        for word in words:
+            await reply.append(word)
+        await reply.finish()
+        return reply
+
+    reply = asyncio.run(scenario())
+    assert len(bot.messages) > 1
+    assert all(len(text) <= 50 for text in bot.messages.values())
+    assert "".join(bot.messages[k] for k in sorted(bot.messages)) == "".join(words)
+    assert reply.text == "".join(words)
+
+
+def test_edits_are_throttled():
+    bot = FakeBot()
+
+    async def scenario():
+        reply = StreamingReply(bot, chat_id=1, message_id=1, edit_interval=60)
+        for i in range(10):
+            await reply.append(f"{i} ")
+        await reply.finish()
+
+    asyncio.run(scenario())
+    assert bot.edits == 2  # Edit pertama + edit final
+    assert bot.messages[1] == "0 1 2 3 4 5 6 7 8 9 "
+
+
+def test_finish_waits_out_retry_after():
+    bot = FakeBot(retry_after_once=True)
+
+    async def scenario():
+        reply = StreamingReply(bot, chat_id=1, message_id=1, edit_interval=0)
+        await reply.append("halo")  # Kena flood limit, di-skip
+        await reply.finish()
+
+    asyncio.run(scenario())
+    assert bot.messages[1] == "halo"
+
+
+def test_discard_deletes_rolled_over_messages():
+    bot = FakeBot()
+
+    async def scenario():
+        reply = StreamingReply(bot, chat_id=1, message_id=1, edit_interval=0, max_length=10)
+        await reply.append("satu dua tiga empat lima enam")
+        await reply.discard()
+
+    asyncio.run(scenario())
+    assert list(bot.messages) == [1]
@@ -0,0 +1,209 @@
+"""Update processor that runs different chats concurrently but keeps each chat in order."""
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+
+from telegram.ext import BaseUpdateProcessor
+
+import metrics
+
+MAX_QUEUED_UPDATES = 100_000  # Batas update yang boleh nunggu (antri per chat), bukan yang jalan
+PRIORITY_TEXT = 0  # Teks & command duluan (murah, cepet)
+PRIORITY_IMAGE = 1  # Gambar belakangan (download + vision call, lebih berat)
+
+
+def chat_key(update):
+    """Returns the chat id an update belongs to (user id / None as a fallback)."""
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(update, "effective_user", None)
+    return user.id if user is not None else None
+
+
+def update_priority(update):
+    """Returns the slot priority of an update: lower runs first when slots are scarce."""
+    message = getattr(update, "effective_message", None)
+    if message is not None and (message.photo or message.document):
+        return PRIORITY_IMAGE
+    return PRIORITY_TEXT
+
+
+class KeyedLocks:
+    """FIFO locks per key (chat id) that are dropped as soon as nobody uses them."""
+
+    def __init__(self):
+        self._locks = {}  # key -> [Lock, jumlah yang lagi pake/nunggu]
+
+    def __len__(self):
+        return len(self._locks)
+
+    @contextlib.asynccontextmanager
+    async def hold(self, key):
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:  # asyncio.Lock itu FIFO, jadi urutan per key kejaga
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[key]  # Udah nggak ada kerjaan, buang lock-nya
+
+
+class PrioritySlots:
+    """Semaphore whose waiters are served by priority (lower first), FIFO within a priority."""
+
+    def __init__(self, value):
+        self._value = value
+        self._waiters = []  # heap: (priority, urutan datang, future)
+        self._order = itertools.count()
+
+    async def acquire(self, priority=0):
+        if self._value > 0:  # Slot kosong berarti nggak ada yang nunggu (release selalu ngoper ke yang nunggu dulu)
+            self._value -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._order), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # Udah dapet slot tapi keburu di-cancel: oper ke yang nunggu berikutnya
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._value += 1
+
+
+class _SlotLease:
+    """The running slot of one update; can be handed back and re-taken while the update waits."""
+
+    __slots__ = ("slots", "priority", "held")
+
+    def __init__(self, slots, priority):
+        self.slots = slots
+        self.priority = priority
+        self.held = False
+
+    async def acquire(self):
+        await self.slots.acquire(self.priority)
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self.slots.release()
+
+
+_current_slot = contextvars.ContextVar("current_slot", default=None)
+
+
+@contextlib.asynccontextmanager
+async def slot_released():
+    """Gives the current update's running slot back for the duration of the block.
+
+    Handlers wrap long waits that do no work (e.g. queueing for Gemini) in
+    this, so waiting updates don't starve other chats of running slots. Does
+    nothing outside ``ChatOrderedUpdateProcessor``.
+    """
+    lease = _current_slot.get()
+    if lease is None:
+        yield
+        return
+    lease.release()
+    try:
+        yield
+    finally:
+        await lease.acquire()
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes up to ``max_running`` updates at once, one at a time per chat.
+
+    Updates of the same chat wait on a per-chat FIFO lock *before* taking a
+    running slot, so a chat with a backlog never occupies more than one slot.
+    When slots are scarce, text updates get them before image updates. If a
+    ``jobs`` queue is given (``DurableUpdateQueue``), each update is marked
+    done there once it has been handled. With a ``batcher``
+    (``batching.UpdateBatcher``), album parts are collected while the first
+    one holds the chat lock and its handler runs once for all of them.
+    """
+
+    def __init__(self, max_running, jobs=None, batcher=None):
+        super().__init__(MAX_QUEUED_UPDATES)
+        self.max_running = max_running
+        self.jobs = jobs
+        self.batcher = batcher
+        self._running = PrioritySlots(max_running)
+        self._chat_locks = KeyedLocks()
+        self._accepting = True
+        self._active = set()  # Task update yang handler-nya lagi jalan
+
+    @property
+    def active_tasks(self):
+        """Tasks whose handler is running right now (what a graceful shutdown waits for)."""
+        return set(self._active)
+
+    def stop_accepting(self):
+        """Stops starting handlers: updates that haven't started are skipped and stay pending in ``jobs``."""
+        self._accepting = False
+
+    async def do_process_update(self, update, coroutine):
+        batch, is_leader = self.batcher.join(update) if self.batcher is not None else (None, False)
+        if batch is not None and not is_leader:
+            coroutine.close()  # Bagian album: di-roast sama handler leader-nya
+            await batch.done.wait()
+            handled = batch.completed
+        else:
+            handled = await self._run_in_chat_order(update, coroutine, batch)
+        if handled and self.jobs is not None:
+            await self.jobs.mark_done(update)
+
+    async def _run_in_chat_order(self, update, coroutine, batch):
+        key = chat_key(update)
+        lock = self._chat_locks.hold(key) if key is not None else contextlib.nullcontext()
+        try:
+            async with lock:
+                parts_token = None
+                if batch is not None:
+                    parts_token = self.batcher.running(await self.batcher.collect(batch))  # Ngumpulin tanpa makan slot
+                lease = _SlotLease(self._running, update_priority(update))
+                await lease.acquire()
+                if not self._accepting:  # Lagi shutdown: jangan mulai roast baru, update-nya diproses ulang pas start
+                    coroutine.close()
+                    lease.release()
+                    if parts_token is not None:
+                        self.batcher.reset(parts_token)
+                    return False
+                token = _current_slot.set(lease)  # Handler jalan di task yang sama, jadi bisa lihat slot-nya sendiri
+                task = asyncio.current_task()
+                self._active.add(task)
+                try:
+                    with metrics.trace_update(getattr(update, "update_id", None)):
+                        await coroutine
+                finally:
+                    self._active.discard(task)
+                    _current_slot.reset(token)
+                    lease.release()
+                    if parts_token is not None:
+                        self.batcher.reset(parts_token)
+            if batch is not None:
+                batch.completed = True
+            return True
+        finally:
+            if batch is not None:
+                self.batcher.finish(batch)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass